@@ -3,18 +3,18 @@
 from scripts.download_data import baixar_e_extrair_cnes
 from scripts.extract_transform import (
     transformar_dados,
+    gerar_historico_cnes,
     concatenar_parquets_por_tabela,
     tratar_e_deduplicar_tabelas,
     tratar_estabelecimentos,
     trata_dados_cidades,
+    converter_arquivos_datasus,
     trata_dados_mortalidade,
+    agregar_internacoes,
     trata_dados_complementares_ibge
 )
 from scripts.load_database import (
-    carregar_parquets_para_duckdb,
-    carregar_cidades_ibge_no_duckdb,
-    carregar_mortalidade_no_duckdb,
-    carregar_ibge_adicionais_no_duckdb,
+    carregar_banco,
     carregar_tabela_principal
 )
 
@@ -24,10 +24,16 @@ def main():
     # 1. Download dos dados brutos
     baixar_e_extrair_cnes()
 
+    # As etapas 2 a 5 só refazem as tabelas cujas entradas mudaram desde a última
+    # execução (impressões registradas no manifesto, ver scripts.manifesto)
+
     # 2. Transformação CSV -> Parquet
     transformar_dados()
 
-    # 3. Concatenar todos os Parquets de 2022
+    # 2.1 Histórico das tabelas mensais em intervalos de validade (SCD tipo 2)
+    gerar_historico_cnes()
+
+    # 3. Concatenar os Parquets mensais de cada ano do período
     concatenar_parquets_por_tabela()
 
     # 4. Tratar e deduplicar tabelas
@@ -39,26 +45,20 @@ def main():
     # 6. Tratar dados de cidades do IBGE
     trata_dados_cidades()
 
-    # 7. Tratar dados de mortalidade
+    # 7. Converter os .dbc do SIM/SIH em Parquet, tratar dados de mortalidade e agregar internações
+    converter_arquivos_datasus()
     trata_dados_mortalidade()
+    agregar_internacoes()
 
-    # 8. Carregar Parquets no banco de dados DuckDB
-    carregar_parquets_para_duckdb()
-
-    # 9. Carregar cidades do IBGE no banco de dados DuckDB
-    carregar_cidades_ibge_no_duckdb()
-
-    # 10. Carregar dados de mortalidade no banco de dados DuckDB
-    carregar_mortalidade_no_duckdb()
-
-    # 11. Trata e transforma dados adicionais do IBGE
+    # 8. Trata e transforma dados adicionais do IBGE
     trata_dados_complementares_ibge()
 
-    # 12. Carregar demais tabelas IBGE já tratadas no banco de dados DuckDB
-    carregar_ibge_adicionais_no_duckdb()
+    # 9. Carregar no DuckDB, em paralelo, as tabelas do CNES, do IBGE, de mortalidade e de internações
+    carregar_banco()
 
-    # 13. Carregar a tabela principal no banco de dados DuckDB
-    carregar_tabela_principal()
+    # 10. Carregar a tabela principal no banco de dados DuckDB, exportando também a
+    #     tabela_completa_pivot.parquet (tipos de unidade) lida pela clusterização
+    carregar_tabela_principal(com_tipos_unidade=True)
 
     print("\nPipeline completo finalizado com sucesso!\n")
 
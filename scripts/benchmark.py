@@ -0,0 +1,263 @@
+# scripts/benchmark.py
+
+"""
+Compara os dois motores da tabela final sobre os mesmos Parquets de entrada:
+- 'duckdb': as etapas SQL de `load_database.ETAPAS_PRINCIPAL`, num banco em memória
+  com views sobre os Parquets (o banco do pipeline não é alterado);
+- 'polars': o plano Lazy de `tabela_final.construir_tabela_final`.
+
+Cada execução roda em um processo próprio, que mede tempo de relógio, tempo de CPU,
+pico de memória (RSS) e bytes lidos (/proc/self/io, só no Linux). Ao final, as saídas
+são comparadas coluna a coluna (tipos e valores, com tolerâncias nas colunas numéricas)
+e o relatório vai para DIRS['BENCHMARK']/benchmark_<ano>.json.
+
+Uso:
+    python -m scripts.benchmark --ano 2022 --repeticoes 3
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import polars as pl
+from scripts.configs import (
+    DIRS, ANO, EXPORTACAO_ORDENACAO,
+    BENCHMARK_REPETICOES, BENCHMARK_RTOL, BENCHMARK_ATOL
+)
+from scripts.utils import configurar_logger, criar_pastas
+
+logger = configurar_logger()
+
+def construir_duckdb(ano, destino):
+    from scripts.load_database import (
+        conectar_duckdb, carregar_tabelas, atualizar_etapas, exportar_consulta,
+        consultas_cnes, consultas_cidades_ibge, consultas_mortalidade, consultas_ibge_adicionais
+    )
+    conn = conectar_duckdb(':memory:')
+    try:
+        carregar_tabelas({
+            **consultas_cnes(),
+            **consultas_cidades_ibge(),
+            **consultas_mortalidade(),
+            **consultas_ibge_adicionais(),
+        }, conn, modo='visao')
+        atualizar_etapas(conn, ano)
+        exportar_consulta(conn, "SELECT * FROM main.tabela_final", destino, formatos=['parquet'])
+    finally:
+        conn.close()
+
+def construir_polars(ano, destino):
+    from scripts.tabela_final import gerar_tabela_final
+    gerar_tabela_final(ano, f'{destino}.parquet')
+
+# {motor: (módulo importado antes de medir, função(ano, destino sem extensão))}
+MOTORES = {
+    'duckdb': ('scripts.load_database', construir_duckdb),
+    'polars': ('scripts.tabela_final', construir_polars),
+}
+
+def _ler_io():
+    """Contadores de leitura do processo (rchar e read_bytes); None fora do Linux."""
+    try:
+        with open('/proc/self/io') as f:
+            campos = dict(linha.split(': ') for linha in f.read().splitlines())
+        return {'rchar': int(campos['rchar']), 'read_bytes': int(campos['read_bytes'])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _pico_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+def medir_motor(motor, ano, destino) -> dict:
+    """
+    Executa um motor no processo atual e devolve as suas métricas. Os módulos do motor
+    são importados antes de começar a medir.
+    """
+    modulo, construir = MOTORES[motor]
+    importlib.import_module(modulo)
+
+    io_inicio = _ler_io()
+    cpu_inicio = time.process_time()
+    inicio = time.perf_counter()
+    construir(ano, destino)
+    segundos = time.perf_counter() - inicio
+    cpu_segundos = time.process_time() - cpu_inicio
+    io_fim = _ler_io()
+
+    return {
+        'motor': motor,
+        'segundos': segundos,
+        'cpu_segundos': cpu_segundos,
+        'pico_rss_mb': _pico_rss_mb(),
+        'bytes_lidos': io_fim['rchar'] - io_inicio['rchar'] if io_fim else None,
+        'bytes_lidos_disco': io_fim['read_bytes'] - io_inicio['read_bytes'] if io_fim else None,
+    }
+
+def executar_motor(motor, ano, destino) -> dict:
+    """
+    Executa um motor em um processo Python novo (`python -m scripts.benchmark --motor ...`),
+    para que o pico de memória e os bytes lidos sejam só dele.
+    """
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as arquivo:
+        processo = subprocess.run(
+            [sys.executable, '-m', 'scripts.benchmark', '--motor', motor, '--ano', str(ano),
+             '--destino', destino, '--metricas', arquivo.name],
+            capture_output=True, text=True
+        )
+        if processo.returncode != 0:
+            raise RuntimeError(f"Motor {motor} falhou:\n{processo.stderr[-2000:]}")
+        return json.load(arquivo)
+
+def comparar_saidas(saida_duckdb: pl.DataFrame, saida_polars: pl.DataFrame, chaves=EXPORTACAO_ORDENACAO,
+                    rtol=BENCHMARK_RTOL, atol=BENCHMARK_ATOL) -> pl.DataFrame:
+    """
+    Compara as duas saídas coluna a coluna. As linhas são alinhadas pelas `chaves` (linhas
+    com a mesma chave, pela ordem dos demais valores). Colunas numéricas são iguais quando
+    `|duckdb - polars| <= atol + rtol * |polars|`; as demais, quando o texto é igual. Nulos
+    só casam com nulos. Os valores são comparados mesmo com tipos diferentes, que ficam
+    registrados em `mesmo_tipo`.
+
+    Returns:
+        pl.DataFrame: coluna, tipo_duckdb, tipo_polars, mesmo_tipo, divergencias (linhas
+        diferentes; nas chaves, linhas presentes em só uma saída) e max_diferenca (numéricas).
+    """
+    comuns = [coluna for coluna in saida_duckdb.columns if coluna in saida_polars.columns]
+    ordem = [*chaves, *[coluna for coluna in comuns if coluna not in chaves]]
+
+    def alinhar(df, motor):
+        return (
+            df.select(comuns)
+              .sort(ordem, nulls_last=True)
+              .with_columns(pl.int_range(pl.len()).over(chaves).alias('_ordem'), pl.lit(True).alias(f'_{motor}'))
+        )
+
+    juntas = alinhar(saida_duckdb, 'duckdb').join(
+        alinhar(saida_polars, 'polars'), on=[*chaves, '_ordem'], how='full',
+        nulls_equal=True, coalesce=True, suffix='_polars'
+    )
+    so_uma = juntas.select((pl.col('_duckdb').is_null() | pl.col('_polars').is_null()).sum()).item()
+
+    resultado = []
+    for coluna in [*saida_duckdb.columns, *[c for c in saida_polars.columns if c not in saida_duckdb.columns]]:
+        linha = {
+            'coluna': coluna,
+            'tipo_duckdb': str(saida_duckdb.schema[coluna]) if coluna in saida_duckdb.columns else None,
+            'tipo_polars': str(saida_polars.schema[coluna]) if coluna in saida_polars.columns else None,
+            'mesmo_tipo': None,
+            'divergencias': None,
+            'max_diferenca': None,
+        }
+        if coluna in comuns:
+            linha['mesmo_tipo'] = saida_duckdb.schema[coluna] == saida_polars.schema[coluna]
+        if coluna in chaves:
+            linha['divergencias'] = so_uma
+        elif coluna in comuns:
+            a, b = pl.col(coluna), pl.col(f'{coluna}_polars')
+            if saida_duckdb.schema[coluna].is_numeric() and saida_polars.schema[coluna].is_numeric():
+                a, b = a.cast(pl.Float64), b.cast(pl.Float64)
+                iguais = a.eq_missing(b) | (a.is_nan() & b.is_nan()) | ((a - b).abs() <= atol + rtol * b.abs())
+                linha['max_diferenca'] = juntas.select((a - b).abs().max()).item()
+            else:
+                iguais = a.cast(pl.Utf8).eq_missing(b.cast(pl.Utf8))
+            linha['divergencias'] = juntas.select((~iguais.fill_null(False)).sum()).item()
+        resultado.append(linha)
+
+    return pl.DataFrame(resultado, schema={
+        'coluna': pl.Utf8, 'tipo_duckdb': pl.Utf8, 'tipo_polars': pl.Utf8, 'mesmo_tipo': pl.Boolean,
+        'divergencias': pl.Int64, 'max_diferenca': pl.Float64,
+    })
+
+def colunas_divergentes(diferencas: pl.DataFrame) -> pl.DataFrame:
+    """
+    Linhas de `comparar_saidas` que impedem a equivalência: colunas com valores
+    divergentes, com tipos diferentes ou presentes em só uma das saídas.
+    """
+    return diferencas.filter(
+        (pl.col('divergencias') > 0) | ~pl.col('mesmo_tipo').fill_null(False)
+    )
+
+def comparar_motores(ano=ANO, repeticoes=BENCHMARK_REPETICOES, rtol=BENCHMARK_RTOL, atol=BENCHMARK_ATOL,
+                     pasta=DIRS['BENCHMARK']) -> dict:
+    """
+    Executa os motores `repeticoes` vezes, alternando-os, compara as saídas da última
+    rodada e grava o relatório em `pasta`/benchmark_<ano>.json.
+
+    Returns:
+        dict: Relatório com as execuções, o resumo por motor (medianas de tempo e bytes
+        lidos, maior pico de memória) e as diferenças por coluna.
+    """
+    criar_pastas([pasta])
+    execucoes = []
+    with tempfile.TemporaryDirectory(dir=pasta) as temporaria:
+        for rodada in range(1, repeticoes + 1):
+            for motor in MOTORES:
+                metricas = executar_motor(motor, ano, os.path.join(temporaria, motor))
+                execucoes.append({'rodada': rodada, **metricas})
+                logger.info(
+                    f"Rodada {rodada}, {motor}: {metricas['segundos']:.2f}s, CPU {metricas['cpu_segundos']:.2f}s, "
+                    f"pico {metricas['pico_rss_mb'] or 0:.0f} MB"
+                )
+        saidas = {motor: pl.read_parquet(os.path.join(temporaria, f'{motor}.parquet')) for motor in MOTORES}
+
+    diferencas = comparar_saidas(saidas['duckdb'], saidas['polars'], rtol=rtol, atol=atol)
+    divergentes = colunas_divergentes(diferencas)
+    resumo = (
+        pl.DataFrame(execucoes)
+          .group_by('motor', maintain_order=True)
+          .agg(
+              pl.col('segundos', 'cpu_segundos', 'bytes_lidos', 'bytes_lidos_disco').median(),
+              pl.col('pico_rss_mb').max(),
+          )
+    )
+
+    logger.info(f"Resumo por motor:\n{resumo}")
+    if divergentes.is_empty():
+        logger.info(f"Saídas equivalentes: {len(diferencas)} colunas com os mesmos tipos e dentro das tolerâncias (rtol={rtol}, atol={atol}).")
+    else:
+        logger.warning(f"{len(divergentes)} coluna(s) divergente(s):\n{divergentes}")
+
+    relatorio = {
+        'ano': int(ano),
+        'repeticoes': repeticoes,
+        'rtol': rtol,
+        'atol': atol,
+        'linhas': {motor: saida.height for motor, saida in saidas.items()},
+        'execucoes': execucoes,
+        'resumo': resumo.to_dicts(),
+        'diferencas': diferencas.to_dicts(),
+        'equivalentes': divergentes.is_empty(),
+    }
+    caminho = os.path.join(pasta, f'benchmark_{int(ano)}.json')
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    logger.info(f"Relatório salvo em {caminho}")
+    return relatorio
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara DuckDB e Polars na construção da tabela final.")
+    parser.add_argument("--ano", default=ANO)
+    parser.add_argument("--repeticoes", type=int, default=BENCHMARK_REPETICOES)
+    parser.add_argument("--rtol", type=float, default=BENCHMARK_RTOL)
+    parser.add_argument("--atol", type=float, default=BENCHMARK_ATOL)
+    # Uso interno: execução de um único motor pelo processo filho
+    parser.add_argument("--motor", choices=list(MOTORES), help=argparse.SUPPRESS)
+    parser.add_argument("--destino", help=argparse.SUPPRESS)
+    parser.add_argument("--metricas", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.motor:
+        metricas = medir_motor(args.motor, args.ano, args.destino)
+        with open(args.metricas, 'w', encoding='utf-8') as f:
+            json.dump(metricas, f)
+    else:
+        comparar_motores(args.ano, args.repeticoes, args.rtol, args.atol)
@@ -4,7 +4,7 @@
 Pipeline de análise de clusters para o TCC (Disparidades na Oferta de Serviços de Saúde - BR)
 
 O script:
-1) Carrega a base consolidada (CSV) e complementos de internações (Parquet);
+1) Carrega a base consolidada (CSV ou Parquet) e complementos de internações (Parquet);
 2) Recria colunas derivadas e indicadores conforme você descreveu;
 3) Roda UMAP + HDBSCAN (2 etapas: geral + subclusterização do ruído) com os SEUS parâmetros;
 4) Gera embeddings finais de visualização (UMAP 2D) e salva scatter interativo (Plotly);
@@ -17,8 +17,8 @@ Requisitos: pandas, numpy, polars, scikit-learn, umap-learn, hdbscan, scipy, mat
 
 Uso:
 python analisar_clusters_tcc.py \
-  --csv tabela_completa_pivot_202506220918.csv \
-  --parquet_internacoes data/internacoes_final/sih_agregado.parquet \
+  --csv data/tabela_final/tabela_completa_pivot.parquet \
+  --parquet_internacoes data/interncaoes_final/sih_agregado.parquet \
   --n_neighbors 75 --min_cluster_size 75 --min_samples 29 \
   --n_clusters_alt 5 --var_threshold 0.05 --corr_threshold 0.90
 """
@@ -113,8 +113,8 @@ def hungarian_alignment(y_true: np.ndarray, y_pred: np.ndarray) -> tuple[np.ndar
 # ------------------------
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--csv", required=True, help="Caminho do CSV principal (tabela_completa_pivot_*.csv)")
-parser.add_argument("--parquet_internacoes", required=True, help="Parquet de internações agregado (sih_agregado.parquet)")
+parser.add_argument("--csv", required=True, help="Caminho da base principal: CSV ou o Parquet exportado por carregar_tabela_principal(com_tipos_unidade=True)")
+parser.add_argument("--parquet_internacoes", required=True, help="Parquet de internações agregado (DIRS['FINAL_INTERNACOES']/sih_agregado.parquet)")
 parser.add_argument("--outdir", default="outputs", help="Diretório de saída")
 
 # Parâmetros UMAP + HDBSCAN (principal)
@@ -134,8 +134,8 @@ ensure_dir(args.outdir)
 # 1) Carregamento e preparação (seguindo seu passo-a-passo)
 # ------------------------
 
-print("[1/9] Carregando CSV principal…")
-df = pd.read_csv(args.csv)
+print("[1/9] Carregando base principal…")
+df = pd.read_parquet(args.csv) if args.csv.endswith(".parquet") else pd.read_csv(args.csv)
 df = df.drop(columns=[c for c in ["NO_MUNICIPIO", "CO_MUNICIPIO"] if c in df.columns])
 df = df.fillna(0)
 
@@ -180,10 +180,21 @@ pl.enable_string_cache()
 base_pl = pl.from_pandas(df)
 
 internacoes = pl.read_parquet(args.parquet_internacoes).fill_null(0)
-if "codigo_municipio" not in base_pl.columns or "codigo_municipio" not in internacoes.columns:
-    raise ValueError("A coluna 'codigo_municipio' deve existir em ambas as bases para o join.")
-
-base_pl = base_pl.join(internacoes, on="codigo_municipio", how="left")
+if "cod_mun6" not in internacoes.columns:
+    raise ValueError("A coluna 'cod_mun6' deve existir na base de internações para o join.")
+
+# O join usa o código de 6 dígitos inteiro (cod_mun6), presente nas duas saídas do pipeline;
+# nas bases CSV antigas, sem essa coluna, ele é derivado de codigo_municipio
+if "cod_mun6" not in base_pl.columns:
+    if "codigo_municipio" not in base_pl.columns:
+        raise ValueError("A base principal deve ter 'cod_mun6' ou 'codigo_municipio' para o join.")
+    base_pl = base_pl.with_columns(pl.col("codigo_municipio").cast(pl.Utf8).str.slice(0, 6).alias("cod_mun6"))
+
+base_pl = base_pl.with_columns(pl.col("cod_mun6").cast(pl.Int32)).join(
+    internacoes.drop("codigo_municipio", strict=False).with_columns(pl.col("cod_mun6").cast(pl.Int32)),
+    on="cod_mun6",
+    how="left",
+)
 
 print("[3/9] Recriando taxa_ocupacao_anual e preenchendo nulos…")
 base_pl = base_pl.with_columns(
@@ -1,10 +1,13 @@
 # config.py
 
+import os
+
 # Diretórios
 DIRS = {
     'RAW_CNES': 'data/raw',
     'PARQUET_CNES': 'data/parquet',
     'CONCAT_CNES': 'data/cnes_concatenados',
+    'HISTORICO_CNES': 'data/cnes_historico',
     'FINAL_CNES': 'data/cnes_final',
     'FINAL_CIDADES': 'data/cidades_final',
     'FINAL_MORTALIDADE': 'data/mortalidade_final',
@@ -14,14 +17,126 @@ DIRS = {
     'BASE_MORTALIDADE': 'data/sim',
     'BASE_INTERNACOES': 'data/sih',
     'BASE_IBGE': 'data/ibge',
-    'TABELA_FINAL': 'data/tabela_final'
+    'CACHE_PLANILHAS': 'data/cache_planilhas',
+    'TABELA_FINAL': 'data/tabela_final',
+    'BENCHMARK': 'data/benchmark'
 }
 
-# Anos
-ANO = '2022'
+# Período processado: competências (ano/mês) de ANO_INICIO a ANO_FIM
+ANO_INICIO = 2022
+ANO_FIM = 2022
+MESES = list(range(1, 13))
+
+# Ano de referência da tabela final
+ANO = str(ANO_FIM)
+
+# Conversão CSV → Parquet em paralelo: número de processos (None = núcleos da máquina)
+# e tabelas grandes, das quais no máximo uma é convertida por vez
+CONVERSAO_WORKERS = None
+TABELAS_GRANDES = ['tbcargahorariasus', 'rlestabcomplementar']
+
+# Leitura das planilhas do IBGE em paralelo: número de processos (None = núcleos da máquina).
+# Cada planilha lida fica em cache em DIRS['CACHE_PLANILHAS'] até o arquivo mudar
+PLANILHAS_WORKERS = None
+
+# Tabelas mensais guardadas também como histórico de intervalos de validade (SCD tipo 2)
+TABELAS_HISTORICO = ['tbEstabelecimento', 'rlEstabComplementar', 'tbAtividadeProfissional', 'tbCargaHorariaSus']
+
+# Concatenação anual sem cópia: os Parquets mensais entram em DIRS['CONCAT_CNES'] como
+# hard links (partições mes=MM) em vez de serem reescritos em um único arquivo por ano
+CONCAT_SEM_COPIA = False
+
+# Dicionário dos campos codificados do SIM (código → rótulo de cada coluna)
+DICIONARIO_SIM = os.path.join(os.path.dirname(__file__), 'dicionario_sim.json')
+
+# Etapa de mortalidade: colunas lidas do SIM (as demais nem são carregadas) e dimensões
+# decodificadas dos agregados de óbitos por estabelecimento e por município
+COLUNAS_MORTALIDADE = [
+    'CODESTAB', 'CODMUNOCOR', 'CODMUNRES', 'DTOBITO', 'CAUSABAS', 'IDADE',
+    'SEXO', 'RACACOR', 'ESC2010', 'LOCOCOR', 'CIRCOBITO'
+]
+DIMENSOES_MORTALIDADE = ['SEXO', 'LOCOCOR', 'CIRCOBITO']
+
+# Agregados de óbitos gravados em DIRS['FINAL_MORTALIDADE']: dataset → coluna-chave
+AGREGADOS_MORTALIDADE = {
+    'obitos_estabelecimento': 'CODESTAB',
+    'obitos_municipio_ocorrencia': 'CODMUNOCOR',
+    'obitos_municipio_residencia': 'CODMUNRES',
+}
+
+# Agregado das internações do SIH (AIHs reduzidas, arquivos RDUFAAMM) por município,
+# gravado em DIRS['FINAL_INTERNACOES'] e usado pela clusterização
+SIH_AGREGADO = 'sih_agregado.parquet'
 
 # Caminho do banco de dados
 DB_PATH = 'data/database.duckdb'
 
+# Conexão DuckDB das cargas (None = padrão do DuckDB) e número de tabelas carregadas
+# ao mesmo tempo, cada uma por um cursor da mesma conexão
+DUCKDB_CONFIG = {
+    'threads': None,
+    'memory_limit': None,
+    'temp_directory': 'data/duckdb_tmp',
+    'preserve_insertion_order': False,
+}
+DUCKDB_CARGAS_PARALELAS = 4
+
+# Modo de cada tabela no banco: 'tabela' (copiada para o .duckdb) ou 'visao' (view sobre
+# os Parquets, sem cópia, lida a cada consulta). Tabelas fora de DUCKDB_MODOS seguem
+# DUCKDB_MODO_PADRAO; vale materializar as mais consultadas.
+DUCKDB_MODO_PADRAO = 'tabela'
+DUCKDB_MODOS = {
+    # Registros de óbito: a tabela principal usa só os agregados
+    'tb_mortalidade': 'visao',
+}
+
+# Chaves primárias declaradas no banco (upsert nas cargas incrementais) e índices ART
+# adicionais de cada tabela materializada
+CHAVES_DUCKDB = {
+    'tb_cidades_ibge_2022': ['codigo_municipio'],
+    'tbestabelecimento': ['ano', 'CO_CNES'],
+}
+INDICES_DUCKDB = {
+    'tb_cidades_ibge_2022': [['cod_mun6']],
+    'tbestabelecimento': [['CO_UNIDADE'], ['cod_mun6']],
+    'tbmunicipio': [['cod_mun6']],
+    'rlestabcomplementar': [['CO_UNIDADE']],
+    'tbcargahorariasus': [['CO_UNIDADE']],
+}
+
+# Carga incremental: só as partições (ano=AAAA) cujos arquivos mudaram desde a última
+# carga são regravadas no banco; com False, as tabelas são recriadas por inteiro
+DUCKDB_CARGA_INCREMENTAL = True
+
+# Exportação da tabela final direto do DuckDB (sem pandas): formatos gravados
+# ('parquet', 'arrow' para Arrow IPC, 'csv'), compressão do Parquet e do IPC
+# (no IPC só 'zstd' e 'lz4'), linhas por row group/lote e ordenação das linhas
+EXPORTACAO_FORMATOS = ['parquet']
+EXPORTACAO_COMPRESSAO = 'zstd'
+EXPORTACAO_LINHAS_GRUPO = 122_880
+EXPORTACAO_ORDENACAO = ['uf', 'codigo_municipio']
+
+# Comparação DuckDB × Polars (scripts/benchmark.py): execuções por motor e tolerâncias
+# relativa e absoluta das colunas numéricas
+BENCHMARK_REPETICOES = 3
+BENCHMARK_RTOL = 1e-9
+BENCHMARK_ATOL = 1e-9
+
+# Manifesto dos arquivos baixados e tabelas extraídas
+MANIFESTO_PATH = 'data/manifesto.json'
+
 # Caminho dos arquivos de log
 LOG_FILE = 'logs/application.log'
+
+# FTP do DataSUS
+FTP_HOST = 'ftp.datasus.gov.br'
+FTP_PORTA = 21
+FTP_DIR_CNES = 'cnes'
+
+# Downloads paralelos: conexões simultâneas, tentativas por arquivo e espera base (s)
+FTP_MAX_CONEXOES = 4
+FTP_TENTATIVAS = 5
+FTP_BACKOFF = 2.0
+
+# Converte as tabelas do zip direto para Parquet, sem gravar os CSVs extraídos
+EXTRAIR_DIRETO_PARQUET = True
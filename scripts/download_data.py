@@ -1,9 +1,31 @@
 # scripts/download_data.py
 
-from ftplib import FTP
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ftplib import FTP, all_errors, error_perm
+import time
 import zipfile
 import os
-from scripts.utils import criar_pastas, configurar_logger
+from scripts.configs import (
+    DIRS, ANO_INICIO, ANO_FIM, MESES, FTP_HOST, FTP_PORTA, FTP_DIR_CNES,
+    FTP_MAX_CONEXOES, FTP_TENTATIVAS, FTP_BACKOFF,
+    EXTRAIR_DIRETO_PARQUET
+)
+from scripts.manifesto import (
+    carregar_manifesto,
+    salvar_manifesto,
+    listar_arquivos_remotos,
+    arquivo_alterado,
+    registrar_arquivo,
+    registrar_tabela
+)
+from scripts.utils import (
+    criar_pastas,
+    configurar_logger,
+    converter_csv_cnes_para_parquet,
+    listar_competencias,
+    separar_tabela_competencia,
+    caminho_particao
+)
 
 logger = configurar_logger()
 
@@ -12,38 +34,206 @@ RAW_DIR = 'data/raw'
 criar_pastas([RAW_DIR])
 
 TABELAS_INTERESSE = [
-    'tbEstabelecimento', 'rlEstabComplementar', 'tbAtividade', 
-    'tbAtividadeProfissional', 'tbMunicipio', 'tbEstado', 
+    'tbEstabelecimento', 'rlEstabComplementar', 'tbAtividade',
+    'tbAtividadeProfissional', 'tbMunicipio', 'tbEstado',
     'tbTipoUnidade', 'tbTipoEstabelecimento', 'tbAtributo',
     'tbCargaHorariaSus'
 ]
 
-def baixar_e_extrair_cnes(ano='2022'):
-    ftp = FTP('ftp.datasus.gov.br')
+def conectar_ftp(host=FTP_HOST, porta=FTP_PORTA, diretorio=FTP_DIR_CNES):
+    """
+    Abre uma conexão anônima com o FTP e entra no diretório informado.
+    """
+    ftp = FTP()
+    ftp.connect(host, porta, timeout=60)
     ftp.login()
-    ftp.cwd('cnes')
+    ftp.cwd(diretorio)
+    return ftp
 
-    for mes in range(1, 13):
-        mes_str = f'{mes:02d}'
-        arquivo = f'BASE_DE_DADOS_CNES_{ano}{mes_str}.zip'
-        caminho_local = os.path.join(RAW_DIR, arquivo)
-        logger.info(f"Baixando {arquivo}...")
+def baixar_arquivo_ftp(arquivo, caminho_local, host=FTP_HOST, porta=FTP_PORTA,
+                       diretorio=FTP_DIR_CNES, tentativas=FTP_TENTATIVAS, backoff=FTP_BACKOFF):
+    """
+    Baixa um arquivo do FTP usando uma conexão própria.
 
-        with open(caminho_local, 'wb') as f:
-            ftp.retrbinary(f'RETR {arquivo}', f.write)
+    O conteúdo é gravado em `<caminho_local>.part`. Se a transferência cair, a próxima
+    tentativa retoma do ponto em que parou (comando REST), esperando `backoff * 2^n`
+    segundos entre tentativas. Ao final o arquivo parcial é renomeado para `caminho_local`.
 
-        with zipfile.ZipFile(caminho_local, 'r') as zip_ref:
-            for arquivo_zip in zip_ref.namelist():
-                if any(tab.lower() in arquivo_zip.lower() for tab in TABELAS_INTERESSE):
-                    zip_ref.extract(arquivo_zip, RAW_DIR)
-                    logger.info(f"Extraído: {arquivo_zip}")
+    Args:
+        arquivo (str): Nome do arquivo no diretório remoto.
+        caminho_local (str): Caminho final do arquivo baixado.
+        tentativas (int): Número máximo de tentativas.
+        backoff (float): Espera base, em segundos, entre tentativas.
 
-    # Remove o .zip após a extração
+    Returns:
+        str: Caminho do arquivo baixado.
+    """
+    caminho_parcial = f'{caminho_local}.part'
+
+    for tentativa in range(1, tentativas + 1):
+        ftp = None
+        try:
+            ftp = conectar_ftp(host, porta, diretorio)
+            ftp.voidcmd('TYPE I')
+            tamanho_remoto = ftp.size(arquivo)
+
+            offset = os.path.getsize(caminho_parcial) if os.path.exists(caminho_parcial) else 0
+            if tamanho_remoto is not None and offset > tamanho_remoto:
+                offset = 0
+
+            if offset:
+                logger.info(f"Retomando {arquivo} a partir de {offset} bytes...")
+
+            if tamanho_remoto is None or offset < tamanho_remoto:
+                with open(caminho_parcial, 'ab' if offset else 'wb') as f:
+                    ftp.retrbinary(f'RETR {arquivo}', f.write, rest=offset or None)
+
+            tamanho_local = os.path.getsize(caminho_parcial)
+            if tamanho_remoto is not None and tamanho_local != tamanho_remoto:
+                raise EOFError(f"{arquivo} incompleto: {tamanho_local} de {tamanho_remoto} bytes")
+
+            os.replace(caminho_parcial, caminho_local)
+            return caminho_local
+
+        except error_perm:
+            # Erros 5xx (ex.: arquivo inexistente) não melhoram com novas tentativas
+            raise
+        except all_errors as e:
+            if tentativa == tentativas:
+                raise
+            espera = backoff * 2 ** (tentativa - 1)
+            logger.warning(f"Falha ao baixar {arquivo} ({e}). Tentativa {tentativa}/{tentativas}, nova tentativa em {espera:.0f}s.")
+            time.sleep(espera)
+        finally:
+            if ftp is not None:
+                ftp.close()
+
+def baixar_arquivos_ftp(arquivos, destino=RAW_DIR, max_conexoes=FTP_MAX_CONEXOES, **kwargs):
+    """
+    Baixa vários arquivos do FTP em paralelo, com no máximo `max_conexoes` conexões simultâneas.
+
+    Gera tuplas `(arquivo, caminho_local, erro)` à medida que cada download termina;
+    `erro` é None quando o download foi concluído.
+    """
+    with ThreadPoolExecutor(max_workers=max_conexoes) as executor:
+        futuros = {
+            executor.submit(baixar_arquivo_ftp, arquivo, os.path.join(destino, arquivo), **kwargs): arquivo
+            for arquivo in arquivos
+        }
+        for futuro in as_completed(futuros):
+            arquivo = futuros[futuro]
+            caminho_local = os.path.join(destino, arquivo)
+            try:
+                futuro.result()
+                yield arquivo, caminho_local, None
+            except Exception as e:
+                yield arquivo, caminho_local, e
+
+def extrair_tabelas_interesse(caminho_zip, destino=RAW_DIR):
+    """
+    Extrai do zip apenas os arquivos das tabelas listadas em TABELAS_INTERESSE.
+
+    Returns:
+        dict: {nome do arquivo sem extensão (ex.: 'tbestado202212'): caminho extraído}
+    """
+    extraidos = {}
+    with zipfile.ZipFile(caminho_zip, 'r') as zip_ref:
+        for arquivo_zip in zip_ref.namelist():
+            if any(tab.lower() in arquivo_zip.lower() for tab in TABELAS_INTERESSE):
+                nome_base = os.path.splitext(os.path.basename(arquivo_zip))[0].lower()
+                extraidos[nome_base] = zip_ref.extract(arquivo_zip, destino)
+                logger.info(f"Extraído: {arquivo_zip}")
+    return extraidos
+
+def extrair_tabelas_para_parquet(caminho_zip, destino=DIRS['PARQUET_CNES']):
+    """
+    Converte as tabelas de interesse do zip direto para Parquet, sem extrair os CSVs.
+
+    Cada membro é lido como stream, decodificado de latin1 e processado em blocos,
+    recebendo as mesmas colunas e correções aplicadas por `transformar_dados`, e
+    gravado na partição `tabela/ano=AAAA/mes=MM` de `destino`.
+
+    Returns:
+        dict: {nome do arquivo sem extensão (ex.: 'tbestado202212'): caminho do Parquet}
+    """
+    convertidos = {}
+    with zipfile.ZipFile(caminho_zip, 'r') as zip_ref:
+        for arquivo_zip in zip_ref.namelist():
+            if not any(tab.lower() in arquivo_zip.lower() for tab in TABELAS_INTERESSE):
+                continue
+
+            nome_arquivo = os.path.basename(arquivo_zip)
+            nome_base = nome_arquivo.replace('.csv', '').lower()
+            tabela, ano, mes = separar_tabela_competencia(nome_arquivo)
+
+            caminho_parquet = caminho_particao(destino, tabela, ano, mes)
+            with zip_ref.open(arquivo_zip) as fonte:
+                converter_csv_cnes_para_parquet(fonte, nome_arquivo, caminho_parquet)
+
+            convertidos[nome_base] = caminho_parquet
+            logger.info(f"Convertido: {arquivo_zip} → {caminho_parquet}")
+    return convertidos
+
+def baixar_e_extrair_cnes(ano_inicio=ANO_INICIO, ano_fim=ANO_FIM, meses=MESES, max_conexoes=FTP_MAX_CONEXOES,
+                          host=FTP_HOST, porta=FTP_PORTA, direto_para_parquet=EXTRAIR_DIRETO_PARQUET):
+    """
+    Baixa os arquivos mensais do CNES do período configurado em paralelo e extrai as
+    tabelas de interesse de cada zip assim que o seu download termina.
+
+    Só são baixadas as competências já publicadas no FTP cujo tamanho ou data de
+    modificação difere do registrado no manifesto (ver `scripts.manifesto`). Os hashes
+    de cada zip e de cada tabela extraída são gravados no manifesto; com eles,
+    `transformar_dados` só reconverte os CSVs cujo conteúdo mudou.
+
+    Com `direto_para_parquet`, as tabelas são gravadas em DIRS['PARQUET_CNES'] sem
+    passar por CSV em disco, e `transformar_dados` não encontra nada a converter.
+    """
+    if direto_para_parquet:
+        criar_pastas([DIRS['PARQUET_CNES']])
+
+    ftp = conectar_ftp(host, porta)
+    remotos = listar_arquivos_remotos(ftp, 'BASE_DE_DADOS_CNES_??????.zip')
+    ftp.quit()
+
+    periodo = {f'BASE_DE_DADOS_CNES_{ano}{mes:02d}.zip' for ano, mes in listar_competencias(ano_inicio, ano_fim, meses)}
+    manifesto = carregar_manifesto()
+    publicados = sorted(periodo & set(remotos))
+    arquivos = [a for a in publicados if arquivo_alterado(manifesto, a, remotos[a])]
+
+    logger.info(f"{len(publicados)} de {len(periodo)} competência(s) de {ano_inicio} a {ano_fim} publicadas; {len(publicados) - len(arquivos)} sem alterações.")
+    if not arquivos:
+        logger.info("Nenhum arquivo novo para baixar.")
+        return
+
+    logger.info(f"Baixando {len(arquivos)} arquivos com até {max_conexoes} conexões simultâneas...")
+
+    falhas = []
+    for arquivo, caminho_local, erro in baixar_arquivos_ftp(arquivos, RAW_DIR, max_conexoes, host=host, porta=porta):
+        if erro is not None:
+            logger.error(f"Não foi possível baixar {arquivo}: {erro}")
+            falhas.append(arquivo)
+            continue
+
+        logger.info(f"{arquivo} baixado. Extraindo tabelas de interesse...")
+        if direto_para_parquet:
+            extraidos = extrair_tabelas_para_parquet(caminho_local)
+        else:
+            extraidos = extrair_tabelas_interesse(caminho_local)
+
+        registrar_arquivo(manifesto, arquivo, remotos[arquivo], caminho_local)
+        for nome_tabela, caminho in extraidos.items():
+            if registrar_tabela(manifesto, nome_tabela, caminho, arquivo):
+                logger.info(f"Tabela {nome_tabela} alterada.")
+        salvar_manifesto(manifesto)
+
+        # Remove o .zip após a extração
         os.remove(caminho_local)
         logger.info(f"Arquivo {arquivo} removido após extração.")
 
-    ftp.quit()
+    if falhas:
+        raise RuntimeError(f"Falha no download de {len(falhas)} arquivo(s): {', '.join(sorted(falhas))}")
+
     logger.info("Download e extração finalizados.")
 
 if __name__ == "__main__":
-    baixar_e_extrair_cnes()
\ No newline at end of file
+    baixar_e_extrair_cnes()
@@ -0,0 +1,154 @@
+# scripts/esquemas.py
+
+import polars as pl
+
+SIM_NAO = pl.Enum(['S', 'N'])
+
+SIGLAS_UF = pl.Enum([
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO',
+    'MA', 'MG', 'MS', 'MT', 'PA', 'PB', 'PE', 'PI', 'PR',
+    'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO'
+])
+
+# Tipos declarados das colunas de cada tabela de TABELAS_INTERESSE.
+# - códigos numéricos: inteiros de largura fixa (zeros à esquerda não são preservados);
+# - descritores de baixa cardinalidade: Enum (domínio conhecido) ou Categorical;
+# - demais colunas (nomes, endereços, CO_UNIDADE, CO_CBO...): Utf8.
+# Colunas não declaradas são mantidas como texto.
+ESQUEMAS_CNES = {
+    'tbEstabelecimento': {
+        'CO_UNIDADE': pl.Utf8,
+        'CO_CNES': pl.Int32,
+        'TP_PFPJ': pl.Categorical,
+        'NIVEL_DEP': pl.Categorical,
+        'CO_ATIVIDADE': pl.Int16,
+        'CO_CLIENTELA': pl.Int16,
+        'TP_UNIDADE': pl.Int16,
+        'CO_TURNO_ATENDIMENTO': pl.Int16,
+        'CO_ESTADO_GESTOR': pl.Int8,
+        'CO_MUNICIPIO_GESTOR': pl.Int32,
+        # '' identifica os estabelecimentos ativos, por isso o vazio é preservado
+        'CO_MOTIVO_DESAB': pl.Categorical,
+        'CO_NATUREZA_JUR': pl.Int16,
+        'TP_ESTAB_SEMPRE_ABERTO': SIM_NAO,
+        'ST_CONEXAO_INTERNET': SIM_NAO,
+        'CO_TIPO_UNIDADE': pl.Int16,
+        'TP_GESTAO': pl.Categorical,
+        'CO_TIPO_ESTABELECIMENTO': pl.Int16,
+        'CO_ATIVIDADE_PRINCIPAL': pl.Int16,
+        'ST_CONTRATO_FORMALIZADO': SIM_NAO,
+        'CO_TIPO_ABRANGENCIA': pl.Int16,
+        'ST_COWORKING': SIM_NAO,
+    },
+    'rlEstabComplementar': {
+        'CO_UNIDADE': pl.Utf8,
+        'CO_LEITO': pl.Int16,
+        'CO_TIPO_LEITO': pl.Int16,
+        'QT_EXIST': pl.Int32,
+        'QT_CONTRATADO': pl.Int32,
+        'QT_SUS': pl.Int32,
+    },
+    'tbAtividade': {
+        'CO_ATIVIDADE': pl.Int16,
+    },
+    'tbAtividadeProfissional': {
+        'CO_CBO': pl.Utf8,
+        'TP_CLASSIFICACAO_PROFISSIONAL': pl.Categorical,
+        'TP_CBO_SAUDE': SIM_NAO,
+    },
+    'tbMunicipio': {
+        'CO_MUNICIPIO': pl.Int32,
+        'CO_SIGLA_ESTADO': SIGLAS_UF,
+        'TP_PACTO': SIM_NAO,
+    },
+    'tbEstado': {
+        'CO_UF': pl.Int8,
+        'CO_SIGLA_ESTADO': SIGLAS_UF,
+    },
+    'tbTipoUnidade': {
+        'CO_TIPO_UNIDADE': pl.Int16,
+    },
+    'tbTipoEstabelecimento': {
+        'CO_TIPO_ESTABELECIMENTO': pl.Int16,
+    },
+    'tbAtributo': {},
+    'tbCargaHorariaSus': {
+        'CO_UNIDADE': pl.Utf8,
+        'CO_PROFISSIONAL_SUS': pl.Utf8,
+        'CO_CBO': pl.Utf8,
+        'TP_SUS_NAO_SUS': SIM_NAO,
+        'QT_CARGA_HORARIA_AMBULATORIAL': pl.Int16,
+        'QT_CARGA_HOR_HOSP_SUS': pl.Int16,
+        'QT_CARGA_HORARIA_OUTROS': pl.Int16,
+    },
+}
+
+# Chaves de negócio de cada tabela: identificam o registro entre competências
+CHAVES_CNES = {
+    'tbEstabelecimento': ['CO_UNIDADE'],
+    'rlEstabComplementar': ['CO_UNIDADE', 'CO_LEITO', 'CO_TIPO_LEITO'],
+    'tbAtividade': ['CO_ATIVIDADE'],
+    'tbAtividadeProfissional': ['CO_CBO'],
+    'tbMunicipio': ['CO_MUNICIPIO'],
+    'tbEstado': ['CO_UF'],
+    'tbTipoUnidade': ['CO_TIPO_UNIDADE'],
+    'tbTipoEstabelecimento': ['CO_TIPO_ESTABELECIMENTO'],
+    'tbAtributo': ['CO_ATRIBUTO'],
+    'tbCargaHorariaSus': ['CO_UNIDADE', 'CO_PROFISSIONAL_SUS', 'CO_CBO'],
+}
+
+# Coluna com o código do município (6 dígitos, sem dígito verificador) de cada tabela;
+# dela saem as chaves normalizadas `cod_mun6` e `cod_mun7` (ver utils.adicionar_codigos_municipio)
+MUNICIPIO_CNES = {
+    'tbEstabelecimento': 'CO_MUNICIPIO_GESTOR',
+    'tbMunicipio': 'CO_MUNICIPIO',
+}
+
+_ESQUEMAS_POR_NOME = {nome.lower(): esquema for nome, esquema in ESQUEMAS_CNES.items()}
+_CHAVES_POR_NOME = {nome.lower(): chaves for nome, chaves in CHAVES_CNES.items()}
+_MUNICIPIO_POR_NOME = {nome.lower(): coluna for nome, coluna in MUNICIPIO_CNES.items()}
+
+def esquema_tabela(tabela: str) -> dict:
+    """
+    Retorna os tipos declarados da tabela (nome sem distinção de maiúsculas,
+    ex.: 'tbestabelecimento'). Tabelas fora do registro não têm tipos declarados.
+    """
+    return _ESQUEMAS_POR_NOME.get(tabela.lower(), {})
+
+def chaves_tabela(tabela: str) -> list:
+    """
+    Retorna as chaves de negócio declaradas da tabela (lista vazia se não houver).
+    """
+    return list(_CHAVES_POR_NOME.get(tabela.lower(), []))
+
+def coluna_municipio(tabela: str) -> str | None:
+    """
+    Retorna a coluna com o código do município da tabela (None se não houver).
+    """
+    return _MUNICIPIO_POR_NOME.get(tabela.lower())
+
+def aplicar_esquema(df, tabela: str):
+    """
+    Converte as colunas declaradas da tabela para os tipos do registro.
+    Aceita DataFrame ou LazyFrame.
+
+    Textos vazios viram nulo antes da conversão para tipos não textuais; valores fora
+    do tipo declarado (código não numérico, categoria fora do Enum) geram erro.
+    """
+    esquema = esquema_tabela(tabela)
+    atual = df.collect_schema() if isinstance(df, pl.LazyFrame) else df.schema
+
+    expressoes = []
+    for coluna, tipo in atual.items():
+        destino = esquema.get(coluna)
+        if destino is None or tipo == destino:
+            continue
+
+        expressao = pl.col(coluna)
+        if tipo == pl.Utf8 and destino.is_numeric():
+            expressao = expressao.str.strip_chars().replace('', None)
+        elif tipo == pl.Utf8 and isinstance(destino, pl.Enum):
+            expressao = expressao.replace('', None)
+        expressoes.append(expressao.cast(destino))
+
+    return df.with_columns(expressoes) if expressoes else df
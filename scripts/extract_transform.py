@@ -1,101 +1,270 @@
 # scripts/extract_transform.py
 
 import os
+import re
+import json
+import time
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
 import polars as pl
-import polars.selectors as cs
-from scripts.configs import DIRS, ANO
+from scripts.configs import (
+    DIRS, ANO_INICIO, ANO_FIM, MESES,
+    CONVERSAO_WORKERS, TABELAS_GRANDES, CONCAT_SEM_COPIA,
+    TABELAS_HISTORICO, DICIONARIO_SIM, COLUNAS_MORTALIDADE,
+    DIMENSOES_MORTALIDADE, AGREGADOS_MORTALIDADE, SIH_AGREGADO, ANO
+)
 from scripts.utils import (
     criar_pastas, 
     ler_arquivo_polars,
-    adicionar_coluna_data,
+    converter_csv_cnes_para_parquet,
     ler_cidades_ibge,
-    tratar_codigos_municipais
+    ler_planilhas,
+    codigo_municipio_6,
+    adicionar_codigos_municipio,
+    conferir_codigos_municipio,
+    agregar_internacoes_arquivo,
+    VERSAO_LEITOR_CIDADES,
+    VERSAO_LEITOR_PLANILHA,
+    VERSAO_CONVERSAO_CNES,
+    separar_tabela_competencia,
+    caminho_particao,
+    listar_tabelas_dataset,
+    listar_anos_dataset,
+    listar_arquivos_particao,
+    escanear_particao,
+    limpar_particao,
+    gravar_particao,
+    vincular_particao,
+    contar_linhas_parquet,
+    montar_intervalos_validade
+)
+from scripts.esquemas import chaves_tabela
+from scripts.manifesto import (
+    carregar_manifesto,
+    salvar_manifesto,
+    impressao_arquivos,
+    impressao_tabela,
+    etapa_atualizada,
+    registrar_etapa,
+    impressao_etapa
 )
+from scripts.dbc import converter_arquivos_dbc
 
 criar_pastas([
     DIRS['RAW_CNES'], DIRS['PARQUET_CNES'], 
-    DIRS['CONCAT_CNES'], DIRS['FINAL_CNES'], 
+    DIRS['CONCAT_CNES'], DIRS['HISTORICO_CNES'], DIRS['FINAL_CNES'], 
     DIRS['FINAL_CIDADES'], DIRS['FINAL_IBGE'], 
     DIRS['FINAL_MORTALIDADE']
 ])
 
+# Categorias de arquivos diferentes no mesmo cache, para concatenar sem recodificar
+pl.enable_string_cache()
+
 # Funções
-def transformar_dados():
+def limitar_threads_polars(threads):
     """
-    Lê os CSVs baixados, ajusta encoding/delimitador e salva em Parquet.
+    Limita o pool de threads do Polars no processo atual. Usada como `initializer` dos
+    processos de conversão: o pool só é criado no primeiro uso, depois desta chamada.
     """
-    print("Transformando CSVs em Parquet...")
-
-    arquivos = os.listdir(DIRS['RAW_CNES'])
+    os.environ['POLARS_MAX_THREADS'] = str(threads)
 
-    for arquivo in arquivos:
-        if not arquivo.lower().endswith('.csv'):
-            continue
-
-        caminho_csv = os.path.join(DIRS['RAW_CNES'], arquivo)
-        nome_base = arquivo.replace('.csv', '').lower()
+def transformar_dados(max_workers=CONVERSAO_WORKERS, forcar=False):
+    """
+    Lê os CSVs baixados, ajusta encoding/delimitador e salva em Parquet,
+    na partição `tabela/ano=AAAA/mes=MM` de DIRS['PARQUET_CNES'].
 
-        print(f"{arquivo} → {nome_base}.parquet")
+    Só são convertidos os CSVs cujo conteúdo (hash registrado no manifesto pelo download)
+    ou VERSAO_CONVERSAO_CNES mudou desde a última conversão, ou cujo Parquet não existe
+    mais; `forcar` reconverte todos.
 
-        df = ler_arquivo_polars(caminho_csv)
-        df = adicionar_coluna_data(df, arquivo)
-        
-        if 'CO_ESTADO_GESTOR' in df.columns:
-            df = tratar_codigos_municipais(df, nome_base)        
+    A conversão é feita em streaming (`converter_csv_cnes_para_parquet`): o pico de
+    memória não depende do tamanho do arquivo. Os arquivos são convertidos em paralelo
+    em até `max_workers` processos, com no máximo uma tabela de TABELAS_GRANDES por vez.
+    Uma falha não interrompe os demais arquivos; as falhas são listadas ao final.
+    """
+    print("Transformando CSVs em Parquet...")
 
-        df.write_parquet(os.path.join(DIRS['PARQUET_CNES'], f"{nome_base}.parquet"))
+    arquivos = sorted(a for a in os.listdir(DIRS['RAW_CNES']) if a.lower().endswith('.csv'))
+    if not arquivos:
+        print("Nenhum CSV para converter.")
+        return
+
+    manifesto = carregar_manifesto()
+    impressoes = {
+        arquivo: f"{VERSAO_CONVERSAO_CNES}:{impressao_tabela(manifesto, os.path.join(DIRS['RAW_CNES'], arquivo))}"
+        for arquivo in arquivos
+    }
+    pendentes = [
+        arquivo for arquivo in arquivos
+        if forcar or not etapa_atualizada(
+            manifesto, 'conversao', arquivo, impressoes[arquivo],
+            [caminho_particao(DIRS['PARQUET_CNES'], *separar_tabela_competencia(arquivo))]
+        )
+    ]
+    print(f"{len(arquivos) - len(pendentes)} de {len(arquivos)} CSVs sem alterações desde a última conversão.")
+    if not pendentes:
+        return
+    arquivos = pendentes
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(arquivos))
+
+    # Tabelas grandes primeiro, para que a última não fique sozinha no final
+    grandes = [a for a in arquivos if separar_tabela_competencia(a)[0] in TABELAS_GRANDES]
+    pequenos = [a for a in arquivos if a not in grandes]
+
+    # Divide as threads do Polars entre os processos
+    threads_polars = max(1, (os.cpu_count() or 1) // max_workers)
+
+    em_execucao = {}
+    falhas = []
+    concluidos = 0
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('spawn'),
+                             initializer=limitar_threads_polars, initargs=(threads_polars,)) as executor:
+        while grandes or pequenos or em_execucao:
+            grande_em_execucao = any(grande for _, grande, _ in em_execucao.values())
+
+            while len(em_execucao) < max_workers and (pequenos or (grandes and not grande_em_execucao)):
+                grande = bool(grandes) and not grande_em_execucao
+                arquivo = grandes.pop(0) if grande else pequenos.pop(0)
+                grande_em_execucao = grande_em_execucao or grande
+
+                tabela, ano, mes = separar_tabela_competencia(arquivo)
+                caminho_csv = os.path.join(DIRS['RAW_CNES'], arquivo)
+                caminho_parquet = caminho_particao(DIRS['PARQUET_CNES'], tabela, ano, mes)
+
+                futuro = executor.submit(converter_csv_cnes_para_parquet, caminho_csv, arquivo, caminho_parquet)
+                em_execucao[futuro] = (arquivo, grande, time.perf_counter())
+
+            prontos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                arquivo, _, inicio = em_execucao.pop(futuro)
+                concluidos += 1
+                try:
+                    futuro.result()
+                    registrar_etapa(manifesto, 'conversao', arquivo, impressoes[arquivo])
+                    salvar_manifesto(manifesto)
+                    print(f"[{concluidos}/{len(arquivos)}] {arquivo} convertido em {time.perf_counter() - inicio:.1f}s")
+                except Exception as e:
+                    falhas.append(arquivo)
+                    print(f"[{concluidos}/{len(arquivos)}] Falha ao converter {arquivo}: {e}")
+
+    if falhas:
+        raise RuntimeError(f"Falha na conversão de {len(falhas)} arquivo(s): {', '.join(falhas)}")
 
     print("Conversão para Parquet finalizada.")
 
 
-def concatenar_parquets_por_tabela():
+def concatenar_parquets_por_tabela(sem_copia=CONCAT_SEM_COPIA, forcar=False):
     """
-    Concatena arquivos Parquet por tabela base, alinhando colunas diferentes.
+    Concatena os Parquets mensais de cada tabela, ano a ano, alinhando colunas diferentes.
+    O resultado vai para a partição `tabela/ano=AAAA` de DIRS['CONCAT_CNES'].
+
+    A concatenação é lazy (`escanear_particao`): os esquemas são unificados pelos metadados
+    e o resultado é gravado em streaming, sem carregar os meses na memória. Com
+    `sem_copia`, os arquivos mensais são apenas vinculados à partição (hard links) e as
+    etapas seguintes os leem como um único dataset.
+
+    Uma partição só é refeita se algum Parquet mensal do ano mudou (ver
+    `scripts.manifesto.etapa_atualizada`); `forcar` refaz todas.
     """
     print("Concatenando arquivos por tabela base...")
-    arquivos = os.listdir(DIRS['PARQUET_CNES'])
-    tabelas_encontradas = {}
 
-    for arquivo in arquivos:
-        if not arquivo.endswith('.parquet'):
-            continue
-        nome_base = ''.join(filter(str.isalpha, arquivo.replace('.parquet', '')))
-        tabelas_encontradas.setdefault(nome_base.lower(), []).append(arquivo)
+    manifesto = carregar_manifesto()
+    for base in listar_tabelas_dataset(DIRS['PARQUET_CNES']):
+        for ano in listar_anos_dataset(DIRS['PARQUET_CNES'], base):
+            if not ANO_INICIO <= ano <= ANO_FIM:
+                continue
 
-    for base, arquivos_base in tabelas_encontradas.items():
-        caminhos = [os.path.join(DIRS['PARQUET_CNES'], f) for f in arquivos_base]
-        print(f'Concatenando {len(caminhos)} arquivos da tabela {base}...')
+            unidade = f'{base}/{ano}'
+            impressao = f"{'vinculo' if sem_copia else 'copia'}:{impressao_arquivos(listar_arquivos_particao(DIRS['PARQUET_CNES'], base, ano))}"
+            pasta_destino = os.path.join(DIRS['CONCAT_CNES'], base, f'ano={ano}')
+            if not forcar and etapa_atualizada(manifesto, 'concatenacao', unidade, impressao, [pasta_destino]):
+                print(f'Tabela {base} ({ano}) sem alterações.')
+                continue
 
-        dfs = [ler_arquivo_polars(c) for c in caminhos]
+            if sem_copia:
+                vinculados = vincular_particao(DIRS['PARQUET_CNES'], DIRS['CONCAT_CNES'], base, ano)
+                print(f'{len(vinculados)} arquivos da tabela {base} ({ano}) vinculados em {DIRS["CONCAT_CNES"]}.')
+                registrar_etapa(manifesto, 'concatenacao', unidade, impressao)
+                salvar_manifesto(manifesto)
+                continue
 
-        # Alinhar todas as colunas
-        colunas_totais = set()
-        for df in dfs:
-            colunas_totais.update(df.columns)
-        colunas_totais = sorted(colunas_totais)  # opcional: manter ordenado
+            print(f'Concatenando {len(listar_arquivos_particao(DIRS["PARQUET_CNES"], base, ano))} arquivos da tabela {base} ({ano})...')
 
-        dfs_alinhados = []
-        for df in dfs:
-            faltando = list(set(colunas_totais) - set(df.columns))
-            if faltando:
-                for col in faltando:
-                    df = df.with_columns(pl.lit(None).alias(col))
-            # reordenar para manter o mesmo padrão
-            df = df.select(colunas_totais)
-            dfs_alinhados.append(df)
+            lf = escanear_particao(DIRS['PARQUET_CNES'], base, ano)
 
-        # 🔹 Finalmente concatena
-        df_final = pl.concat(dfs_alinhados, how='vertical_relaxed')
+            limpar_particao(DIRS['CONCAT_CNES'], base, ano)
+            caminho_destino = caminho_particao(DIRS['CONCAT_CNES'], base, ano)
+            lf.sink_parquet(caminho_destino)
+            registrar_etapa(manifesto, 'concatenacao', unidade, impressao)
+            salvar_manifesto(manifesto)
+            print(f'Tabela {base} ({ano}) salva em {caminho_destino}!')
 
-        os.makedirs(DIRS['CONCAT_CNES'], exist_ok=True)
-        df_final.write_parquet(os.path.join(DIRS['CONCAT_CNES'], f'{base}_{ANO}.parquet'))
-        print(f'Tabela {base}_{ANO}.parquet salva!')
 
+def gerar_historico_cnes(tabelas=TABELAS_HISTORICO, forcar=False):
+    """
+    Guarda as tabelas mensais do CNES como histórico de intervalos de validade (SCD tipo 2)
+    em `tabela/dados.parquet` de DIRS['HISTORICO_CNES'].
+
+    Todas as competências convertidas em DIRS['PARQUET_CNES'] entram no histórico; meses
+    consecutivos com o mesmo registro viram uma única linha com `valid_from`/`valid_to`.
+    O retrato de qualquer competência é reconstruído com `utils.escanear_snapshot`.
+    O histórico de uma tabela só é refeito se algum dos seus Parquets mensais mudou;
+    `forcar` refaz todos.
+    """
+    print("Gerando histórico (SCD tipo 2) das tabelas mensais...")
+
+    manifesto = carregar_manifesto()
+    for nome_tabela in tabelas:
+        tabela = nome_tabela.lower()
+        anos = listar_anos_dataset(DIRS['PARQUET_CNES'], tabela)
+        if not anos:
+            print(f'Nenhum Parquet mensal da tabela {tabela}.')
+            continue
 
-def tratar_e_deduplicar_tabelas():
+        pasta = os.path.join(DIRS['HISTORICO_CNES'], tabela)
+        caminho = os.path.join(pasta, 'dados.parquet')
+        impressao = impressao_arquivos(
+            arquivo for ano in anos for arquivo in listar_arquivos_particao(DIRS['PARQUET_CNES'], tabela, ano)
+        )
+        if not forcar and etapa_atualizada(manifesto, 'historico', tabela, impressao, [caminho]):
+            print(f'Histórico de {tabela} sem alterações.')
+            continue
+
+        lf = pl.concat(
+            [escanear_particao(DIRS['PARQUET_CNES'], tabela, ano) for ano in anos],
+            how='diagonal_relaxed'
+        )
+        antes = contar_linhas_parquet(*(
+            arquivo for ano in anos for arquivo in listar_arquivos_particao(DIRS['PARQUET_CNES'], tabela, ano)
+        ))
+
+        historico = montar_intervalos_validade(lf, chaves_tabela(tabela))
+
+        os.makedirs(pasta, exist_ok=True)
+        temporario = os.path.join(pasta, '.dados.parquet.tmp')
+        historico.sink_parquet(temporario)
+        os.replace(temporario, caminho)
+        registrar_etapa(manifesto, 'historico', tabela, impressao)
+        salvar_manifesto(manifesto)
+
+        print(f'{tabela}: {antes} linhas mensais → {contar_linhas_parquet(caminho)} intervalos em {caminho}')
+
+
+def tratar_e_deduplicar_tabelas(forcar=False):
     """
     Remove registros duplicados considerando as tabelas que precisam ou não de comparação com dezembro.
+
+    A deduplicação usa o `hash_linha` gravado na conversão (mais as chaves de negócio
+    declaradas em `scripts.esquemas`) e é gravada em streaming; a comparação com
+    dezembro usa só a contagem de linhas dos metadados.
+
+    Só são processadas as partições refeitas por `concatenar_parquets_por_tabela` desde
+    a última deduplicação; `forcar` processa todas.
     """
+    manifesto = carregar_manifesto()
 
     tabelas_sem_mudanca = [
         'tbAtividade', 'tbMunicipio', 'tbEstado',
@@ -106,82 +275,127 @@ def tratar_e_deduplicar_tabelas():
         'rlEstabComplementar', 'tbAtividadeProfissional'
     ]
 
-    def processar_tabelas(lista_nomes, verificar_igual=True):
+    def processar_tabelas(lista_nomes, ano, verificar_igual=True):
         for nome_tabela in lista_nomes:
-            print(f"\nProcessando {nome_tabela}...")
+            print(f"\nProcessando {nome_tabela} ({ano})...")
+
+            tabela = nome_tabela.lower()
+            unidade = f'{tabela}/{ano}'
+            impressao = impressao_etapa(manifesto, 'concatenacao', unidade)
+            if not forcar and etapa_atualizada(manifesto, 'deduplicacao', unidade, impressao):
+                print('Partição já deduplicada, sem alterações.')
+                continue
 
-            caminho_parquet = f'{DIRS['CONCAT_CNES']}/{nome_tabela.lower()}_{ANO}.parquet'
-            df = ler_arquivo_polars(caminho_parquet)
+            antes = contar_linhas_parquet(*listar_arquivos_particao(DIRS['CONCAT_CNES'], tabela, ano))
 
-            if nome_tabela not in tabelas_com_mudanca:
-                df = df.sort('data_competencia')
+            # Os meses entram em ordem cronológica: keep='last' fica com o registro mais recente
+            lf = escanear_particao(DIRS['CONCAT_CNES'], tabela, ano)
+            chaves = [c for c in chaves_tabela(tabela) if c in lf.collect_schema().names()]
+            lf = lf.unique(subset=chaves + ['hash_linha'], keep='last')
 
-            df_unique = df.unique(subset=df.columns[:-1], keep='last')
+            caminho_parquet = gravar_particao(lf, DIRS['CONCAT_CNES'], tabela, ano)
+            depois = contar_linhas_parquet(caminho_parquet)
 
             if verificar_igual:
-                caminho_dezembro = f'data/parquet/{nome_tabela}{ANO}12.parquet'
-                dezembro = ler_arquivo_polars(caminho_dezembro)
-                print(f"Antes: {df.shape} | Depois: {df_unique.shape} | Dezembro: {dezembro.shape}")
+                caminho_dezembro = caminho_particao(DIRS['PARQUET_CNES'], tabela, ano, max(MESES))
+                dezembro = contar_linhas_parquet(caminho_dezembro)
+                print(f"Antes: {antes} linhas | Depois: {depois} | Dezembro: {dezembro}")
 
-                if df_unique.height == dezembro.height:
+                if depois == dezembro:
                     print(f'Sem alterações relevantes.')
 
-            caminho_destino = f'{DIRS['CONCAT_CNES']}/{nome_tabela.lower()}_{ANO}.parquet'
-            df_unique.write_parquet(caminho_destino)
-            print(f'{nome_tabela} salvo em {caminho_destino}')
+            registrar_etapa(manifesto, 'deduplicacao', unidade, impressao)
+            salvar_manifesto(manifesto)
+            print(f'{nome_tabela} salvo em {caminho_parquet}')
 
-    processar_tabelas(tabelas_sem_mudanca, verificar_igual=True)
-    processar_tabelas(tabelas_com_mudanca, verificar_igual=False)
+    for ano in range(ANO_INICIO, ANO_FIM + 1):
+        processar_tabelas(tabelas_sem_mudanca, ano, verificar_igual=True)
+        processar_tabelas(tabelas_com_mudanca, ano, verificar_igual=False)
 
     print("\nTodas tabelas deduplicadas e salvas com sucesso.")
 
 
-def tratar_estabelecimentos(nome_arquivo: str = 'tbestabelecimento_2022.parquet'):
+def tratar_estabelecimentos(forcar=False):
     """
-    Trata a tabela de estabelecimentos: mantém apenas registros ativos e únicos.
+    Trata a tabela de estabelecimentos de cada ano: mantém apenas registros ativos e únicos.
+
+    O tratamento sobrescreve a partição concatenada e não pode ser repetido sobre o
+    próprio resultado, então só é feito nos anos refeitos por `concatenar_parquets_por_tabela`
+    desde o último tratamento; `forcar` trata todos.
+    """
+    manifesto = carregar_manifesto()
+    for ano in range(ANO_INICIO, ANO_FIM + 1):
+        unidade = f'tbestabelecimento/{ano}'
+        impressao = impressao_etapa(manifesto, 'concatenacao', unidade)
+        if not forcar and etapa_atualizada(manifesto, 'estabelecimentos', unidade, impressao):
+            print(f"\ntbEstabelecimento ({ano}) já tratado, sem alterações.")
+            continue
+
+        tratar_estabelecimentos_ano(ano)
+        registrar_etapa(manifesto, 'estabelecimentos', unidade, impressao)
+        salvar_manifesto(manifesto)
+
+def tratar_estabelecimentos_ano(ano: int):
     """
-    print("\nTratando tbEstabelecimento...")
+    Trata a partição de um ano da tabela de estabelecimentos.
 
-    df = ler_arquivo_polars(f'{DIRS['CONCAT_CNES']}/{nome_arquivo}')
+    Em uma única agregação lazy, mantém o registro da competência mais recente de cada
+    CO_CNES (arg-max explícito em `data_competencia`) e calcula a primeira e a última
+    competência em que ele aparece. O resultado é gravado em streaming.
+    """
+    print(f"\nTratando tbEstabelecimento ({ano})...")
 
-    df = df.select([
+    colunas = [
         'CO_UNIDADE', 'CO_CNES', 'NU_CNPJ_MANTENEDORA', 'TP_PFPJ',
         'NIVEL_DEP', 'NO_RAZAO_SOCIAL', 'NO_FANTASIA', 'NO_LOGRADOURO',
         'NU_ENDERECO', 'NO_COMPLEMENTO', 'NO_BAIRRO', 'CO_CEP',
         'NU_CNPJ', 'CO_ATIVIDADE', 'TP_UNIDADE', 'CO_TURNO_ATENDIMENTO',
-        'CO_ESTADO_GESTOR', 'CO_MUNICIPIO_GESTOR', 'CO_MOTIVO_DESAB',
+        'CO_ESTADO_GESTOR', 'CO_MUNICIPIO_GESTOR', 'cod_mun6', 'cod_mun7', 'CO_MOTIVO_DESAB',
         'TP_ESTAB_SEMPRE_ABERTO', 'CO_TIPO_UNIDADE', 'CO_TIPO_ESTABELECIMENTO',
         'CO_ATIVIDADE_PRINCIPAL', 'TP_GESTAO', 'data_competencia'
-    ])
+    ]
 
-    estabelecimento_datas = df.group_by('CO_CNES').agg(
-        pl.col('data_competencia').first().alias('data_primeiro_registro'),
-        pl.col('data_competencia').last().alias('data_ultimo_registro')
+    lf = escanear_particao(DIRS['CONCAT_CNES'], 'tbestabelecimento', ano).select(colunas)
+
+    # data_competencia (AAAA-MM-01) tem ordem lexicográfica igual à cronológica
+    mais_recente = pl.col('data_competencia').arg_max()
+    lf = (
+        lf.group_by('CO_CNES')
+          .agg(
+              *[pl.col(c).get(mais_recente) for c in colunas if c != 'CO_CNES'],
+              pl.col('data_competencia').min().alias('data_primeiro_registro'),
+              pl.col('data_competencia').max().alias('data_ultimo_registro')
+          )
+          .select(colunas + ['data_primeiro_registro', 'data_ultimo_registro'])
     )
 
-    df = df.join(estabelecimento_datas, on='CO_CNES', how='inner')
-    df = df.sort('data_ultimo_registro')
-    df = df.lazy().unique(subset=["CO_CNES"], keep='last').collect()
-
-    ativos = df.filter(pl.col('CO_MOTIVO_DESAB') == '')
-    print(f"Estabelecimentos ativos em 2022: {ativos['CO_CNES'].n_unique()} unidades.")
+    caminho = gravar_particao(lf, DIRS['CONCAT_CNES'], 'tbestabelecimento', ano)
 
-    df.write_parquet(f'{DIRS["CONCAT_CNES"]}/tbestabelecimento_2022.parquet')
+    ativos = (
+        pl.scan_parquet(caminho)
+          .filter(pl.col('CO_MOTIVO_DESAB') == '')
+          .select(pl.col('CO_CNES').n_unique())
+          .collect()
+          .item()
+    )
+    print(f"Estabelecimentos ativos em {ano}: {ativos} unidades.")
 
     print("tbEstabelecimento tratado e salvo com sucesso!")
 
 def trata_dados_cidades():
     """
-    Lê o CSV de cidades do IBGE, limpa e salva em Parquet.
+    Lê as planilhas de cidades do IBGE (uma por UF), limpa e salva em Parquet.
+
+    As planilhas são lidas em paralelo e só as alteradas desde a última execução são
+    relidas (ver `ler_planilhas`).
     """
     print("Lendo dados de cidades do IBGE...")
     
-    dfs = []
-    for file in os.listdir(DIRS['BASE_CIDADES']):
-        df = ler_cidades_ibge(DIRS['BASE_CIDADES'] + file)
-        dfs.append(df)
+    arquivos = [DIRS['BASE_CIDADES'] + file for file in sorted(os.listdir(DIRS['BASE_CIDADES']))]
+    dfs = ler_planilhas(arquivos, ler_cidades_ibge, VERSAO_LEITOR_CIDADES)
     
     df = pl.concat(dfs, how='vertical_relaxed')
+    df = conferir_codigos_municipio(adicionar_codigos_municipio(df, 'codigo_municipio'), 'codigo_municipio', 'cidades_ibge')
 
     print("Salvando dados tratados...")
     
@@ -189,112 +403,128 @@ def trata_dados_cidades():
     
     print("Arquivo de cidades tratado e salvo!")
 
-def transformar_dados_mortalidade(df: pl.DataFrame) -> pl.DataFrame:
+def carregar_dicionario_sim(caminho: str = DICIONARIO_SIM) -> dict:
+    """
+    Lê o dicionário dos campos codificados do SIM.
+
+    Formato (JSON):
+    - 'colunas': {coluna: {'codigos': {código: rótulo}, 'outros': rótulo dos demais valores}};
+    - 'colunas_titulo': colunas de texto livre que devem ficar em "Title Case".
+    """
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+def transformar_dados_mortalidade(df, dicionario: dict | None = None):
     """
     Aplica transformações semânticas aos campos codificados da base de mortalidade.
+    Aceita DataFrame ou LazyFrame.
+
+    Cada coluna do dicionário é decodificada com uma única consulta (`replace_strict`)
+    para um `pl.Enum` com os rótulos possíveis; códigos fora do dicionário e nulos
+    recebem o rótulo de 'outros'. As demais colunas de texto só têm os espaços das
+    pontas removidos, e apenas as de 'colunas_titulo' passam para "Title Case".
+    """
+    dicionario = dicionario if dicionario is not None else carregar_dicionario_sim()
+    schema = df.collect_schema() if isinstance(df, pl.LazyFrame) else df.schema
+
+    decodificadas = []
+    for coluna, campo in dicionario['colunas'].items():
+        if coluna not in schema:
+            continue
+        rotulos = pl.Enum(list(dict.fromkeys([*campo['codigos'].values(), campo['outros']])))
+        decodificadas.append(
+            pl.col(coluna).cast(pl.Utf8).str.strip_chars()
+              .replace_strict(campo['codigos'], default=campo['outros'], return_dtype=rotulos)
+              .fill_null(campo['outros'])
+        )
+
+    titulo = [c for c in dicionario.get('colunas_titulo', []) if c in schema]
+    texto = [c for c, tipo in schema.items() if tipo == pl.Utf8 and c not in dicionario['colunas'] and c not in titulo]
+
+    return df.with_columns(
+        *decodificadas,
+        *[pl.col(c).str.strip_chars().str.to_titlecase() for c in titulo],
+        *[pl.col(c).str.strip_chars() for c in texto]
+    )
+
+def converter_arquivos_datasus(pastas=(DIRS['BASE_MORTALIDADE'], DIRS['BASE_INTERNACOES']), max_workers=CONVERSAO_WORKERS):
+    """
+    Converte os arquivos .dbc/.dbf do DATASUS (SIM, SIH) das pastas informadas em Parquet,
+    gravado ao lado do original (ex.: DOBR2022.dbc → DOBR2022.parquet).
+
+    A leitura é feita em lotes pelo leitor nativo de `scripts.dbc`, sem ferramentas
+    externas, e os arquivos são convertidos em paralelo. Arquivos cujo Parquet já existe
+    e é mais novo que o original são ignorados.
+    """
+    arquivos = []
+    for pasta in pastas:
+        if not os.path.isdir(pasta):
+            continue
+        for nome in sorted(os.listdir(pasta)):
+            if not nome.lower().endswith(('.dbc', '.dbf')):
+                continue
+            caminho = os.path.join(pasta, nome)
+            caminho_parquet = f'{os.path.splitext(caminho)[0]}.parquet'
+            if os.path.exists(caminho_parquet) and os.path.getmtime(caminho_parquet) >= os.path.getmtime(caminho):
+                continue
+            arquivos.append(caminho)
+
+    if not arquivos:
+        print("Nenhum arquivo .dbc/.dbf para converter.")
+        return
+
+    print(f"Convertendo {len(arquivos)} arquivo(s) .dbc/.dbf em Parquet...")
+    falhas = []
+    for caminho, registros, erro in converter_arquivos_dbc(arquivos, max_workers):
+        if erro is not None:
+            falhas.append(os.path.basename(caminho))
+            print(f"Falha ao converter {caminho}: {erro}")
+        else:
+            print(f"{caminho} convertido: {registros} registros.")
+
+    if falhas:
+        raise RuntimeError(f"Falha na conversão de {len(falhas)} arquivo(s): {', '.join(falhas)}")
+
+def trata_dados_mortalidade():
+    """
+    Trata os dados de mortalidade do SUS (SIM) de cada ano do período (arquivos DOBRAAAA.parquet),
+    realiza join com municípios e estados e salva na partição `mortalidade/ano=AAAA`.
     """
+    for ano in range(ANO_INICIO, ANO_FIM + 1):
+        caminho = f'{DIRS["BASE_MORTALIDADE"]}/DOBR{ano}.parquet'
+        if not os.path.exists(caminho):
+            print(f"Arquivo de mortalidade não encontrado: {caminho}")
+            continue
+        trata_dados_mortalidade_ano(caminho, ano)
+
+def trata_dados_mortalidade_ano(caminho: str, ano: int, colunas=COLUNAS_MORTALIDADE,
+                                dimensoes=DIMENSOES_MORTALIDADE):
+    """
+    Trata um arquivo anual do SIM e salva em Parquet.
 
-    df = df.with_columns([
-        pl.when(pl.col("SEXO") == "0").then(pl.lit("Ignorado"))
-          .when(pl.col("SEXO") == "1").then(pl.lit("Masculino"))
-          .when(pl.col("SEXO") == "2").then(pl.lit("Feminino"))
-          .otherwise(pl.lit("Desconhecido")).alias("SEXO"),
-
-        pl.when(pl.col("RACACOR") == "1").then(pl.lit("Branca"))
-          .when(pl.col("RACACOR") == "2").then(pl.lit("Preta"))
-          .when(pl.col("RACACOR") == "3").then(pl.lit("Amarela"))
-          .when(pl.col("RACACOR") == "4").then(pl.lit("Parda"))
-          .when(pl.col("RACACOR") == "5").then(pl.lit("Indígena"))
-          .otherwise(pl.lit("Ignorado")).alias("RACACOR"),
-
-        pl.when(pl.col("ESTCIV") == "1").then(pl.lit("Solteiro"))
-          .when(pl.col("ESTCIV") == "2").then(pl.lit("Casado"))
-          .when(pl.col("ESTCIV") == "3").then(pl.lit("Viúvo"))
-          .when(pl.col("ESTCIV") == "4").then(pl.lit("Separado/Divorciado"))
-          .when(pl.col("ESTCIV") == "5").then(pl.lit("União estável"))
-          .otherwise(pl.lit("Ignorado")).alias("ESTCIV"),
-
-        pl.when(pl.col("ESC2010") == "0").then(pl.lit("Sem escolaridade"))
-          .when(pl.col("ESC2010") == "1").then(pl.lit("Fundamental I"))
-          .when(pl.col("ESC2010") == "2").then(pl.lit("Fundamental II"))
-          .when(pl.col("ESC2010") == "3").then(pl.lit("Médio"))
-          .when(pl.col("ESC2010") == "4").then(pl.lit("Superior incompleto"))
-          .when(pl.col("ESC2010") == "5").then(pl.lit("Superior completo"))
-          .otherwise(pl.lit("Ignorado")).alias("ESC2010"),
-
-        pl.when(pl.col("LOCOCOR") == "1").then(pl.lit("Hospital"))
-          .when(pl.col("LOCOCOR") == "2").then(pl.lit("Outros estabelecimentos de saúde"))
-          .when(pl.col("LOCOCOR") == "3").then(pl.lit("Domicílio"))
-          .when(pl.col("LOCOCOR") == "4").then(pl.lit("Via pública"))
-          .when(pl.col("LOCOCOR") == "5").then(pl.lit("Outros"))
-          .when(pl.col("LOCOCOR") == "6").then(pl.lit("Aldeia indígena"))
-          .otherwise(pl.lit("Ignorado")).alias("LOCOCOR"),
-
-        pl.when(pl.col("GRAVIDEZ") == "1").then(pl.lit("Única"))
-          .when(pl.col("GRAVIDEZ") == "2").then(pl.lit("Dupla"))
-          .when(pl.col("GRAVIDEZ") == "3").then(pl.lit("Tripla ou mais"))
-          .otherwise(pl.lit("Ignorado")).alias("GRAVIDEZ"),
-
-        pl.when(pl.col("PARTO") == "1").then(pl.lit("Vaginal"))
-          .when(pl.col("PARTO") == "2").then(pl.lit("Cesáreo"))
-          .otherwise(pl.lit("Ignorado")).alias("PARTO"),
-
-        pl.when(pl.col("OBITOPARTO") == "1").then(pl.lit("Antes"))
-          .when(pl.col("OBITOPARTO") == "2").then(pl.lit("Durante"))
-          .when(pl.col("OBITOPARTO") == "3").then(pl.lit("Depois"))
-          .otherwise(pl.lit("Ignorado")).alias("OBITOPARTO"),
-
-        pl.when(pl.col("TPMORTEOCO") == "1").then(pl.lit("Gravidez"))
-          .when(pl.col("TPMORTEOCO") == "2").then(pl.lit("Parto"))
-          .when(pl.col("TPMORTEOCO") == "3").then(pl.lit("Abortamento"))
-          .when(pl.col("TPMORTEOCO") == "4").then(pl.lit("Até 42 dias pós-parto"))
-          .when(pl.col("TPMORTEOCO") == "5").then(pl.lit("43 dias a 1 ano pós-parto"))
-          .when(pl.col("TPMORTEOCO") == "8").then(pl.lit("Não ocorreu neste período"))
-          .otherwise(pl.lit("Ignorado")).alias("TPMORTEOCO"),
-
-        pl.when(pl.col("CIRCOBITO") == "1").then(pl.lit("Acidente"))
-          .when(pl.col("CIRCOBITO") == "2").then(pl.lit("Suicídio"))
-          .when(pl.col("CIRCOBITO") == "3").then(pl.lit("Homicídio"))
-          .when(pl.col("CIRCOBITO") == "4").then(pl.lit("Outros"))
-          .otherwise(pl.lit("Ignorado")).alias("CIRCOBITO"),
-
-        pl.when(pl.col("ACIDTRAB") == "1").then(pl.lit("Sim"))
-          .when(pl.col("ACIDTRAB") == "2").then(pl.lit("Não"))
-          .otherwise(pl.lit("Ignorado")).alias("ACIDTRAB"),
-
-        pl.when(pl.col("FONTE") == "1").then(pl.lit("Ocorrência policial"))
-          .when(pl.col("FONTE") == "2").then(pl.lit("Hospital"))
-          .when(pl.col("FONTE") == "3").then(pl.lit("Família"))
-          .when(pl.col("FONTE") == "4").then(pl.lit("Outra"))
-          .otherwise(pl.lit("Ignorado")).alias("FONTE")
-    ])
-
-    df = df.with_columns(cs.string().str.strip_chars().str.to_titlecase())
-
-    return df
-
-def trata_dados_mortalidade(nome_arquivo: str = 'DOBR2022.parquet'):
-    """
-    Trata os dados de mortalidade do SUS (SIM), realiza join com municípios e estados e salva em Parquet.
-    """
-    print("Lendo dados de mortalidade...")
-
-    df = ler_arquivo_polars(f'{DIRS["BASE_MORTALIDADE"]}/{nome_arquivo}')
-
-    df = transformar_dados_mortalidade(df)
+    Leitura, decodificação e join com municípios formam um único plano lazy, gravado em
+    streaming na partição `mortalidade/ano=AAAA`. Só as `colunas` configuradas são lidas
+    do arquivo.
+
+    Além da tabela de óbitos, grava os agregados de AGREGADOS_MORTALIDADE (contagem de
+    óbitos por estabelecimento, município de ocorrência e de residência, abertos pelas
+    `dimensoes` decodificadas), consultados pela tabela final no lugar dos registros.
+    """
+    print(f"Lendo dados de mortalidade ({ano})...")
+
+    lf = pl.scan_parquet(caminho)
+    lf = lf.select([c for c in colunas if c in lf.collect_schema().names()])
+
+    lf = transformar_dados_mortalidade(lf)
 
     # Carrega tabelas de município e estado tratadas
-    municipios = ler_arquivo_polars(f'{DIRS["CONCAT_CNES"]}/tbmunicipio_2022.parquet')
-    municipios = municipios.with_columns([
-        pl.col('CO_MUNICIPIO').cast(pl.Utf8)
-    ])
+    municipios = escanear_particao(DIRS["CONCAT_CNES"], 'tbmunicipio', ano)
     # estados = ler_arquivo_polars('data/cnes/tbestado_2022.parquet')
 
-    # Join com municípios
-    df = df.join(
-        municipios.select(['CO_MUNICIPIO', 'NO_MUNICIPIO', 'CO_SIGLA_ESTADO']),
-        left_on='CODMUNOCOR',
-        right_on='CO_MUNICIPIO',
+    # Join com municípios pela chave normalizada do município de ocorrência
+    obitos = adicionar_codigos_municipio(lf, 'CODMUNOCOR').join(
+        municipios.select(['cod_mun6', 'CO_MUNICIPIO', 'NO_MUNICIPIO', 'CO_SIGLA_ESTADO']),
+        on='cod_mun6',
         how='left'
     )
 
@@ -305,25 +535,112 @@ def trata_dados_mortalidade(nome_arquivo: str = 'DOBR2022.parquet'):
     #     how='left'
     # )
 
-    df.write_parquet(f'{DIRS["FINAL_MORTALIDADE"]}/mortalidade_2022.parquet')
-    print("Tabela de mortalidade salva com sucesso.")
+    obitos.sink_parquet(caminho_particao(DIRS["FINAL_MORTALIDADE"], 'mortalidade', ano))
+
+    # Agregados: poucas linhas por chave, calculados juntos sobre a mesma leitura
+    dimensoes = [d for d in dimensoes if d in lf.collect_schema().names()]
+    agregados = {}
+    for nome, chave in AGREGADOS_MORTALIDADE.items():
+        # Códigos de município (CODMUN*) entram normalizados e ganham cod_mun6/cod_mun7
+        municipal = chave.startswith('CODMUN')
+        codigo = codigo_municipio_6(chave) if municipal else pl.col(chave).cast(pl.Int32, strict=False)
+        agregado = (
+            lf.group_by(codigo.alias(chave), *dimensoes)
+              .agg(pl.len().cast(pl.Int32).alias('qtd_obitos'))
+              .sort(chave, *dimensoes, nulls_last=True)
+        )
+        agregados[nome] = adicionar_codigos_municipio(agregado, chave) if municipal else agregado
+    for nome, df in zip(agregados, pl.collect_all(list(agregados.values()))):
+        df.write_parquet(caminho_particao(DIRS["FINAL_MORTALIDADE"], nome, ano))
+
+    print(f"Tabela de mortalidade de {ano} salva com sucesso.")
+
+def listar_arquivos_sih(ano, pasta=DIRS['BASE_INTERNACOES']) -> list:
+    """
+    Lista os Parquets mensais das AIHs reduzidas do SIH (RDUFAAMM.parquet) do ano.
+    """
+    if not os.path.isdir(pasta):
+        return []
+
+    arquivos = []
+    for nome in sorted(os.listdir(pasta)):
+        correspondencia = re.fullmatch(r'RD[A-Z]{2}(\d{2})(\d{2})\.parquet', nome, re.IGNORECASE)
+        if correspondencia and 2000 + int(correspondencia.group(1)) == int(ano):
+            arquivos.append(os.path.join(pasta, nome))
+    return arquivos
+
+def agregar_internacoes(ano=ANO, max_workers=CONVERSAO_WORKERS):
+    """
+    Gera `DIRS['FINAL_INTERNACOES']/sih_agregado.parquet` com os indicadores de internação
+    por município usados pela clusterização. O município vem nas mesmas chaves da
+    tabela_final: `codigo_municipio` (texto de 6 dígitos) e `cod_mun6` (Int32).
+
+    Cada arquivo mensal do SIH do ano é agregado em um processo separado, lendo em
+    streaming (`agregar_internacoes_arquivo`); os parciais são então somados em um plano
+    lazy, também em streaming, sem que o volume de AIHs precise caber na memória.
+    """
+    arquivos = listar_arquivos_sih(ano)
+    if not arquivos:
+        print(f"Nenhum arquivo do SIH (RD) de {ano} encontrado em {DIRS['BASE_INTERNACOES']}.")
+        return
+
+    criar_pastas([DIRS['FINAL_INTERNACOES']])
+    print(f"Agregando {len(arquivos)} arquivo(s) de internações de {ano}...")
+
+    with tempfile.TemporaryDirectory(dir=DIRS['FINAL_INTERNACOES']) as pasta_parciais:
+        max_workers = min(max_workers or os.cpu_count() or 1, len(arquivos))
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('spawn')) as executor:
+            futuros = [
+                executor.submit(agregar_internacoes_arquivo, caminho, os.path.join(pasta_parciais, f'{i:04d}.parquet'))
+                for i, caminho in enumerate(arquivos)
+            ]
+            parciais = [futuro.result() for futuro in as_completed(futuros)]
+
+        total_internacoes = pl.col('internacoes').sum()
+        (
+            pl.scan_parquet(parciais)
+              .filter(pl.col('cod_mun6').is_not_null())
+              .group_by('cod_mun6')
+              .agg(
+                  total_internacoes.alias('total_internacoes'),
+                  (pl.col('obitos').sum() / total_internacoes).round(4).alias('obitos_por_internacao'),
+                  pl.col('CNES').drop_nulls().n_unique().cast(pl.Int64).alias('total_hospitais'),
+                  pl.col('dias_permanencia').sum().alias('total_dias_permanencia'),
+                  pl.col('diarias').sum().alias('total_diarias'),
+                  pl.col('valor').sum().round(2).alias('total_valor'),
+                  (pl.col('valor').sum() / pl.col('diarias').sum()).round(2).alias('valor_medio_diaria'),
+                  pl.col('obitos').sum().alias('total_obitos_em_internacao'),
+                  pl.col('cod_mun6_residencia').drop_nulls().n_unique().cast(pl.Int64).alias('total_municipio_atendidos'),
+              )
+              .select(
+                  pl.col('cod_mun6').cast(pl.Utf8).str.zfill(6).alias('codigo_municipio'),
+                  pl.all(),
+              )
+              .sort('cod_mun6')
+              .sink_parquet(os.path.join(DIRS['FINAL_INTERNACOES'], SIH_AGREGADO))
+        )
+
+    print(f"Internações de {ano} agregadas em {os.path.join(DIRS['FINAL_INTERNACOES'], SIH_AGREGADO)}.")
 
 def trata_dados_complementares_ibge():
     """
     Lê e trata os dados complementares do IBGE, salvando em Parquet.
+
+    As planilhas são lidas em paralelo e só as alteradas desde a última execução são
+    relidas (ver `ler_planilhas`).
     """
     print(f"Lendo dados complementares do IBGE...")
 
-    arquivos = os.listdir(DIRS['BASE_IBGE'])
+    arquivos = sorted(a for a in os.listdir(DIRS['BASE_IBGE']) if a.endswith('.xlsx'))
+    dfs = ler_planilhas(
+        [f'{DIRS["BASE_IBGE"]}/{nome_arquivo}' for nome_arquivo in arquivos],
+        ler_arquivo_polars,
+        VERSAO_LEITOR_PLANILHA
+    )
     
-    for nome_arquivo in arquivos:
-        if not nome_arquivo.endswith('.xlsx'):
-            continue
-        
-        print(f"Tratando {nome_arquivo}...")
-        
-        # Lê o arquivo Excel
-        df = ler_arquivo_polars(f'{DIRS["BASE_IBGE"]}/{nome_arquivo}')
+    for nome_arquivo, df in zip(arquivos, dfs):
+        if 'codigo' in df.columns:
+            df = conferir_codigos_municipio(adicionar_codigos_municipio(df, 'codigo'), 'codigo', nome_arquivo)
         df.write_parquet(f'{DIRS["FINAL_IBGE"]}/{nome_arquivo.replace(".xlsx", ".parquet")}')
     
         print(f"Arquivo {nome_arquivo} salvo com sucesso!")
\ No newline at end of file
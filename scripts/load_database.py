@@ -1,331 +1,770 @@
 # scripts/load_database.py
 
 import duckdb
+import glob
+import hashlib
 import os
-from scripts.utils import configurar_logger, criar_pastas
-from scripts.configs import DIRS, DB_PATH
+import re
+import time
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from graphlib import TopologicalSorter
+from scripts.utils import (
+    configurar_logger,
+    criar_pastas,
+    padrao_dataset,
+    listar_tabelas_dataset,
+    competencia_referencia
+)
+from scripts.configs import (
+    DIRS, DB_PATH, ANO, AGREGADOS_MORTALIDADE, SIH_AGREGADO,
+    DUCKDB_CONFIG, DUCKDB_CARGAS_PARALELAS, DUCKDB_MODO_PADRAO, DUCKDB_MODOS,
+    CHAVES_DUCKDB, INDICES_DUCKDB, DUCKDB_CARGA_INCREMENTAL,
+    EXPORTACAO_FORMATOS, EXPORTACAO_COMPRESSAO, EXPORTACAO_LINHAS_GRUPO, EXPORTACAO_ORDENACAO
+)
 
 logger = configurar_logger()
 
-def carregar_parquets_para_duckdb():
-    logger.info("Carregando tabelas do CNES no DuckDB...")
-    conn = duckdb.connect(DB_PATH)
-
-    for arquivo in os.listdir(DIRS['CONCAT_CNES']):
-        if arquivo.endswith('.parquet'):
-            nome_tabela = arquivo.replace('_2022.parquet', '')
-            caminho = os.path.join(DIRS['CONCAT_CNES'], arquivo)
-
-            logger.info(f"Inserindo tabela {nome_tabela}...")
-            conn.execute(f"""
-                CREATE OR REPLACE TABLE {nome_tabela} AS 
-                SELECT * FROM read_parquet('{caminho}')
-            """)
-    conn.close()
-    logger.info("Tabelas do CNES criadas e populadas com sucesso no DuckDB!")
+# Prefixo das tabelas de trabalho de uma carga, trocadas pelas definitivas ao final
+PREFIXO_CARGA = '_carga_'
 
-def carregar_cidades_ibge_no_duckdb():
-    logger.info("Carregando dados de tb_cidades_ibge_2022 no DuckDB...")
-    conn = duckdb.connect(DB_PATH)
-
-    # Cria a tabela, caso não exista
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS tb_cidades_ibge_2022 (
-            nome TEXT,
-            codigo_municipio TEXT,
-            area_km2 DOUBLE,
-            populacao_residente DOUBLE,
-            densidade_demografica DOUBLE,
-            escolarizacao_6_14 DOUBLE,
-            idhm DOUBLE,
-            mortalidade_infantil DOUBLE,
-            total_receitas_brutas_realizadas DOUBLE,
-            total_despesas_brutas_empenhadas DOUBLE,
-            pib_per_capita DOUBLE,
-            uf TEXT
-        );
-    """)
+# Impressões dos arquivos de cada partição já carregada (ver carregar_tabelas_incrementais)
+TABELA_CONTROLE = '_controle_cargas'
+
+LER_DATASET = "SELECT * FROM read_parquet(?, hive_partitioning = true, union_by_name = true)"
 
-    # Faz o INSERT dos dados especificando as colunas
+def conectar_duckdb(caminho=DB_PATH, config=DUCKDB_CONFIG):
+    """
+    Abre o banco DuckDB com as configurações de `config` (threads, memory_limit,
+    temp_directory, preserve_insertion_order); valores None ficam com o padrão do DuckDB.
+    """
+    config = {chave: valor for chave, valor in config.items() if valor is not None}
+    if 'temp_directory' in config:
+        os.makedirs(config['temp_directory'], exist_ok=True)
+    return duckdb.connect(caminho, config=config)
+
+def modo_tabela(nome: str) -> str:
+    """
+    Modo da tabela no banco ('tabela' ou 'visao'), conforme DUCKDB_MODOS.
+    """
+    modo = DUCKDB_MODOS.get(nome, DUCKDB_MODO_PADRAO)
+    if modo not in ('tabela', 'visao'):
+        raise ValueError(f"Modo inválido para {nome}: {modo!r} (use 'tabela' ou 'visao').")
+    return modo
+
+def _consulta_visao(consulta: str, parametros) -> str:
+    """
+    Troca os parâmetros (caminhos) da consulta por literais com o caminho absoluto:
+    views não aceitam parâmetros e são resolvidas a partir do diretório de quem consulta.
+    """
+    for caminho in parametros:
+        literal = "'" + os.path.abspath(caminho).replace("'", "''") + "'"
+        consulta = consulta.replace('?', literal, 1)
+    return consulta
+
+def _remover_objeto(conn, nome):
+    tipo = conn.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?",
+        (nome,)
+    ).fetchone()
+    if tipo:
+        conn.execute(f"DROP {'VIEW' if tipo[0] == 'VIEW' else 'TABLE'} {nome}")
+
+def _particoes(caminho) -> dict:
+    """
+    Agrupa os arquivos do caminho (ou padrão glob) pela partição `ano=AAAA` do caminho;
+    arquivos fora de partições ficam sob ''.
+    """
+    particoes = {}
+    for arquivo in sorted(glob.glob(caminho, recursive=True)):
+        ano = re.search(r'ano=(\d{4})', arquivo)
+        particoes.setdefault(ano.group(1) if ano else '', []).append(arquivo)
+    return particoes
+
+def _impressao(arquivos) -> str:
+    h = hashlib.sha256()
+    for arquivo in arquivos:
+        info = os.stat(arquivo)
+        h.update(f'{os.path.abspath(arquivo)}|{info.st_size}|{info.st_mtime_ns}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+def _garantir_controle(conn):
     conn.execute(f"""
-        INSERT INTO tb_cidades_ibge_2022 (
-            nome,
-            codigo_municipio,
-            area_km2,
-            populacao_residente,
-            densidade_demografica,
-            escolarizacao_6_14,
-            idhm,
-            mortalidade_infantil,
-            total_receitas_brutas_realizadas,
-            total_despesas_brutas_empenhadas,
-            pib_per_capita,
-            uf
+        CREATE TABLE IF NOT EXISTS {TABELA_CONTROLE} (
+            tabela TEXT,
+            particao TEXT,
+            impressao TEXT,
+            carregado_em TIMESTAMP,
+            PRIMARY KEY (tabela, particao)
         )
-        SELECT
-            nome,
-            SUBSTRING(codigo_municipio, 1, 6) AS codigo_municipio,
-            area_km2,
-            populacao_residente,
-            densidade_demografica,
-            escolarizacao_6_14,
-            idhm,
-            mortalidade_infantil,
-            total_receitas_brutas_realizadas,
-            total_despesas_brutas_empenhadas,
-            pib_per_capita,
-            uf
-        FROM read_parquet('{DIRS["FINAL_CIDADES"]}/cidades_ibge_2022.parquet');
     """)
 
-    conn.close()
-    logger.info("Tabela tb_cidades_ibge_2022 criada e populada com sucesso no DuckDB!")
+def _registrar_particao(conn, nome, particao, arquivos):
+    conn.execute(
+        f"INSERT OR REPLACE INTO {TABELA_CONTROLE} VALUES (?, ?, ?, current_timestamp)",
+        (nome, particao, _impressao(arquivos))
+    )
 
-def carregar_mortalidade_no_duckdb():
-    logger.info("Carregando dados de mortalidade no DuckDB...")
-    conn = duckdb.connect(DB_PATH)
+def _tabela_existe(conn, nome, esquema='main') -> bool:
+    return conn.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = ? AND table_name = ? AND table_type = 'BASE TABLE'",
+        (esquema, nome)
+    ).fetchone()[0] > 0
 
-    caminho = f'{DIRS["FINAL_MORTALIDADE"]}/mortalidade_2022.parquet'
+def _criar_indices(conn, nome):
+    for colunas in INDICES_DUCKDB.get(nome, []):
+        conn.execute(f"CREATE INDEX idx_{nome}_{'_'.join(colunas)} ON {nome} ({', '.join(colunas)})")
 
-    conn.execute("""
-        CREATE OR REPLACE TABLE tb_mortalidade_2022 AS
-        SELECT * FROM read_parquet(?)
-    """, (caminho,))
+def _criar_tabela_carga(conn, nome, consulta, parametros):
+    cursor = conn.cursor()
+    try:
+        inicio = time.perf_counter()
+        cursor.execute(f"CREATE OR REPLACE TABLE {PREFIXO_CARGA}{nome} AS {consulta}", parametros)
+        if nome in CHAVES_DUCKDB:
+            # Falha aqui se a chave tiver nulos ou repetições, antes de afetar os joins
+            cursor.execute(f"ALTER TABLE {PREFIXO_CARGA}{nome} ADD PRIMARY KEY ({', '.join(CHAVES_DUCKDB[nome])})")
+        linhas = cursor.execute(f"SELECT COUNT(*) FROM {PREFIXO_CARGA}{nome}").fetchone()[0]
+        return linhas, time.perf_counter() - inicio
+    finally:
+        cursor.close()
 
-    conn.close()
-    logger.info("Tabela tb_mortalidade_2022 criada e populada com sucesso no DuckDB!")
+def carregar_tabelas(consultas: dict, conn=None, max_workers=DUCKDB_CARGAS_PARALELAS, modo=None) -> dict:
+    """
+    Cria no DuckDB as tabelas de `consultas` ({nome: (SELECT, caminhos dos parâmetros)}).
 
-def carregar_internacoes_no_duckdb():
-    logger.info("Carregando dados de internacoes no DuckDB...")
-    conn = duckdb.connect(DB_PATH)
+    Tabelas no modo 'tabela' (ver `modo_tabela`) são copiadas para o banco: cada uma é lida
+    por um cursor próprio da mesma conexão, em até `max_workers` threads, para a tabela de
+    trabalho `_carga_<nome>`, com a chave primária de CHAVES_DUCKDB. As de modo 'visao'
+    viram views sobre os Parquets, com caminhos absolutos. Quando todas as cargas
+    terminam, os objetos definitivos são substituídos (e os índices de INDICES_DUCKDB
+    criados) em uma única transação; se alguma carga falhar, nada existente é alterado.
+    `modo` força o mesmo modo para todas as tabelas.
+
+    Returns:
+        dict: {nome: (linhas, segundos)}; views têm `linhas` None.
+    """
+    if modo not in (None, 'tabela', 'visao'):
+        raise ValueError(f"Modo inválido: {modo!r} (use 'tabela' ou 'visao').")
+    modos = {nome: modo or modo_tabela(nome) for nome in consultas}
+
+    propria = conn is None
+    conn = conectar_duckdb() if propria else conn
+
+    materializadas = {nome: c for nome, c in consultas.items() if modos[nome] == 'tabela'}
+    visoes = {nome: c for nome, c in consultas.items() if modos[nome] == 'visao'}
+
+    resultados = {}
+    em_transacao = False
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {
+                executor.submit(_criar_tabela_carga, conn, nome, consulta, parametros): nome
+                for nome, (consulta, parametros) in materializadas.items()
+            }
+            for futuro in as_completed(futuros):
+                nome = futuros[futuro]
+                resultados[nome] = futuro.result()
+                logger.info(f"{nome}: {resultados[nome][0]} linhas em {resultados[nome][1]:.2f}s")
+
+        _garantir_controle(conn)
+        conn.execute("BEGIN TRANSACTION")
+        em_transacao = True
+        for nome, (_, parametros) in materializadas.items():
+            _remover_objeto(conn, nome)
+            conn.execute(f"ALTER TABLE {PREFIXO_CARGA}{nome} RENAME TO {nome}")
+            _criar_indices(conn, nome)
+            conn.execute(f"DELETE FROM {TABELA_CONTROLE} WHERE tabela = ?", (nome,))
+            for particao, arquivos in _particoes(parametros[0]).items():
+                _registrar_particao(conn, nome, particao, arquivos)
+        for nome, (consulta, parametros) in visoes.items():
+            inicio = time.perf_counter()
+            conn.execute(f"DELETE FROM {TABELA_CONTROLE} WHERE tabela = ?", (nome,))
+            _remover_objeto(conn, nome)
+            conn.execute(f"CREATE VIEW {nome} AS {_consulta_visao(consulta, parametros)}")
+            resultados[nome] = (None, time.perf_counter() - inicio)
+            logger.info(f"{nome}: view criada em {resultados[nome][1]:.2f}s")
+        conn.execute("COMMIT")
+        em_transacao = False
+    finally:
+        if em_transacao:
+            conn.execute("ROLLBACK")
+        for nome in materializadas:
+            conn.execute(f"DROP TABLE IF EXISTS {PREFIXO_CARGA}{nome}")
+        if propria:
+            conn.close()
+
+    total = sum(segundos for _, segundos in resultados.values())
+    linhas = sum(linhas or 0 for linhas, _ in resultados.values())
+    logger.info(f"{len(materializadas)} tabela(s) com {linhas} linhas e {len(visoes)} view(s); {total:.2f}s somando as cargas.")
+    return resultados
+
+def _atualizar_tabela(conn, nome, consulta, caminho):
+    cursor = conn.cursor()
+    try:
+        inicio = time.perf_counter()
+        particoes = _particoes(caminho)
+        registradas = dict(cursor.execute(
+            f"SELECT particao, impressao FROM {TABELA_CONTROLE} WHERE tabela = ?", (nome,)
+        ).fetchall())
+        alteradas = {p: arquivos for p, arquivos in particoes.items() if registradas.get(p) != _impressao(arquivos)}
+        removidas = [p for p in registradas if p not in particoes]
+
+        chaves = CHAVES_DUCKDB.get(nome)
+        linhas = 0
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            for particao, arquivos in alteradas.items():
+                filtro = f"ano = {int(particao)}" if particao else "TRUE"
+                if chaves:
+                    linhas += cursor.execute(f"INSERT OR REPLACE INTO {nome} BY NAME {consulta}", (arquivos,)).fetchone()[0]
+                    # Linhas da partição que deixaram de existir na origem
+                    mesma_chave = ' AND '.join(f'novos.{chave} = {nome}.{chave}' for chave in chaves)
+                    cursor.execute(f"""
+                        DELETE FROM {nome}
+                        WHERE {filtro} AND NOT EXISTS (SELECT 1 FROM ({consulta}) novos WHERE {mesma_chave})
+                    """, (arquivos,))
+                else:
+                    cursor.execute(f"DELETE FROM {nome} WHERE {filtro}")
+                    linhas += cursor.execute(f"INSERT INTO {nome} BY NAME {consulta}", (arquivos,)).fetchone()[0]
+                _registrar_particao(cursor, nome, particao, arquivos)
+
+            for particao in removidas:
+                cursor.execute(f"DELETE FROM {nome} WHERE {f'ano = {int(particao)}' if particao else 'TRUE'}")
+                cursor.execute(f"DELETE FROM {TABELA_CONTROLE} WHERE tabela = ? AND particao = ?", (nome, particao))
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
 
-    caminho = f'{DIRS["FINAL_INTERNACOES"]}/internacoes_2022.parquet'
+        return linhas, len(alteradas) + len(removidas), time.perf_counter() - inicio
+    finally:
+        cursor.close()
 
-    conn.execute("""
-        CREATE OR REPLACE TABLE tb_internacoes_2022 AS
-        SELECT * FROM read_parquet(?)
-    """, (caminho,))
+def carregar_tabelas_incrementais(consultas: dict, conn=None, max_workers=DUCKDB_CARGAS_PARALELAS) -> dict:
+    """
+    Atualiza no DuckDB só as partições (`ano=AAAA`; o arquivo inteiro nas tabelas sem
+    partição) cujos arquivos mudaram desde a última carga, comparando caminho, tamanho e
+    data de modificação com as impressões guardadas em `_controle_cargas`.
 
-    conn.close()
-    logger.info("Tabela tb_internacoes_2022 criada e populada com sucesso no DuckDB!")
+    Tabelas com chave primária (CHAVES_DUCKDB) recebem upsert (`INSERT OR REPLACE`) e
+    perdem as linhas da partição que deixaram de existir na origem; nas demais a partição
+    é apagada e reinserida. Cada tabela é atualizada em uma transação, por um cursor
+    próprio. Tabelas ainda inexistentes e as de modo 'visao' passam por `carregar_tabelas`.
+
+    Returns:
+        dict: {nome: (linhas inseridas ou atualizadas, segundos)}
+    """
+    propria = conn is None
+    conn = conectar_duckdb() if propria else conn
+
+    try:
+        _garantir_controle(conn)
+        existentes = {
+            nome: c for nome, c in consultas.items()
+            if modo_tabela(nome) == 'tabela' and _tabela_existe(conn, nome)
+        }
+        resultados = carregar_tabelas({n: c for n, c in consultas.items() if n not in existentes}, conn, max_workers)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {
+                executor.submit(_atualizar_tabela, conn, nome, consulta, parametros[0]): nome
+                for nome, (consulta, parametros) in existentes.items()
+            }
+            for futuro in as_completed(futuros):
+                nome = futuros[futuro]
+                linhas, particoes, segundos = futuro.result()
+                resultados[nome] = (linhas, segundos)
+                if particoes:
+                    logger.info(f"{nome}: {particoes} partição(ões) atualizada(s), {linhas} linhas em {segundos:.2f}s")
+                else:
+                    logger.info(f"{nome}: sem alterações ({segundos:.2f}s)")
+    finally:
+        if propria:
+            conn.close()
+
+    return resultados
+
+def consultas_cnes() -> dict:
+    """Tabelas do CNES: um dataset particionado por tabela em DIRS['CONCAT_CNES']."""
+    return {
+        nome_tabela: (LER_DATASET, (padrao_dataset(DIRS['CONCAT_CNES'], nome_tabela),))
+        for nome_tabela in listar_tabelas_dataset(DIRS['CONCAT_CNES'])
+    }
+
+def consultas_cidades_ibge() -> dict:
+    """Cidades do IBGE, com o código do município reduzido a 6 dígitos em `codigo_municipio`."""
+    return {
+        'tb_cidades_ibge_2022': ("""
+            SELECT
+                CAST(nome AS TEXT) AS nome,
+                SUBSTRING(codigo_municipio, 1, 6) AS codigo_municipio,
+                CAST(cod_mun6 AS INTEGER) AS cod_mun6,
+                CAST(cod_mun7 AS INTEGER) AS cod_mun7,
+                CAST(area_km2 AS DOUBLE) AS area_km2,
+                CAST(populacao_residente AS DOUBLE) AS populacao_residente,
+                CAST(densidade_demografica AS DOUBLE) AS densidade_demografica,
+                CAST(escolarizacao_6_14 AS DOUBLE) AS escolarizacao_6_14,
+                CAST(idhm AS DOUBLE) AS idhm,
+                CAST(mortalidade_infantil AS DOUBLE) AS mortalidade_infantil,
+                CAST(total_receitas_brutas_realizadas AS DOUBLE) AS total_receitas_brutas_realizadas,
+                CAST(total_despesas_brutas_empenhadas AS DOUBLE) AS total_despesas_brutas_empenhadas,
+                CAST(pib_per_capita AS DOUBLE) AS pib_per_capita,
+                CAST(uf AS TEXT) AS uf
+            FROM read_parquet(?)
+        """, (f'{DIRS["FINAL_CIDADES"]}/cidades_ibge_2022.parquet',))
+    }
+
+def consultas_mortalidade() -> dict:
+    """Óbitos do SIM e seus agregados (ver trata_dados_mortalidade_ano)."""
+    consultas = {'tb_mortalidade': (LER_DATASET, (padrao_dataset(DIRS["FINAL_MORTALIDADE"], 'mortalidade'),))}
+    for nome in AGREGADOS_MORTALIDADE:
+        consultas[f'tb_{nome}'] = (LER_DATASET, (padrao_dataset(DIRS["FINAL_MORTALIDADE"], nome),))
+    return consultas
+
+def consultas_internacoes() -> dict:
+    """Agregado do SIH por município (extract_transform.agregar_internacoes), se existir."""
+    caminho = os.path.join(DIRS["FINAL_INTERNACOES"], SIH_AGREGADO)
+    if not os.path.exists(caminho):
+        logger.warning(f"{caminho} não encontrado; tb_internacoes não foi carregada.")
+        return {}
+    return {'tb_internacoes': ("SELECT * FROM read_parquet(?)", (caminho,))}
+
+def consultas_ibge_adicionais() -> dict:
+    """Tabelas complementares do IBGE: um Parquet por tabela em DIRS['FINAL_IBGE']."""
+    return {
+        arquivo.replace('.parquet', ''): ("SELECT * FROM read_parquet(?)", (f"{DIRS['FINAL_IBGE']}/{arquivo}",))
+        for arquivo in sorted(os.listdir(DIRS['FINAL_IBGE']))
+        if arquivo.endswith('.parquet')
+    }
+
+def carregar_parquets_para_duckdb():
+    logger.info("Carregando tabelas do CNES no DuckDB...")
+    carregar_tabelas(consultas_cnes())
+    logger.info("Tabelas do CNES criadas e populadas com sucesso no DuckDB!")
+
+def carregar_cidades_ibge_no_duckdb():
+    logger.info("Carregando dados de tb_cidades_ibge_2022 no DuckDB...")
+    carregar_tabelas(consultas_cidades_ibge())
+    logger.info("Tabela tb_cidades_ibge_2022 criada e populada com sucesso no DuckDB!")
+
+def carregar_mortalidade_no_duckdb():
+    logger.info("Carregando dados de mortalidade no DuckDB...")
+    carregar_tabelas(consultas_mortalidade())
+    logger.info("Tabela tb_mortalidade e agregados de óbitos criados e populados com sucesso no DuckDB!")
+
+def carregar_internacoes_no_duckdb():
+    logger.info("Carregando dados de internacoes no DuckDB...")
+    if carregar_tabelas(consultas_internacoes()):
+        logger.info("Tabela tb_internacoes criada e populada com sucesso no DuckDB!")
 
 def carregar_ibge_adicionais_no_duckdb():
     logger.info("Carregando tabelas adicionais do IBGE no DuckDB...")
-    conn = duckdb.connect(DB_PATH)
+    carregar_tabelas(consultas_ibge_adicionais())
+    logger.info("Tabelas adicionais do IBGE carregadas com sucesso no DuckDB!")
 
-    for arquivo in os.listdir(DIRS['FINAL_IBGE']):
-        if arquivo.endswith('.parquet'):
-            nome_tabela = arquivo.replace('.parquet', '')
-            caminho = f"{DIRS['FINAL_IBGE']}/{arquivo}"
+def carregar_banco(incremental=DUCKDB_CARGA_INCREMENTAL):
+    """
+    Carrega de uma vez, em paralelo, todas as tabelas de origem do banco: CNES, cidades
+    e tabelas complementares do IBGE, mortalidade e internações. Com `incremental`, só
+    as partições alteradas desde a última carga são regravadas.
+    """
+    logger.info("Carregando tabelas de origem no DuckDB...")
+    carregar = carregar_tabelas_incrementais if incremental else carregar_tabelas
+    carregar({
+        **consultas_cnes(),
+        **consultas_cidades_ibge(),
+        **consultas_mortalidade(),
+        **consultas_internacoes(),
+        **consultas_ibge_adicionais(),
+    })
+    logger.info("Tabelas de origem carregadas com sucesso no DuckDB!")
 
-            print(nome_tabela)
+# Tabelas do IBGE ligadas aos municípios do CNES (por `cod_mun6`) na tabela principal
+TABELAS_IBGE_MUNICIPIO = [
+    'tb_cidades_ibge_2022', 'taxa_de_alfabetizacao', 'taxa_coleta_lixo', 'taxa_rede_esgoto',
+    'anos_de_estudo', 'taxa_populacao_nivel_instrucao', 'pop_res_favela',
+    'taxa_situacao_domicilio', 'taxa_frequencia_escolar', 'taxa_distribuicao_etaria'
+]
 
-            logger.info(f"Inserindo tabela {nome_tabela}...")
-            conn.execute(f"""
-                CREATE OR REPLACE TABLE {nome_tabela} AS 
-                SELECT * FROM read_parquet('{caminho}')
-            """)
+def registrar_municipios_sem_par(conn, ano=ANO):
+    """
+    Registra no log as chaves de município que não casam nos joins da tabela principal:
+    municípios com estabelecimentos ativos ausentes de cada tabela do IBGE e óbitos cujo
+    município de ocorrência não está no tbMunicipio. Sem isso, essas linhas só
+    apareceriam como nulos na tabela final.
+    """
+    ano = int(ano)
+    for tabela in TABELAS_IBGE_MUNICIPIO:
+        faltantes, exemplos = conn.execute(f"""
+            SELECT COUNT(*), LIST(te.cod_mun6 ORDER BY te.cod_mun6)[1:5]
+            FROM (
+                SELECT DISTINCT cod_mun6 FROM main.tbestabelecimento
+                WHERE ano = ? AND CO_MOTIVO_DESAB = ''
+            ) te
+            ANTI JOIN main.{tabela} x ON x.cod_mun6 = te.cod_mun6
+        """, (ano,)).fetchone()
+        if faltantes:
+            logger.warning(f"{faltantes} município(s) do CNES sem correspondência em {tabela} (ex.: {exemplos}).")
 
-    conn.close()
-    logger.info("Tabelas adicionais do IBGE carregadas com sucesso no DuckDB!")
+    obitos, exemplos = conn.execute("""
+        SELECT COALESCE(SUM(o.qtd_obitos), 0), LIST(DISTINCT o.CODMUNOCOR)[1:5]
+        FROM main.tb_obitos_municipio_ocorrencia o
+        ANTI JOIN (SELECT DISTINCT cod_mun6 FROM main.tbmunicipio WHERE ano = ?) tm
+            ON o.cod_mun6 = tm.cod_mun6
+        WHERE o.ano = ?
+    """, (ano, ano)).fetchone()
+    if obitos:
+        logger.warning(f"{obitos} óbito(s) com município de ocorrência fora do tbMunicipio (ex.: {exemplos}).")
+
+# Tabelas de origem lidas pelas etapas já filtradas pelo ano, nas views temporárias `<tabela>_ano`
+TABELAS_POR_ANO = [
+    'tbestabelecimento', 'tbmunicipio', 'tbtipounidade', 'tbtipoestabelecimento', 'tbatividade',
+    'tbatividadeprofissional', 'rlestabcomplementar', 'tbcargahorariasus',
+    'tb_obitos_estabelecimento', 'tb_obitos_municipio_ocorrencia'
+]
 
-def carregar_tabela_principal():
-    logger.info("Carregando tabela principal no DuckDB...")
-    conn = duckdb.connect(DB_PATH)
-
-    # Cria a tabela, caso não exista
-    conn.execute("""
-        CREATE OR REPLACE TABLE tabela_final AS
-        WITH leitos AS(
-            SELECT 
-                rec.CO_UNIDADE,
-                SUM(rec.QT_EXIST) leitos_existentes,
-                SUM(rec.QT_SUS) leitos_sus
-            FROM
-                main.rlestabcomplementar rec
+ESQUEMA_ETAPAS = 'etapas'
+TABELA_CONTROLE_ETAPAS = '_controle_etapas'
+
+# Etapas da tabela principal: {nome: (consulta, dependências)}. As dependências são
+# tabelas de origem ou outras etapas; cada etapa é persistida em `etapas.<nome>` (a
+# tabela_final, em `main`) e só é recalculada quando a consulta ou uma dependência muda.
+ETAPAS_PRINCIPAL = {
+    'leitos': ("""
+        SELECT 
+            rec.CO_UNIDADE,
+            SUM(rec.QT_EXIST) leitos_existentes,
+            SUM(rec.QT_SUS) leitos_sus
+        FROM
+            rlestabcomplementar_ano rec
         --	JOIN 
         --		main.tbatributo ta
         --	ON
         --		rec.CO_TIPO_LEITO = ta.CO_ATRIBUTO
-            WHERE
-                rec.data_competencia = '2022-12-01'
-                AND rec.CO_UNIDADE IN (
-                    SELECT 
-                        DISTINCT CO_UNIDADE 
-                    FROM 
-                        main.tbestabelecimento te
-                    WHERE
-                        te.CO_MOTIVO_DESAB = ''
-                )
-            GROUP BY ALL
-        ),
-        tabela_completa AS (
-            SELECT
-                tm.CO_SIGLA_ESTADO,
-                tm.CO_MUNICIPIO,
-                tm.NO_MUNICIPIO,
-                te.TP_GESTAO,
-                tte.DS_TIPO_ESTABELECIMENTO,
-                ta.DS_ATIVIDADE,
-                ta.DS_CONCEITO_ATIVIDADE,
-                l.leitos_existentes,
-                l.leitos_sus,
-                ttu.DS_TIPO_UNIDADE,
-                te.CO_UNIDADE,
-                te.CO_CNES,
-                te.NO_RAZAO_SOCIAL,
-                te.NO_FANTASIA,
-                te.TP_ESTAB_SEMPRE_ABERTO,
-                te.CO_MOTIVO_DESAB
-            FROM
-                main.tbestabelecimento te
-            LEFT JOIN
-                main.tbmunicipio tm
-                ON te.CO_MUNICIPIO_GESTOR = tm.CO_MUNICIPIO
-            LEFT JOIN
-                main.tbtipounidade ttu
-                ON ttu.CO_TIPO_UNIDADE = te.TP_UNIDADE
-            LEFT JOIN
-                main.tbtipoestabelecimento tte
-                ON te.CO_TIPO_ESTABELECIMENTO = tte.CO_TIPO_ESTABELECIMENTO
-            LEFT JOIN
-                main.tbatividade ta
-                ON te.CO_ATIVIDADE_PRINCIPAL = ta.CO_ATIVIDADE
-            LEFT JOIN
-                leitos l
-                ON l.CO_UNIDADE = te.CO_UNIDADE
-            WHERE
-                te.CO_MOTIVO_DESAB = ''
-        ),
-        obitos_por_estabelecimento AS (
-            SELECT 
-                o.CODESTAB, 
-                COUNT(*) qtd_obitos 
-            FROM 
-                main.tb_mortalidade_2022 o
-            GROUP BY 
-                o.CODESTAB
-        ),
-        estabelecimentos_com_obitos AS (
-            SELECT 
-                tc.*,
-                o.qtd_obitos 
-            FROM 
-                tabela_completa tc
-            LEFT JOIN 
-                obitos_por_estabelecimento o 
-            ON 
-                tc.CO_CNES = TRY_CAST(o.CODESTAB AS INTEGER)
-        ),
-        obitos_total AS (
-            SELECT 
-                tm.CO_MUNICIPIO codigo,
-                COUNT(*) total_obitos
-            FROM 
-                main.tb_mortalidade_2022 o 
-            JOIN
-                main.tbmunicipio tm 
-            ON
-                o.CODMUNOCOR = tm.CO_MUNICIPIO
-            WHERE
-                tm.CO_MUNICIPIO IS NOT NULL
-            GROUP BY
-                ALL
-        ),
-        estabelecimentos_com_leito AS (
-            SELECT
-                tc.CO_MUNICIPIO,
-                COUNT(*) quantidade_unidades_com_leito
-            FROM
-                tabela_completa tc
-            WHERE
-                tc.leitos_existentes > 0
-            GROUP BY ALL
-        ),
-        estabelecimentos_por_municipio AS (
-            SELECT 
-                te.CO_MUNICIPIO_GESTOR,
-                COUNT(*) quantidade_unidades
-            FROM 
-                main.tbestabelecimento te
-            GROUP BY ALL
-        ),
-        socio_economicos AS (
-            SELECT
-                i.uf,
-                i.codigo_municipio,
-                i.nome,
-                (i.populacao_residente / e.quantidade_unidades) hab_por_unidade,
-                (e.quantidade_unidades / i.populacao_residente) unidades_por_hab,
-                (e.quantidade_unidades / i.populacao_residente) * 1000 unidades_por_k_hab,
-                e.quantidade_unidades,
-                i.area_km2 area_territorial,
-                i.populacao_residente populacao,
-                i.densidade_demografica,
-                i.escolarizacao_6_14 matriculas_ensino_medio,
-                i.idhm idh,
-                i.total_receitas_brutas_realizadas total_receitas_brutas,
-                i.total_despesas_brutas_empenhadas total_despesas_brutas,
-                i.pib_per_capita,
-                i.mortalidade_infantil
-            FROM 
-                main.tb_cidades_ibge_2022 i
-            JOIN 
-                estabelecimentos_por_municipio e
-            ON 
-                i.codigo_municipio = e.CO_MUNICIPIO_GESTOR
-        ),
-        profissionais AS (
-            SELECT 
-                tchs.CO_UNIDADE codigo_unidade,
-                te.NO_FANTASIA nome_fantasia,
-                tm.CO_MUNICIPIO codigo_municipio,
-                tm.NO_MUNICIPIO municipio,
-                tm.CO_SIGLA_ESTADO uf,
-                tchs.CO_PROFISSIONAL_SUS codigo_profissional,
-                tap.DS_ATIVIDADE_PROFISSIONAL atividade_profissional,
-                tap.TP_CLASSIFICACAO_PROFISSIONAL classificacao_profissional,
-                tap.TP_CBO_SAUDE cbo_saude,
-                tchs.TP_SUS_NAO_SUS sus
-            FROM main.tbcargahorariasus tchs 
-            JOIN
-                main.tbestabelecimento te
-            ON
-                te.CO_UNIDADE = tchs.CO_UNIDADE
-            JOIN 
-                main.tbatividadeprofissional tap 
-            ON
-                tap.CO_CBO = tchs.CO_CBO
-            JOIN
-                main.tbmunicipio tm
-            ON
-                tm.CO_MUNICIPIO = te.CO_MUNICIPIO_GESTOR
-        ),
-        medicos AS (
-            SELECT 
-                codigo_municipio, 
-                COUNT(DISTINCT codigo_profissional) AS qtd_medicos
-            FROM 
-                profissionais
-            WHERE 
-                atividade_profissional ILIKE '%medic%'
-            GROUP BY codigo_municipio
-        ),
-        enfermeiros AS (
-            SELECT
-                codigo_municipio,
-                COUNT(DISTINCT codigo_profissional) AS qtd_enfermeiros
-            FROM 
-                profissionais
-            WHERE 
-                atividade_profissional ILIKE '%enfermei%'
-            GROUP BY 
-                codigo_municipio
-        ),
-        tabela_final AS (
+        WHERE
+            rec.data_competencia = '{competencia}'
+            AND rec.CO_UNIDADE IN (
+                SELECT 
+                    DISTINCT CO_UNIDADE 
+                FROM 
+                    tbestabelecimento_ano te
+                WHERE
+                    te.CO_MOTIVO_DESAB = ''
+            )
+        GROUP BY ALL
+    """, ['rlestabcomplementar', 'tbestabelecimento']),
+    'tabela_completa': ("""
+        SELECT
+            tm.CO_SIGLA_ESTADO,
+            tm.CO_MUNICIPIO,
+            tm.NO_MUNICIPIO,
+            tm.cod_mun6,
+            te.TP_GESTAO,
+            tte.DS_TIPO_ESTABELECIMENTO,
+            ta.DS_ATIVIDADE,
+            ta.DS_CONCEITO_ATIVIDADE,
+            l.leitos_existentes,
+            l.leitos_sus,
+            ttu.DS_TIPO_UNIDADE,
+            te.CO_UNIDADE,
+            te.CO_CNES,
+            te.NO_RAZAO_SOCIAL,
+            te.NO_FANTASIA,
+            te.TP_ESTAB_SEMPRE_ABERTO,
+            te.CO_MOTIVO_DESAB
+        FROM
+            tbestabelecimento_ano te
+        LEFT JOIN
+            tbmunicipio_ano tm
+            ON te.cod_mun6 = tm.cod_mun6
+        LEFT JOIN
+            tbtipounidade_ano ttu
+            ON ttu.CO_TIPO_UNIDADE = te.TP_UNIDADE
+        LEFT JOIN
+            tbtipoestabelecimento_ano tte
+            ON te.CO_TIPO_ESTABELECIMENTO = tte.CO_TIPO_ESTABELECIMENTO
+        LEFT JOIN
+            tbatividade_ano ta
+            ON te.CO_ATIVIDADE_PRINCIPAL = ta.CO_ATIVIDADE
+        LEFT JOIN
+            etapas.leitos l
+            ON l.CO_UNIDADE = te.CO_UNIDADE
+        WHERE
+            te.CO_MOTIVO_DESAB = ''
+    """, ['tbestabelecimento', 'tbmunicipio', 'tbtipounidade', 'tbtipoestabelecimento', 'tbatividade', 'leitos']),
+    'obitos_por_estabelecimento': ("""
+        SELECT 
+            o.CODESTAB, 
+            CAST(SUM(o.qtd_obitos) AS BIGINT) qtd_obitos 
+        FROM 
+            tb_obitos_estabelecimento_ano o
+        GROUP BY 
+            o.CODESTAB
+    """, ['tb_obitos_estabelecimento']),
+    'estabelecimentos_com_obitos': ("""
+        SELECT 
+            tc.*,
+            o.qtd_obitos 
+        FROM 
+            etapas.tabela_completa tc
+        LEFT JOIN 
+            etapas.obitos_por_estabelecimento o 
+        ON 
+            tc.CO_CNES = o.CODESTAB
+    """, ['tabela_completa', 'obitos_por_estabelecimento']),
+    'obitos_total': ("""
+        SELECT 
+            tm.cod_mun6,
+            CAST(SUM(o.qtd_obitos) AS BIGINT) total_obitos
+        FROM 
+            tb_obitos_municipio_ocorrencia_ano o 
+        JOIN
+            tbmunicipio_ano tm 
+        ON
+            o.cod_mun6 = tm.cod_mun6
+        WHERE
+            tm.cod_mun6 IS NOT NULL
+        GROUP BY
+            ALL
+    """, ['tb_obitos_municipio_ocorrencia', 'tbmunicipio']),
+    'estabelecimentos_com_leito': ("""
+        SELECT
+            tc.cod_mun6,
+            COUNT(*) quantidade_unidades_com_leito
+        FROM
+            etapas.tabela_completa tc
+        WHERE
+            tc.leitos_existentes > 0
+        GROUP BY ALL
+    """, ['tabela_completa']),
+    'estabelecimentos_por_municipio': ("""
+        SELECT 
+            te.cod_mun6,
+            COUNT(*) quantidade_unidades
+        FROM 
+            tbestabelecimento_ano te
+        GROUP BY ALL
+    """, ['tbestabelecimento']),
+    'socio_economicos': ("""
+        SELECT
+            i.uf,
+            i.codigo_municipio,
+            i.cod_mun6,
+            i.nome,
+            (i.populacao_residente / e.quantidade_unidades) hab_por_unidade,
+            (e.quantidade_unidades / i.populacao_residente) unidades_por_hab,
+            (e.quantidade_unidades / i.populacao_residente) * 1000 unidades_por_k_hab,
+            e.quantidade_unidades,
+            i.area_km2 area_territorial,
+            i.populacao_residente populacao,
+            i.densidade_demografica,
+            i.escolarizacao_6_14 matriculas_ensino_medio,
+            i.idhm idh,
+            i.total_receitas_brutas_realizadas total_receitas_brutas,
+            i.total_despesas_brutas_empenhadas total_despesas_brutas,
+            i.pib_per_capita,
+            i.mortalidade_infantil
+        FROM 
+            main.tb_cidades_ibge_2022 i
+        JOIN 
+            etapas.estabelecimentos_por_municipio e
+        ON 
+            i.cod_mun6 = e.cod_mun6
+    """, ['tb_cidades_ibge_2022', 'estabelecimentos_por_municipio']),
+    'profissionais': ("""
+        SELECT 
+            tchs.CO_UNIDADE codigo_unidade,
+            te.NO_FANTASIA nome_fantasia,
+            tm.cod_mun6,
+            tm.NO_MUNICIPIO municipio,
+            tm.CO_SIGLA_ESTADO uf,
+            tchs.CO_PROFISSIONAL_SUS codigo_profissional,
+            tap.DS_ATIVIDADE_PROFISSIONAL atividade_profissional,
+            tap.TP_CLASSIFICACAO_PROFISSIONAL classificacao_profissional,
+            tap.TP_CBO_SAUDE cbo_saude,
+            tchs.TP_SUS_NAO_SUS sus
+        FROM tbcargahorariasus_ano tchs 
+        JOIN
+            tbestabelecimento_ano te
+        ON
+            te.CO_UNIDADE = tchs.CO_UNIDADE
+        JOIN 
+            tbatividadeprofissional_ano tap 
+        ON
+            tap.CO_CBO = tchs.CO_CBO
+        JOIN
+            tbmunicipio_ano tm
+        ON
+            tm.cod_mun6 = te.cod_mun6
+    """, ['tbcargahorariasus', 'tbestabelecimento', 'tbatividadeprofissional', 'tbmunicipio']),
+    'medicos': ("""
+        SELECT 
+            cod_mun6, 
+            COUNT(DISTINCT codigo_profissional) AS qtd_medicos
+        FROM 
+            etapas.profissionais
+        WHERE 
+            atividade_profissional ILIKE '%medic%'
+        GROUP BY cod_mun6
+    """, ['profissionais']),
+    'enfermeiros': ("""
+        SELECT
+            cod_mun6,
+            COUNT(DISTINCT codigo_profissional) AS qtd_enfermeiros
+        FROM 
+            etapas.profissionais
+        WHERE 
+            atividade_profissional ILIKE '%enfermei%'
+        GROUP BY 
+            cod_mun6
+    """, ['profissionais']),
+    'estabelecimentos_municipio': ("""
+        SELECT
+            cod_mun6,
+            COUNT(DISTINCT CO_UNIDADE) qtd_unidades,
+            CAST(SUM(leitos_existentes) AS BIGINT) leitos_existentes,
+            CAST(SUM(leitos_sus) AS BIGINT) leitos_sus,
+            CAST(SUM(qtd_obitos) AS BIGINT) obitos_em_estabelecimentos
+        FROM
+            etapas.estabelecimentos_com_obitos
+        GROUP BY
+            cod_mun6
+    """, ['estabelecimentos_com_obitos']),
+    'tabela_final': ("""
+        SELECT 
+            se.uf,
+            se.codigo_municipio,
+            em.cod_mun6,
+            se.nome,
+            se.populacao,
+            se.idh,
+            em.qtd_unidades,
+            ROUND(se.hab_por_unidade, 2) hab_por_unidade,
+            em.qtd_unidades / se.populacao * 1000 unidades_por_k_hab,
+            ((m.qtd_medicos / se.populacao) * 1000) medicos_por_k_habitante,
+            (se.populacao / m.qtd_medicos) habitantes_por_medico,
+            ((e.qtd_enfermeiros / se.populacao) * 1000) enfermeiros_por_k_habitante,
+            (se.populacao / e.qtd_enfermeiros) habitantes_por_enfermeiros,
+            em.leitos_existentes,
+            ecl.quantidade_unidades_com_leito,
+            (ecl.quantidade_unidades_com_leito / se.populacao * 1000) quantidade_unidades_com_leito_por_k_hab,
+            ROUND(em.leitos_existentes / em.qtd_unidades, 2) total_leitos_unidade,
+            (em.leitos_existentes / se.populacao * 1000) leitos_por_k_hab,
+            em.leitos_sus,
+            ROUND(em.leitos_sus / em.qtd_unidades, 2) total_leitos_sus_unidade,
+            (em.leitos_sus / se.populacao * 1000) leitos_sus_por_k_hab,
+            ROUND(em.obitos_em_estabelecimentos / em.qtd_unidades, 2) obitos_por_unidade,
+            em.obitos_em_estabelecimentos,
+            ot.total_obitos total_obitos,
+            ROUND((ot.total_obitos / se.populacao) * 1000, 2) taxa_mortalidade_geral,
+            se.mortalidade_infantil,
+            se.area_territorial,
+            se.densidade_demografica,
+            se.matriculas_ensino_medio,
+            se.total_receitas_brutas,
+            se.total_despesas_brutas,
+            se.pib_per_capita,
+            a.total taxa_de_alfabetizados,
+            (100 - a.total) taxa_de_nao_alfabetizados,
+            cdl.pct_coletado pct_coleta_lixo,
+            lre.sim pct_com_rede_esgoto,
+            lre.nao pct_sem_rede_esgoto,
+            mae.total media_anos_estudo_geral,
+            mae."11_14" media_anos_estudo_11_14,
+            mae."15_17" media_anos_estudo_15_17,
+            mae."18_24" media_anos_estudo_18_24,
+            mae."25_mais" media_anos_estudo_25_mais,
+            ni.sem_instrucao_fundamental_incompleto taxa_adultos_sem_instrucao,
+            ni.fundamental_completo_medio_incompleto taxa_adultos_fundamental_completo,
+            ni.medio_completo_superior_incompleto taxa_adultos_medio_completo,
+            ni.superior_completo taxa_adultos_superior_completo,
+            tde.pct_60_mais pct_idoso,
+            prf.total / se.populacao taxa_pop_residente_favela,
+            tsd.urbana taxa_populacao_urbana,
+            tsd.rural taxa_populacao_rural,
+            tfe.total taxa_freq_escolar
+        FROM 
+            etapas.estabelecimentos_municipio em
+        LEFT JOIN
+            etapas.socio_economicos se
+        ON
+            se.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            etapas.obitos_total ot
+        ON
+            ot.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.taxa_de_alfabetizacao a
+        ON
+            a.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.taxa_coleta_lixo cdl
+        ON
+            cdl.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.taxa_rede_esgoto lre 
+        ON
+            lre.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.anos_de_estudo mae 
+        ON
+            mae.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.taxa_populacao_nivel_instrucao ni 
+        ON
+            ni.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.pop_res_favela prf
+        ON
+            prf.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.taxa_situacao_domicilio tsd 
+        ON
+            tsd.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.taxa_frequencia_escolar tfe
+        ON
+            tfe.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            main.taxa_distribuicao_etaria tde
+        ON
+            tde.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            etapas.medicos m
+        ON
+            m.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            etapas.enfermeiros e
+        ON
+            e.cod_mun6 = em.cod_mun6
+        LEFT JOIN
+            etapas.estabelecimentos_com_leito ecl
+        ON 
+            ecl.cod_mun6 = em.cod_mun6
+    """, [
+        'estabelecimentos_municipio', 'socio_economicos', 'obitos_total', 'medicos',
+        'enfermeiros', 'estabelecimentos_com_leito', *TABELAS_IBGE_MUNICIPIO
+    ]),
+    'unidades_por_tipo': ("""
+        SELECT
+            cod_mun6,
+            DS_TIPO_UNIDADE,
+            COUNT(*) qtd_unidades
+        FROM etapas.tabela_completa
+        GROUP BY ALL
+    """, ['tabela_completa']),
+}
+
+# Tabela final montada no grão de estabelecimento, como antes da pré-agregação por
+# município; serve de referência para conferir_paridade_tabela_final
+CONSULTA_TABELA_FINAL_ESTABELECIMENTOS = """
         SELECT 
             se.uf,
             se.codigo_municipio,
+            eco.cod_mun6,
             se.nome,
             se.populacao,
             se.idh,
@@ -336,16 +775,16 @@ def carregar_tabela_principal():
             (se.populacao / m.qtd_medicos) habitantes_por_medico,
             ((e.qtd_enfermeiros / se.populacao) * 1000) enfermeiros_por_k_habitante,
             (se.populacao / e.qtd_enfermeiros) habitantes_por_enfermeiros,
-            SUM(leitos_existentes) leitos_existentes,
+            CAST(SUM(leitos_existentes) AS BIGINT) leitos_existentes,
             ecl.quantidade_unidades_com_leito,
             (SUM(ecl.quantidade_unidades_com_leito) / SUM(se.populacao) * 1000) quantidade_unidades_com_leito_por_k_hab,
             ROUND(SUM(leitos_existentes) / COUNT(DISTINCT CO_UNIDADE), 2) total_leitos_unidade,
             (SUM(leitos_existentes) / MAX(se.populacao) * 1000) leitos_por_k_hab,
-            SUM(leitos_sus) leitos_sus,
+            CAST(SUM(leitos_sus) AS BIGINT) leitos_sus,
             ROUND(SUM(leitos_sus) / COUNT(DISTINCT CO_UNIDADE), 2) total_leitos_sus_unidade,
             (SUM(leitos_sus) / MAX(se.populacao) * 1000) leitos_sus_por_k_hab,
             ROUND(SUM(qtd_obitos) / COUNT(DISTINCT CO_UNIDADE), 2) obitos_por_unidade,
-            SUM(qtd_obitos) obitos_em_estabelecimentos,
+            CAST(SUM(qtd_obitos) AS BIGINT) obitos_em_estabelecimentos,
             ot.total_obitos total_obitos,
             ROUND((ot.total_obitos / se.populacao) * 1000, 2) taxa_mortalidade_geral,
             se.mortalidade_infantil,
@@ -375,136 +814,327 @@ def carregar_tabela_principal():
             tsd.rural taxa_populacao_rural,
             tfe.total taxa_freq_escolar
         FROM 
-            estabelecimentos_com_obitos eco
+            etapas.estabelecimentos_com_obitos eco
         LEFT JOIN
-            socio_economicos se
+            etapas.socio_economicos se
         ON
-            se.codigo_municipio = eco.CO_MUNICIPIO
+            se.cod_mun6 = eco.cod_mun6
         LEFT JOIN
-            obitos_total ot
+            etapas.obitos_total ot
         ON
-            ot.codigo = eco.CO_MUNICIPIO
+            ot.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.taxa_de_alfabetizacao a
         ON
-            SUBSTRING(a.codigo, 1, 6) = eco.CO_MUNICIPIO
+            a.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.taxa_coleta_lixo cdl
         ON
-            SUBSTRING(cdl.codigo, 1, 6) = eco.CO_MUNICIPIO
+            cdl.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.taxa_rede_esgoto lre 
         ON
-            SUBSTRING(lre.codigo, 1, 6) = eco.CO_MUNICIPIO
+            lre.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.anos_de_estudo mae 
         ON
-            SUBSTRING(mae.codigo, 1, 6) = eco.CO_MUNICIPIO
+            mae.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.taxa_populacao_nivel_instrucao ni 
         ON
-            SUBSTRING(ni.codigo, 1, 6) = eco.CO_MUNICIPIO
+            ni.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.pop_res_favela prf
         ON
-            SUBSTRING(prf.codigo, 1, 6) = eco.CO_MUNICIPIO
+            prf.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.taxa_situacao_domicilio tsd 
         ON
-            SUBSTRING(tsd.codigo, 1, 6) = eco.CO_MUNICIPIO
+            tsd.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.taxa_frequencia_escolar tfe
         ON
-            SUBSTRING(tfe.codigo, 1, 6) = eco.CO_MUNICIPIO
+            tfe.cod_mun6 = eco.cod_mun6
         LEFT JOIN
             main.taxa_distribuicao_etaria tde
         ON
-            SUBSTRING(tde.codigo, 1, 6) = eco.CO_MUNICIPIO
+            tde.cod_mun6 = eco.cod_mun6
         LEFT JOIN
-            medicos m
+            etapas.medicos m
         ON
-            m.codigo_municipio = eco.CO_MUNICIPIO
+            m.cod_mun6 = eco.cod_mun6
         LEFT JOIN
-            enfermeiros e
+            etapas.enfermeiros e
         ON
-            e.codigo_municipio = eco.CO_MUNICIPIO
+            e.cod_mun6 = eco.cod_mun6
         LEFT JOIN
-            estabelecimentos_com_leito ecl
+            etapas.estabelecimentos_com_leito ecl
         ON 
-            ecl.CO_MUNICIPIO = eco.CO_MUNICIPIO
+            ecl.cod_mun6 = eco.cod_mun6
         GROUP BY ALL
-        ), pivotada AS (
-        SELECT *
-        FROM (
-            SELECT
-                CO_MUNICIPIO,
-                NO_MUNICIPIO,
-                DS_TIPO_UNIDADE,
-                COUNT(*) qtd_unidades
-            FROM tabela_completa
-            GROUP BY ALL
+"""
+
+# View larga com uma coluna por tipo de unidade, gerada do catálogo sobre `etapas.unidades_por_tipo`
+VISAO_TIPOS_UNIDADE = 'unidades_por_tipo_pivot'
+
+def _tabela_etapa(nome: str) -> str:
+    return 'main.tabela_final' if nome == 'tabela_final' else f'{ESQUEMA_ETAPAS}.{nome}'
+
+def _impressao_origem(conn, tabela, ano):
+    """
+    Impressão dos arquivos da partição do ano (ou do arquivo único) da tabela de origem,
+    a partir do controle de cargas. None se a tabela não passou pelo controle.
+    """
+    linhas = conn.execute(
+        f"SELECT particao, impressao FROM {TABELA_CONTROLE} WHERE tabela = ? AND particao IN (?, '') ORDER BY particao",
+        (tabela, str(ano))
+    ).fetchall()
+    return hashlib.sha256(repr(linhas).encode('utf-8')).hexdigest() if linhas else None
+
+def atualizar_etapas(conn, ano=ANO, etapas=ETAPAS_PRINCIPAL, forcar=False) -> list:
+    """
+    Recalcula, na ordem das dependências, só as etapas desatualizadas.
+
+    A impressão de cada etapa combina a consulta, o ano e as impressões das dependências
+    (as de origem vêm de `_controle_cargas`), e fica em `_controle_etapas`. Uma etapa é
+    recalculada quando a impressão mudou, quando a tabela não existe ou quando alguma
+    origem não tem impressão conhecida (ex.: tabelas no modo 'visao'). Assim, novos dados
+    de mortalidade refazem só `obitos_*` e o que depende deles, sem reprocessar
+    `profissionais` sobre o tbcargahorariasus.
+
+    Returns:
+        list: Nomes das etapas recalculadas.
+    """
+    ano = int(ano)
+    competencia = competencia_referencia(ano)
+
+    _garantir_controle(conn)
+    conn.execute(f"CREATE SCHEMA IF NOT EXISTS {ESQUEMA_ETAPAS}")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_CONTROLE_ETAPAS} (
+            etapa TEXT PRIMARY KEY,
+            impressao TEXT,
+            linhas BIGINT,
+            atualizado_em TIMESTAMP
         )
-        PIVOT (
-            SUM(qtd_unidades)
-            FOR DS_TIPO_UNIDADE IN (
-        'CENTRO DE SAUDE/UNIDADE BASICA',
-        'UNIDADE DE APOIO DIAGNOSE E TERAPIA (SADT ISOLADO)',
-        'CENTRO DE ATENCAO PSICOSSOCIAL',
-        'PRONTO ATENDIMENTO',
-        'TELESSAUDE',
-        'CENTRO DE ATENCAO HEMOTERAPIA E OU HEMATOLOGICA',
-        'LABORATORIO DE SAUDE PUBLICA',
-        '"CENTRAL DE NOTIFICACAO,CAPTACAO E DISTRIB DE ORGAOS ESTADUAL"',
-        'CENTRO DE PARTO NORMAL - ISOLADO',
-        'UNIDADE DE VIGILANCIA EM SAUDE',
-        'CENTRAL DE REGULACAO DO ACESSO',
-        'SERVICO DE ATENCAO DOMICILIAR ISOLADO(HOME CARE)',
-        'UNIDADE MOVEL FLUVIAL',
-        'PRONTO SOCORRO ESPECIALIZADO',
-        'OFICINA ORTOPEDICA',
-        'POLO ACADEMIA DA SAUDE',
-        'FARMACIA',
-        'CENTRAL DE REGULACAO MEDICA DAS URGENCIAS',
-        'UNIDADE MOVEL TERRESTRE',
-        'UNIDADE DE ATENCAO EM REGIME RESIDENCIAL',
-        'PRONTO SOCORRO GERAL',
-        'CONSULTORIO ISOLADO',
-        'CENTRAL DE GESTAO EM SAUDE',
-        'COOPERATIVA OU EMPRESA DE CESSAO DE TRABALHADORES NA SAUDE',
-        'HOSPITAL/DIA - ISOLADO',
-        'HOSPITAL ESPECIALIZADO',
-        'CLINICA/CENTRO DE ESPECIALIDADE',
-        'UNIDADE DE ATENCAO A SAUDE INDIGENA',
-        'POLO DE PREVENCAO DE DOENCAS E AGRAVOS E PROMOCAO DA SAUDE',
-        'LABORATORIO CENTRAL DE SAUDE PUBLICA LACEN',
-        'CENTRAL DE ABASTECIMENTO',
-        'CENTRO DE IMUNIZACAO',
-        'UNIDADE MOVEL DE NIVEL PRE-HOSPITALAR NA AREA DE URGENCIA',
-        'CENTRO DE APOIO A SAUDE DA FAMILIA',
-        'HOSPITAL GERAL',
-        'POLICLINICA',
-        'POSTO DE SAUDE',
-        'UNIDADE MISTA'
+    """)
+    for tabela in TABELAS_POR_ANO:
+        conn.execute(f"CREATE OR REPLACE TEMP VIEW {tabela}_ano AS SELECT * FROM main.{tabela} WHERE ano = {ano}")
+
+    registradas = dict(conn.execute(f"SELECT etapa, impressao FROM {TABELA_CONTROLE_ETAPAS}").fetchall())
+    grafo = {nome: [d for d in dependencias if d in etapas] for nome, (_, dependencias) in etapas.items()}
+
+    impressoes = {}
+    recalculadas = []
+    for nome in TopologicalSorter(grafo).static_order():
+        consulta, dependencias = etapas[nome]
+        consulta = consulta.format(ano=ano, competencia=competencia)
+
+        partes = [consulta, str(ano)]
+        for dependencia in dependencias:
+            impressao = impressoes[dependencia] if dependencia in etapas else _impressao_origem(conn, dependencia, ano)
+            partes.append(f'{dependencia}={impressao}')
+        desconhecida = any(p.endswith('=None') for p in partes[2:])
+        impressoes[nome] = None if desconhecida else hashlib.sha256('\n'.join(partes).encode('utf-8')).hexdigest()
+
+        esquema, tabela = _tabela_etapa(nome).split('.')
+        if (not forcar and impressoes[nome] is not None and registradas.get(nome) == impressoes[nome]
+                and _tabela_existe(conn, tabela, esquema)):
+            logger.info(f"Etapa {nome}: sem alterações.")
+            continue
+
+        inicio = time.perf_counter()
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(f"CREATE OR REPLACE TABLE {_tabela_etapa(nome)} AS {consulta}")
+            linhas = conn.execute(f"SELECT COUNT(*) FROM {_tabela_etapa(nome)}").fetchone()[0]
+            conn.execute(
+                f"INSERT OR REPLACE INTO {TABELA_CONTROLE_ETAPAS} VALUES (?, ?, ?, current_timestamp)",
+                (nome, impressoes[nome], linhas)
             )
-        )), tabela_completa_pivot AS (
-        SELECT * FROM tabela_final tf
-        JOIN pivotada p
-        ON tf.codigo_municipio = p.CO_MUNICIPIO
-        )
-        SELECT * FROM tabela_final
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        recalculadas.append(nome)
+        logger.info(f"Etapa {nome}: {linhas} linhas em {time.perf_counter() - inicio:.2f}s")
+
+    return recalculadas
+
+def conferir_paridade_tabela_final(conn, ano=ANO) -> bool:
+    """
+    Confere se a tabela_final, pré-agregada por município antes dos joins com o IBGE, é
+    idêntica à montada no grão de estabelecimento (CONSULTA_TABELA_FINAL_ESTABELECIMENTOS):
+    mesmas colunas e tipos e mesmas linhas, comparadas com EXCEPT ALL nos dois sentidos.
+    As etapas são atualizadas antes da comparação.
+    """
+    atualizar_etapas(conn, ano)
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE tabela_final_referencia AS {CONSULTA_TABELA_FINAL_ESTABELECIMENTOS}")
+
+    colunas = [
+        conn.execute(f"SELECT column_name, column_type FROM (DESCRIBE {tabela})").fetchall()
+        for tabela in ('main.tabela_final', 'tabela_final_referencia')
+    ]
+    if colunas[0] != colunas[1]:
+        logger.error(f"tabela_final com colunas ou tipos diferentes da referência: {set(colunas[0]) ^ set(colunas[1])}")
+        return False
+
+    so_final, so_referencia = conn.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM (SELECT * FROM main.tabela_final EXCEPT ALL SELECT * FROM tabela_final_referencia)),
+            (SELECT COUNT(*) FROM (SELECT * FROM tabela_final_referencia EXCEPT ALL SELECT * FROM main.tabela_final))
+    """).fetchone()
+    if so_final or so_referencia:
+        logger.error(f"tabela_final difere da referência: {so_final} linha(s) só na final, {so_referencia} só na referência.")
+        return False
+
+    logger.info("tabela_final idêntica à montada no grão de estabelecimento.")
+    return True
+
+def criar_visao_tipos_unidade(conn, ano=ANO) -> list:
+    """
+    Recria a view `unidades_por_tipo_pivot`: uma linha por município (`cod_mun6`) e uma
+    coluna com a quantidade de unidades de cada DS_TIPO_UNIDADE do catálogo tbTipoUnidade
+    do ano. As contagens vêm da etapa em formato longo `etapas.unidades_por_tipo`, que só
+    guarda as combinações existentes; tipos sem unidades no município ficam nulos.
+
+    Returns:
+        list: Tipos de unidade que viraram colunas.
+    """
+    tipos = [tipo for (tipo,) in conn.execute("""
+        SELECT DS_TIPO_UNIDADE
+        FROM main.tbtipounidade
+        WHERE ano = ? AND DS_TIPO_UNIDADE IS NOT NULL
+        GROUP BY DS_TIPO_UNIDADE
+        ORDER BY MIN(CO_TIPO_UNIDADE)
+    """, (int(ano),)).fetchall()]
+
+    colunas = ['cod_mun6']
+    for tipo in tipos:
+        literal = "'" + tipo.replace("'", "''") + "'"
+        identificador = '"' + tipo.replace('"', '""') + '"'
+        colunas.append(f"CAST(SUM(qtd_unidades) FILTER (WHERE DS_TIPO_UNIDADE = {literal}) AS BIGINT) {identificador}")
+
+    conn.execute(f"""
+        CREATE OR REPLACE VIEW {VISAO_TIPOS_UNIDADE} AS
+        SELECT {', '.join(colunas)}
+        FROM {ESQUEMA_ETAPAS}.unidades_por_tipo
+        GROUP BY cod_mun6
     """)
+    return tipos
 
-    logger.info("Tabela Final criada e populada com sucesso no DuckDB!")
+EXTENSOES_EXPORTACAO = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': 'csv'}
+
+def _escritores_exportacao(pilha, temporarios, esquema, compressao, linhas_por_grupo) -> list:
+    """
+    Abre, na `pilha` (ExitStack), um escritor pyarrow por formato de `temporarios`
+    ({formato: caminho}) e devolve as funções que gravam um lote em cada um.
+    """
+    gravar = []
+    for formato, temporario in temporarios.items():
+        if formato == 'parquet':
+            escritor = pilha.enter_context(pq.ParquetWriter(
+                temporario, esquema, compression=None if compressao.lower() == 'uncompressed' else compressao
+            ))
+            gravar.append(lambda lote, e=escritor: e.write_batch(lote, row_group_size=linhas_por_grupo))
+        elif formato == 'csv':
+            gravar.append(pilha.enter_context(pa_csv.CSVWriter(temporario, esquema)).write_batch)
+        else:
+            opcoes = pa.ipc.IpcWriteOptions(compression=compressao if compressao in ('zstd', 'lz4') else None)
+            arquivo = pilha.enter_context(pa.OSFile(temporario, 'wb'))
+            gravar.append(pilha.enter_context(pa.ipc.new_file(arquivo, esquema, options=opcoes)).write_batch)
+    return gravar
 
-    # Garante que o diretório 'tabela_final' existe
-    os.makedirs(DIRS['TABELA_FINAL'], exist_ok=True)
+def exportar_consulta(conn, consulta, destino, formatos=EXPORTACAO_FORMATOS, compressao=EXPORTACAO_COMPRESSAO,
+                      linhas_por_grupo=EXPORTACAO_LINHAS_GRUPO, ordenacao=EXPORTACAO_ORDENACAO) -> dict:
+    """
+    Exporta o resultado da consulta sem passar pelo pandas. Um único formato Parquet ou
+    CSV é gravado pelo `COPY` do DuckDB; nos demais casos a consulta (com a ordenação)
+    roda uma só vez e cada lote de registros (record batch) vai para os escritores de
+    todos os formatos, sem materializar a tabela inteira na memória do Python. Colunas
+    HUGEINT saem como DOUBLE em todos os formatos, como no `COPY`.
+
+    Args:
+        destino (str): Caminho sem extensão; cada formato recebe a sua (ex.: '.parquet').
+        formatos (list): 'parquet', 'arrow' e/ou 'csv'.
+        compressao (str): Codec do Parquet (ex.: 'zstd', 'snappy') e do IPC ('zstd' ou
+            'lz4'; outros valores gravam o IPC sem compressão).
+        linhas_por_grupo (int): Linhas por row group do Parquet e por lote do IPC.
+        ordenacao (list): Colunas de ordenação das linhas.
+
+    Returns:
+        dict: {formato: caminho gravado}
+    """
+    invalidos = set(formatos) - set(EXTENSOES_EXPORTACAO)
+    if invalidos:
+        raise ValueError(f"Formato(s) de exportação inválido(s): {sorted(invalidos)} (use {list(EXTENSOES_EXPORTACAO)}).")
+
+    ordem = f" ORDER BY {', '.join(ordenacao)}" if ordenacao else ''
+
+    os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+    caminhos = {formato: f"{destino}.{EXTENSOES_EXPORTACAO[formato]}" for formato in dict.fromkeys(formatos)}
+    temporarios = {formato: f"{caminho}.tmp" for formato, caminho in caminhos.items()}
+
+    if len(caminhos) == 1 and 'arrow' not in caminhos:
+        formato, temporario = next(iter(temporarios.items()))
+        literal = "'" + temporario.replace("'", "''") + "'"
+        consulta = f"SELECT * FROM ({consulta}){ordem}"
+        if formato == 'parquet':
+            conn.execute(f"COPY ({consulta}) TO {literal} (FORMAT PARQUET, COMPRESSION {compressao}, ROW_GROUP_SIZE {int(linhas_por_grupo)})")
+        else:
+            conn.execute(f"COPY ({consulta}) TO {literal} (FORMAT CSV, HEADER)")
+    elif caminhos:
+        colunas = conn.execute(f"SELECT column_name, column_type FROM (DESCRIBE {consulta})").fetchall()
+        selecao = ', '.join(
+            f'CAST("{nome}" AS DOUBLE) AS "{nome}"' if tipo == 'HUGEINT' else f'"{nome}"'
+            for nome, tipo in ((nome.replace('"', '""'), tipo) for nome, tipo in colunas)
+        )
+        resultado = conn.execute(f"SELECT {selecao} FROM ({consulta}){ordem}")
+        # to_arrow_reader substitui o fetch_record_batch (obsoleto) nas versões novas do DuckDB
+        leitor = getattr(resultado, 'to_arrow_reader', resultado.fetch_record_batch)(linhas_por_grupo)
+        with ExitStack() as pilha:
+            gravar = _escritores_exportacao(pilha, temporarios, leitor.schema, compressao, linhas_por_grupo)
+            for lote in leitor:
+                for gravar_lote in gravar:
+                    gravar_lote(lote)
+
+    for formato, caminho in caminhos.items():
+        os.replace(temporarios[formato], caminho)
+    return caminhos
+
+def carregar_tabela_principal(ano=ANO, com_tipos_unidade=False):
+    """
+    Atualiza as etapas da tabela principal do ano e exporta a tabela_final nos formatos
+    de EXPORTACAO_FORMATOS (ver `exportar_consulta`).
+
+    Com `com_tipos_unidade`, exporta também `tabela_completa_pivot.parquet`: a
+    tabela_final com as colunas de quantidade por tipo de unidade (ver
+    `criar_visao_tipos_unidade`), usada na clusterização.
+    """
+    logger.info(f"Carregando tabela principal de {ano} no DuckDB...")
+    conn = conectar_duckdb()
+
+    ano = int(ano)
+    registrar_municipios_sem_par(conn, ano)
+
+    recalculadas = atualizar_etapas(conn, ano)
+    logger.info(f"{len(recalculadas)} de {len(ETAPAS_PRINCIPAL)} etapa(s) recalculada(s).")
+
+    logger.info("Tabela Final criada e populada com sucesso no DuckDB!")
 
-    # Lê a tabela final do DuckDB como DataFrame
-    logger.info("Exportando tabela final para Parquet...")
-    df = conn.execute("SELECT * FROM tabela_final").fetchdf()  # fetchdf() retorna um pandas DataFrame
+    logger.info("Exportando tabela final...")
+    inicio = time.perf_counter()
+    caminhos = exportar_consulta(conn, "SELECT * FROM main.tabela_final", f"{DIRS['TABELA_FINAL']}/tabela_final")
+    logger.info(f"Tabela final salva em {', '.join(caminhos.values())} ({time.perf_counter() - inicio:.2f}s)!")
 
-    # Salva o DataFrame em arquivo Parquet
-    df.to_parquet(f"{DIRS['TABELA_FINAL']}/tabela_final.parquet", index=False)
+    if com_tipos_unidade:
+        tipos = criar_visao_tipos_unidade(conn, ano)
+        caminhos = exportar_consulta(conn, f"""
+            SELECT tf.*, p.* EXCLUDE (cod_mun6)
+            FROM main.tabela_final tf
+            LEFT JOIN {VISAO_TIPOS_UNIDADE} p
+                ON p.cod_mun6 = tf.cod_mun6
+        """, f"{DIRS['TABELA_FINAL']}/tabela_completa_pivot")
+        logger.info(f"Tabela final com {len(tipos)} tipo(s) de unidade salva em {', '.join(caminhos.values())}!")
 
-    logger.info(f"Arquivo Parquet salvo com sucesso em '{DIRS['TABELA_FINAL']}/tabela_final.parquet'!")
     conn.close()
\ No newline at end of file
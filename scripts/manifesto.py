@@ -0,0 +1,202 @@
+# scripts/manifesto.py
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from ftplib import error_perm
+from fnmatch import fnmatch
+from scripts.configs import MANIFESTO_PATH
+
+def carregar_manifesto(caminho: str = MANIFESTO_PATH) -> dict:
+    """
+    Lê o manifesto de downloads. Retorna um manifesto vazio se o arquivo não existir.
+
+    O manifesto tem três seções:
+    - 'arquivos': arquivos remotos baixados (tamanho e data de modificação no FTP + hash local);
+    - 'tabelas': tabelas extraídas de cada arquivo (caminho local + hash do conteúdo);
+    - 'etapas': por etapa do pipeline, a impressão das entradas de cada unidade
+      processada (ver `etapa_atualizada`).
+
+    Toda entrada de 'arquivos' e 'tabelas' guarda `alterado_em`, atualizado somente
+    quando o conteúdo muda.
+    """
+    if not os.path.exists(caminho):
+        return {'arquivos': {}, 'tabelas': {}, 'etapas': {}}
+
+    with open(caminho, encoding='utf-8') as f:
+        manifesto = json.load(f)
+
+    manifesto.setdefault('arquivos', {})
+    manifesto.setdefault('tabelas', {})
+    manifesto.setdefault('etapas', {})
+    return manifesto
+
+def salvar_manifesto(manifesto: dict, caminho: str = MANIFESTO_PATH):
+    """
+    Grava o manifesto de forma atômica (arquivo temporário + rename).
+    """
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    temporario = f'{caminho}.tmp'
+    try:
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, indent=2, ensure_ascii=False, sort_keys=True)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    os.replace(temporario, caminho)
+
+def calcular_hash(caminho: str, tamanho_bloco: int = 1024 * 1024) -> str:
+    """
+    Calcula o SHA-256 de um arquivo lendo-o em blocos.
+    """
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def listar_arquivos_remotos(ftp, padrao: str = '*') -> dict:
+    """
+    Lista os arquivos do diretório atual do FTP com tamanho e data de modificação.
+
+    Usa MLSD quando o servidor suporta; caso contrário, recorre a NLST + SIZE + MDTM.
+
+    Returns:
+        dict: {nome: {'tamanho': int | None, 'modificado': str | None}}
+    """
+    remotos = {}
+    try:
+        for nome, fatos in ftp.mlsd(facts=['type', 'size', 'modify']):
+            if fatos.get('type', 'file') != 'file' or not fnmatch(nome, padrao):
+                continue
+            remotos[nome] = {
+                'tamanho': int(fatos['size']) if 'size' in fatos else None,
+                'modificado': fatos.get('modify')
+            }
+        return remotos
+    except error_perm:
+        pass
+
+    nomes = ftp.nlst()
+    # SIZE só é aceito em modo binário, e o NLST volta a conexão para ASCII
+    ftp.voidcmd('TYPE I')
+    for nome in nomes:
+        nome = os.path.basename(nome)
+        if not fnmatch(nome, padrao):
+            continue
+        try:
+            modificado = ftp.sendcmd(f'MDTM {nome}').split()[-1]
+        except error_perm:
+            modificado = None
+        remotos[nome] = {'tamanho': ftp.size(nome), 'modificado': modificado}
+
+    return remotos
+
+def arquivo_alterado(manifesto: dict, nome: str, info_remota: dict) -> bool:
+    """
+    Indica se um arquivo remoto precisa ser baixado novamente: é novo, mudou de tamanho
+    ou de data no FTP, ou alguma tabela extraída dele não existe mais em disco.
+    """
+    registro = manifesto['arquivos'].get(nome)
+    if registro is None:
+        return True
+
+    if (registro.get('tamanho'), registro.get('modificado')) != (info_remota.get('tamanho'), info_remota.get('modificado')):
+        return True
+
+    tabelas = [t for t in manifesto['tabelas'].values() if t.get('origem') == nome]
+    return not tabelas or any(not os.path.exists(t['caminho']) for t in tabelas)
+
+def _registrar(secao: dict, nome: str, dados: dict) -> bool:
+    agora = datetime.now().isoformat(timespec='seconds')
+    anterior = secao.get(nome, {})
+    alterado = anterior.get('sha256') != dados.get('sha256')
+
+    secao[nome] = {
+        **dados,
+        'registrado_em': agora,
+        'alterado_em': agora if alterado else anterior.get('alterado_em', agora)
+    }
+    return alterado
+
+def registrar_arquivo(manifesto: dict, nome: str, info_remota: dict, caminho_local: str) -> bool:
+    """
+    Registra um arquivo baixado com os metadados remotos e o hash do conteúdo local.
+
+    Returns:
+        bool: True se o conteúdo é novo ou diferente do registrado anteriormente.
+    """
+    return _registrar(manifesto['arquivos'], nome, {
+        'tamanho': info_remota.get('tamanho'),
+        'modificado': info_remota.get('modificado'),
+        'sha256': calcular_hash(caminho_local)
+    })
+
+def registrar_tabela(manifesto: dict, nome_tabela: str, caminho: str, origem: str) -> bool:
+    """
+    Registra uma tabela extraída (CSV ou Parquet) com o hash do seu conteúdo.
+
+    Returns:
+        bool: True se o conteúdo é novo ou diferente do registrado anteriormente.
+    """
+    return _registrar(manifesto['tabelas'], nome_tabela, {
+        'caminho': caminho,
+        'origem': origem,
+        'sha256': calcular_hash(caminho)
+    })
+
+def impressao_arquivos(arquivos) -> str:
+    """
+    Resume caminho, tamanho e data de modificação dos arquivos (SHA-256), sem ler o
+    conteúdo. Muda quando algum arquivo é regravado, incluído ou removido.
+    """
+    h = hashlib.sha256()
+    for arquivo in sorted(arquivos):
+        info = os.stat(arquivo)
+        h.update(f'{os.path.abspath(arquivo)}|{info.st_size}|{info.st_mtime_ns}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+def impressao_tabela(manifesto: dict, caminho: str) -> str:
+    """
+    Impressão de uma tabela extraída: o hash do conteúdo registrado no download, se o
+    arquivo está no manifesto com esse caminho; senão, `impressao_arquivos`.
+    """
+    nome = os.path.splitext(os.path.basename(caminho))[0].lower()
+    registro = manifesto['tabelas'].get(nome)
+    if registro is not None and os.path.normpath(registro['caminho']) == os.path.normpath(caminho):
+        return registro['sha256']
+    return impressao_arquivos([caminho])
+
+def etapa_atualizada(manifesto: dict, etapa: str, unidade: str, impressao: str | None, saidas=()) -> bool:
+    """
+    Indica se a unidade (ex.: 'tbestado/2022') da etapa já foi processada a partir das
+    mesmas entradas (`impressao`) e se as suas saídas ainda existem em disco.
+    Sem impressão (entradas desconhecidas), a unidade é sempre processada.
+    """
+    registro = manifesto['etapas'].get(etapa, {}).get(unidade)
+    return (
+        impressao is not None
+        and registro is not None
+        and registro['impressao'] == impressao
+        and all(os.path.exists(saida) for saida in saidas)
+    )
+
+def registrar_etapa(manifesto: dict, etapa: str, unidade: str, impressao: str | None):
+    """
+    Registra que a unidade da etapa foi processada a partir das entradas com `impressao`.
+    """
+    manifesto['etapas'].setdefault(etapa, {})[unidade] = {
+        'impressao': impressao,
+        'processado_em': datetime.now().isoformat()
+    }
+
+def impressao_etapa(manifesto: dict, etapa: str, unidade: str) -> str | None:
+    """
+    Impressão da saída de uma unidade já processada, para as etapas que a leem: muda
+    sempre que a unidade é processada de novo. None se a unidade não foi registrada.
+    """
+    registro = manifesto['etapas'].get(etapa, {}).get(unidade)
+    if registro is None:
+        return None
+    return f"{registro['impressao']}@{registro['processado_em']}"
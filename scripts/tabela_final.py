@@ -1,37 +1,28 @@
 """
-Constrói a mesma `tabela_final` da Query Principal usando **Polars (Lazy)**,
+Constrói a mesma `tabela_final` da Query Principal (etapas de
+`scripts.load_database.ETAPAS_PRINCIPAL`) usando **Polars (Lazy)**,
 sem depender do DuckDB para a etapa de agregação final.
 
 Pré‑requisitos (diretórios conforme `scripts/configs.py`):
-- DIRS['CONCAT_CNES']  → parquets CNES deduplicados (ex.: tbestabelecimento_2022.parquet ...)
-- DIRS['FINAL_CIDADES']→ tb_cidades_ibge_2022.parquet
-- DIRS['FINAL_MORTALIDADE'] → mortalidade_2022.parquet
+- DIRS['CONCAT_CNES']  → datasets CNES deduplicados, particionados por ano (ex.: tbestabelecimento/ano=2022/ ...)
+- DIRS['FINAL_CIDADES']→ cidades_ibge_2022.parquet
+- DIRS['FINAL_MORTALIDADE'] → agregados obitos_estabelecimento/ e obitos_municipio_ocorrencia/ (ano=AAAA/)
 - DIRS['FINAL_IBGE']   → parquets adicionais do IBGE (taxas etc.)
 
-Saída:
-- `data/tabela_final/tabela_final.parquet` (mesmo path usado no seu pipeline)
-- opcional: CSV em `data/tabela_final/tabela_final.csv`
+Uso:
+- `construir_tabela_final(ano)` devolve o plano (LazyFrame), sem executá-lo;
+- `gerar_tabela_final(ano, caminho)` executa e grava o Parquet;
+- como script, grava `data/tabela_final/tabela_final.parquet` e o CSV ao lado.
+
+Como na versão SQL, os fatos dos estabelecimentos são agregados por município
+(`cod_mun6`) antes dos joins 1:1 com as tabelas socioeconômicas.
 """
 from __future__ import annotations
 import os
 import polars as pl
 
-# -----------------------------------------------------------------------------
-# Config: tenta importar seus caminhos; caso não encontre, usa defaults locais
-# -----------------------------------------------------------------------------
-try:
-    from scripts.configs import DIRS, ANO
-except Exception:
-    DIRS = {
-        'CONCAT_CNES': 'data/cnes_concatenados',
-        'FINAL_CIDADES': 'data/cidades_final',
-        'FINAL_MORTALIDADE': 'data/mortalidade_final',
-        'FINAL_IBGE': 'data/ibge_final',
-        'TABELA_FINAL': 'data/tabela_final',
-    }
-    ANO = '2022'
-
-os.makedirs(DIRS['TABELA_FINAL'], exist_ok=True)
+from scripts.configs import DIRS, ANO, EXPORTACAO_ORDENACAO
+from scripts.utils import competencia_referencia
 
 # -----------------------------------------------------------------------------
 # Helpers
@@ -43,6 +34,16 @@ def readp(*parts: str) -> pl.LazyFrame:
     return pl.scan_parquet(path)
 
 
+def read_dataset(base: str, tabela: str, ano: int) -> pl.LazyFrame:
+    """Lê a partição `ano=AAAA` de um dataset particionado (Hive) em LazyFrame."""
+    path = os.path.join(base, tabela, "**", "*.parquet")
+    return (
+        pl.scan_parquet(path, hive_partitioning=True)
+          .filter(pl.col("ano") == ano)
+          .drop("ano")
+    )
+
+
 def safe_read_ibge(name_no_ext: str) -> pl.LazyFrame:
     """Tenta ler um parquet do diretório FINAL_IBGE com diferentes variações de nome."""
     candidates = [
@@ -57,315 +58,287 @@ def safe_read_ibge(name_no_ext: str) -> pl.LazyFrame:
     raise FileNotFoundError(f"Parquet IBGE não encontrado para base: {name_no_ext}")
 
 
-# -----------------------------------------------------------------------------
-# Carregamentos principais (Lazy)
-# -----------------------------------------------------------------------------
+def soma_sql(coluna: str) -> pl.Expr:
+    """SUM do SQL: nulo quando todos os valores do grupo são nulos (no Polars a soma daria 0)."""
+    return pl.when(pl.col(coluna).count() > 0).then(pl.col(coluna).sum())
+
+
+def contar_distintos(coluna: str) -> pl.Expr:
+    """COUNT(DISTINCT) do SQL, que ignora nulos."""
+    return pl.col(coluna).drop_nulls().n_unique()
 
-estab = readp(DIRS['CONCAT_CNES'], f"tbestabelecimento_{ANO}.parquet")
-mun   = readp(DIRS['CONCAT_CNES'], f"tbmunicipio_{ANO}.parquet")
-mun = mun.with_columns(
-    pl.col("CO_MUNICIPIO").cast(pl.Utf8)
-)
-atu   = readp(DIRS['CONCAT_CNES'], f"tbatividade_{ANO}.parquet")
-atu = atu.with_columns(
-    pl.col('CO_ATIVIDADE').cast(pl.Utf8)
-)
-uni   = readp(DIRS['CONCAT_CNES'], f"tbtipounidade_{ANO}.parquet")
-test  = readp(DIRS['CONCAT_CNES'], f"tbtipoestabelecimento_{ANO}.parquet")
-test = test.with_columns(
-    pl.col("CO_TIPO_ESTABELECIMENTO").cast(pl.Utf8)
-)
-rl    = readp(DIRS['CONCAT_CNES'], f"rlestabcomplementar_{ANO}.parquet")
-prof  = readp(DIRS['CONCAT_CNES'], f"tbatividadeprofissional_{ANO}.parquet")
-chs   = readp(DIRS['CONCAT_CNES'], f"tbcargahorariasus_{ANO}.parquet")
-
-mortal = readp(DIRS['FINAL_MORTALIDADE'], "mortalidade_2022.parquet")
-cidades = readp(DIRS['FINAL_CIDADES'], "cidades_ibge_2022.parquet")
-
-# Tabelas IBGE adicionais (nomes conforme usados na SQL)
-ibge_taxa_alf = safe_read_ibge("taxa_de_alfabetizacao")
-ibge_coleta   = safe_read_ibge("taxa_coleta_lixo")
-ibge_esgoto   = safe_read_ibge("taxa_rede_esgoto")
-ibge_estudo   = safe_read_ibge("anos_de_estudo")
-ibge_instr    = safe_read_ibge("taxa_populacao_nivel_instrucao")
-ibge_favela   = safe_read_ibge("pop_res_favela")
-ibge_dom      = safe_read_ibge("taxa_situacao_domicilio")
-ibge_freq     = safe_read_ibge("taxa_frequencia_escolar")
-ibge_etaria   = safe_read_ibge("taxa_distribuicao_etaria")
 
 # -----------------------------------------------------------------------------
-# CTE: leitos (apenas estabelecimentos ativos, competência 2022-12-01)
+# Plano da tabela final
 # -----------------------------------------------------------------------------
 
-estab_ativos = estab.filter(pl.col("CO_MOTIVO_DESAB") == "")
+def construir_tabela_final(ano=ANO) -> pl.LazyFrame:
+    """
+    Monta o plano Lazy da tabela_final do ano, com as mesmas colunas, na mesma ordem,
+    da etapa `tabela_final` do DuckDB.
+    """
+    ano = int(ano)
+    competencia = competencia_referencia(ano)
+
+    estab = read_dataset(DIRS['CONCAT_CNES'], "tbestabelecimento", ano)
+    mun   = read_dataset(DIRS['CONCAT_CNES'], "tbmunicipio", ano)
+    atu   = read_dataset(DIRS['CONCAT_CNES'], "tbatividade", ano)
+    uni   = read_dataset(DIRS['CONCAT_CNES'], "tbtipounidade", ano)
+    test  = read_dataset(DIRS['CONCAT_CNES'], "tbtipoestabelecimento", ano)
+    rl    = read_dataset(DIRS['CONCAT_CNES'], "rlestabcomplementar", ano)
+    prof  = read_dataset(DIRS['CONCAT_CNES'], "tbatividadeprofissional", ano)
+    chs   = read_dataset(DIRS['CONCAT_CNES'], "tbcargahorariasus", ano)
+
+    # Joins por município usam a chave `cod_mun6` gravada na ingestão de cada fonte
+    obitos_estab = read_dataset(DIRS['FINAL_MORTALIDADE'], "obitos_estabelecimento", ano)
+    obitos_mun   = read_dataset(DIRS['FINAL_MORTALIDADE'], "obitos_municipio_ocorrencia", ano)
+    cidades = readp(DIRS['FINAL_CIDADES'], "cidades_ibge_2022.parquet")
+
+    # Tabelas IBGE adicionais, já com os nomes das colunas finais
+    ibge = [
+        safe_read_ibge("taxa_de_alfabetizacao").select("cod_mun6", pl.col("total").alias("taxa_de_alfabetizados")),
+        safe_read_ibge("taxa_coleta_lixo").select("cod_mun6", pl.col("pct_coletado").alias("pct_coleta_lixo")),
+        safe_read_ibge("taxa_rede_esgoto").select(
+            "cod_mun6", pl.col("sim").alias("pct_com_rede_esgoto"), pl.col("nao").alias("pct_sem_rede_esgoto")
+        ),
+        safe_read_ibge("anos_de_estudo").select(
+            "cod_mun6",
+            pl.col("total").alias("media_anos_estudo_geral"),
+            pl.col("11_14").alias("media_anos_estudo_11_14"),
+            pl.col("15_17").alias("media_anos_estudo_15_17"),
+            pl.col("18_24").alias("media_anos_estudo_18_24"),
+            pl.col("25_mais").alias("media_anos_estudo_25_mais"),
+        ),
+        safe_read_ibge("taxa_populacao_nivel_instrucao").select(
+            "cod_mun6",
+            pl.col("sem_instrucao_fundamental_incompleto").alias("taxa_adultos_sem_instrucao"),
+            pl.col("fundamental_completo_medio_incompleto").alias("taxa_adultos_fundamental_completo"),
+            pl.col("medio_completo_superior_incompleto").alias("taxa_adultos_medio_completo"),
+            pl.col("superior_completo").alias("taxa_adultos_superior_completo"),
+        ),
+        safe_read_ibge("pop_res_favela").select("cod_mun6", pl.col("total").alias("pop_res_favela")),
+        safe_read_ibge("taxa_situacao_domicilio").select(
+            "cod_mun6", pl.col("urbana").alias("taxa_populacao_urbana"), pl.col("rural").alias("taxa_populacao_rural")
+        ),
+        safe_read_ibge("taxa_frequencia_escolar").select("cod_mun6", pl.col("total").alias("taxa_freq_escolar")),
+        safe_read_ibge("taxa_distribuicao_etaria").select("cod_mun6", pl.col("pct_60_mais").alias("pct_idoso")),
+    ]
 
-leitos = (
-    rl.filter(pl.col("data_competencia") == "2022-12-01")
-      .join(estab_ativos.select("CO_UNIDADE").unique(), on="CO_UNIDADE", how="inner")
-      .group_by("CO_UNIDADE")
-      .agg([
-          pl.col("QT_EXIST").sum().alias("leitos_existentes"),
-          pl.col("QT_SUS").sum().alias("leitos_sus"),
-      ])
-)
+    # -------------------------------------------------------------------------
+    # leitos (apenas estabelecimentos ativos, última competência do ano)
+    # -------------------------------------------------------------------------
 
-# -----------------------------------------------------------------------------
-# CTE: tabela_completa
-# -----------------------------------------------------------------------------
+    estab_ativos = estab.filter(pl.col("CO_MOTIVO_DESAB") == "")
 
-# joins de dicionários
-estab_base = (
-    estab_ativos
-    .join(mun.select(["CO_MUNICIPIO", "NO_MUNICIPIO", "CO_SIGLA_ESTADO"]), left_on="CO_MUNICIPIO_GESTOR", right_on="CO_MUNICIPIO", how="left")
-    .join(uni.select(["CO_TIPO_UNIDADE", "DS_TIPO_UNIDADE"]), left_on="TP_UNIDADE", right_on="CO_TIPO_UNIDADE", how="left")
-    .join(test.select(["CO_TIPO_ESTABELECIMENTO", "DS_TIPO_ESTABELECIMENTO"]), on="CO_TIPO_ESTABELECIMENTO", how="left")
-    .join(atu.select(["CO_ATIVIDADE", "DS_ATIVIDADE", "DS_CONCEITO_ATIVIDADE"]), left_on="CO_ATIVIDADE_PRINCIPAL", right_on="CO_ATIVIDADE", how="left")
-    .join(leitos, on="CO_UNIDADE", how="left")
-)
+    leitos = (
+        rl.filter(pl.col("data_competencia") == competencia)
+          .join(estab_ativos.select("CO_UNIDADE"), on="CO_UNIDADE", how="semi")
+          .group_by("CO_UNIDADE")
+          .agg([
+              soma_sql("QT_EXIST").alias("leitos_existentes"),
+              soma_sql("QT_SUS").alias("leitos_sus"),
+          ])
+    )
 
-# -----------------------------------------------------------------------------
-# CTE: óbitos por estabelecimento e totais por município
-# -----------------------------------------------------------------------------
+    # -------------------------------------------------------------------------
+    # tabela_completa: estabelecimentos ativos com o município do tbMunicipio,
+    # dicionários e leitos; só as colunas usadas adiante
+    # -------------------------------------------------------------------------
+
+    tabela_completa = (
+        estab_ativos
+        .select(["CO_UNIDADE", "CO_CNES", "cod_mun6", "TP_UNIDADE", "CO_TIPO_ESTABELECIMENTO", "CO_ATIVIDADE_PRINCIPAL"])
+        .join(mun.select("cod_mun6"), on="cod_mun6", how="left", coalesce=False)
+        .drop("cod_mun6")
+        .rename({"cod_mun6_right": "cod_mun6"})
+        .join(uni.select("CO_TIPO_UNIDADE"), left_on="TP_UNIDADE", right_on="CO_TIPO_UNIDADE", how="left")
+        .join(test.select("CO_TIPO_ESTABELECIMENTO"), on="CO_TIPO_ESTABELECIMENTO", how="left")
+        .join(atu.select("CO_ATIVIDADE"), left_on="CO_ATIVIDADE_PRINCIPAL", right_on="CO_ATIVIDADE", how="left")
+        .join(leitos, on="CO_UNIDADE", how="left")
+    )
+
+    # -------------------------------------------------------------------------
+    # óbitos por estabelecimento e totais por município
+    # -------------------------------------------------------------------------
 
-obitos_por_estab = (
-    mortal
-    .group_by("CODESTAB")
-    .agg(pl.len().alias("qtd_obitos"))
-)
-
-# cuidado de tipos para join CO_CNES (int) vs CODESTAB (string)
-estab_com_obitos = (
-    estab_base
-    .with_columns(
-        pl.col("CO_CNES").cast(pl.Int64)
+    obitos_por_estab = (
+        obitos_estab
+        .group_by("CODESTAB")
+        .agg(soma_sql("qtd_obitos").cast(pl.Int64).alias("qtd_obitos"))
     )
-    .join(
-        obitos_por_estab.with_columns(pl.col("CODESTAB").cast(pl.Int64)),
-        left_on="CO_CNES", right_on="CODESTAB", how="left"
+
+    estab_com_obitos = (
+        tabela_completa
+        .join(obitos_por_estab, left_on="CO_CNES", right_on="CODESTAB", how="left")
     )
-)
 
-obitos_total = (
-    mortal
-    .join(mun.select(["CO_MUNICIPIO"]).unique(), left_on="CODMUNOCOR", right_on="CO_MUNICIPIO", how="inner")
-    .group_by("CO_MUNICIPIO")
-    .agg(pl.len().alias("total_obitos"))
-    # .rename({"CO_MUNICIPIO": "codigo"})
-)
+    obitos_total = (
+        obitos_mun
+        .join(mun.select("cod_mun6"), on="cod_mun6", how="inner")
+        .group_by("cod_mun6")
+        .agg(soma_sql("qtd_obitos").cast(pl.Int64).alias("total_obitos"))
+    )
 
-# -----------------------------------------------------------------------------
-# CTE: estabelecimentos com leito & por município
-# -----------------------------------------------------------------------------
+    # -------------------------------------------------------------------------
+    # fatos dos estabelecimentos agregados por município
+    # -------------------------------------------------------------------------
+
+    estab_municipio = (
+        estab_com_obitos
+        .group_by("cod_mun6")
+        .agg([
+            contar_distintos("CO_UNIDADE").cast(pl.Int64).alias("qtd_unidades"),
+            soma_sql("leitos_existentes").cast(pl.Int64).alias("leitos_existentes"),
+            soma_sql("leitos_sus").cast(pl.Int64).alias("leitos_sus"),
+            soma_sql("qtd_obitos").alias("obitos_em_estabelecimentos"),
+        ])
+    )
 
-estab_com_leito = (
-    estab_base.filter(pl.col("leitos_existentes") > 0)
-    .group_by("CO_MUNICIPIO")
-    .agg(pl.len().alias("quantidade_unidades_com_leito"))
-)
+    estab_com_leito = (
+        tabela_completa
+        .filter(pl.col("leitos_existentes") > 0)
+        .group_by("cod_mun6")
+        .agg(pl.len().cast(pl.Int64).alias("quantidade_unidades_com_leito"))
+    )
 
-estab_por_mun = (
-    estab.group_by("CO_MUNICIPIO_GESTOR").agg(pl.len().alias("quantidade_unidades"))
-)
+    estab_por_mun = (
+        estab.group_by("cod_mun6").agg(pl.len().alias("quantidade_unidades"))
+    )
 
-# -----------------------------------------------------------------------------
-# CTE: socio_economicos (join IBGE cidades + contagem de estabelecimentos)
-# -----------------------------------------------------------------------------
+    # -------------------------------------------------------------------------
+    # socio_economicos (join IBGE cidades + contagem de estabelecimentos)
+    # -------------------------------------------------------------------------
+
+    socio = (
+        cidades
+        .join(estab_por_mun, on="cod_mun6", how="inner")
+        .select([
+            pl.col("uf"),
+            pl.col("codigo_municipio").cast(pl.Utf8).str.slice(0, 6),
+            pl.col("cod_mun6"),
+            pl.col("nome"),
+            (pl.col("populacao_residente") / pl.col("quantidade_unidades")).alias("hab_por_unidade"),
+            pl.col("area_km2").alias("area_territorial"),
+            pl.col("populacao_residente").alias("populacao"),
+            pl.col("densidade_demografica"),
+            pl.col("escolarizacao_6_14").alias("matriculas_ensino_medio"),
+            pl.col("idhm").alias("idh"),
+            pl.col("total_receitas_brutas_realizadas").alias("total_receitas_brutas"),
+            pl.col("total_despesas_brutas_empenhadas").alias("total_despesas_brutas"),
+            pl.col("pib_per_capita"),
+            pl.col("mortalidade_infantil"),
+        ])
+    )
 
-socio = (
-    cidades
-    .join(estab_por_mun, left_on="codigo_municipio", right_on="CO_MUNICIPIO_GESTOR", how="inner")
-    .with_columns([
-        (pl.col("populacao_residente") / pl.col("quantidade_unidades")).alias("hab_por_unidade"),
-        (pl.col("quantidade_unidades") / pl.col("populacao_residente")).alias("unidades_por_hab"),
-        ((pl.col("quantidade_unidades") / pl.col("populacao_residente")) * 1000).alias("unidades_por_k_hab"),
-    ])
-    .select([
+    # -------------------------------------------------------------------------
+    # profissionais, médicos, enfermeiros
+    # -------------------------------------------------------------------------
+
+    profissionais = (
+        chs.select(["CO_UNIDADE", "CO_CBO", "CO_PROFISSIONAL_SUS"])
+        .join(estab.select(["CO_UNIDADE", "cod_mun6"]), on="CO_UNIDADE", how="inner")
+        .join(prof.select(["CO_CBO", "DS_ATIVIDADE_PROFISSIONAL"]), on="CO_CBO", how="inner")
+        .join(mun.select("cod_mun6"), on="cod_mun6", how="inner")
+    )
+
+    def contar_profissionais(trecho: str, nome: str) -> pl.LazyFrame:
+        return (
+            profissionais
+            .filter(pl.col("DS_ATIVIDADE_PROFISSIONAL").str.to_lowercase().str.contains(trecho, literal=True))
+            .group_by("cod_mun6")
+            .agg(contar_distintos("CO_PROFISSIONAL_SUS").alias(nome))
+        )
+
+    medicos = contar_profissionais("medic", "qtd_medicos")
+    enfermeiros = contar_profissionais("enfermei", "qtd_enfermeiros")
+
+    # -------------------------------------------------------------------------
+    # Montagem da tabela_final: uma linha por município, joins 1:1
+    # -------------------------------------------------------------------------
+
+    base = estab_municipio
+    for tabela in [socio, obitos_total, *ibge, medicos, enfermeiros, estab_com_leito]:
+        base = base.join(tabela, on="cod_mun6", how="left")
+
+    populacao = pl.col("populacao")
+    qtd_unidades = pl.col("qtd_unidades")
+
+    return base.select([
         pl.col("uf"),
         pl.col("codigo_municipio"),
+        pl.col("cod_mun6"),
         pl.col("nome"),
-        pl.col("hab_por_unidade"),
-        pl.col("unidades_por_hab"),
-        pl.col("unidades_por_k_hab"),
-        pl.col("quantidade_unidades"),
-        pl.col("area_km2").alias("area_territorial"),
-        pl.col("populacao_residente").alias("populacao"),
+        populacao,
+        pl.col("idh"),
+        qtd_unidades,
+        pl.col("hab_por_unidade").round(2),
+        (qtd_unidades / populacao * 1000).alias("unidades_por_k_hab"),
+        (pl.col("qtd_medicos") / populacao * 1000).alias("medicos_por_k_habitante"),
+        (populacao / pl.col("qtd_medicos")).alias("habitantes_por_medico"),
+        (pl.col("qtd_enfermeiros") / populacao * 1000).alias("enfermeiros_por_k_habitante"),
+        (populacao / pl.col("qtd_enfermeiros")).alias("habitantes_por_enfermeiros"),
+        pl.col("leitos_existentes"),
+        pl.col("quantidade_unidades_com_leito"),
+        (pl.col("quantidade_unidades_com_leito") / populacao * 1000).alias("quantidade_unidades_com_leito_por_k_hab"),
+        (pl.col("leitos_existentes") / qtd_unidades).round(2).alias("total_leitos_unidade"),
+        (pl.col("leitos_existentes") / populacao * 1000).alias("leitos_por_k_hab"),
+        pl.col("leitos_sus"),
+        (pl.col("leitos_sus") / qtd_unidades).round(2).alias("total_leitos_sus_unidade"),
+        (pl.col("leitos_sus") / populacao * 1000).alias("leitos_sus_por_k_hab"),
+        (pl.col("obitos_em_estabelecimentos") / qtd_unidades).round(2).alias("obitos_por_unidade"),
+        pl.col("obitos_em_estabelecimentos"),
+        pl.col("total_obitos"),
+        (pl.col("total_obitos") / populacao * 1000).round(2).alias("taxa_mortalidade_geral"),
+        pl.col("mortalidade_infantil"),
+        pl.col("area_territorial"),
         pl.col("densidade_demografica"),
-        pl.col("escolarizacao_6_14").alias("matriculas_ensino_medio"),
-        pl.col("idhm").alias("idh"),
-        pl.col("total_receitas_brutas_realizadas").alias("total_receitas_brutas"),
-        pl.col("total_despesas_brutas_empenhadas").alias("total_despesas_brutas"),
+        pl.col("matriculas_ensino_medio"),
+        pl.col("total_receitas_brutas"),
+        pl.col("total_despesas_brutas"),
         pl.col("pib_per_capita"),
-        pl.col("mortalidade_infantil"),
+        pl.col("taxa_de_alfabetizados"),
+        (100 - pl.col("taxa_de_alfabetizados")).alias("taxa_de_nao_alfabetizados"),
+        pl.col("pct_coleta_lixo"),
+        pl.col("pct_com_rede_esgoto"),
+        pl.col("pct_sem_rede_esgoto"),
+        pl.col("media_anos_estudo_geral"),
+        pl.col("media_anos_estudo_11_14"),
+        pl.col("media_anos_estudo_15_17"),
+        pl.col("media_anos_estudo_18_24"),
+        pl.col("media_anos_estudo_25_mais"),
+        pl.col("taxa_adultos_sem_instrucao"),
+        pl.col("taxa_adultos_fundamental_completo"),
+        pl.col("taxa_adultos_medio_completo"),
+        pl.col("taxa_adultos_superior_completo"),
+        pl.col("pct_idoso"),
+        (pl.col("pop_res_favela") / populacao).alias("taxa_pop_residente_favela"),
+        pl.col("taxa_populacao_urbana"),
+        pl.col("taxa_populacao_rural"),
+        pl.col("taxa_freq_escolar"),
     ])
-    .rename({'codigo_municipio': 'CO_MUNICIPIO'})
-)
 
-# -----------------------------------------------------------------------------
-# CTE: profissionais, médicos, enfermeiros
-# -----------------------------------------------------------------------------
 
-profissionais = (
-    chs
-    .join(estab.select(["CO_UNIDADE", "NO_FANTASIA", "CO_MUNICIPIO_GESTOR"]).rename({"NO_FANTASIA": "nome_fantasia"}), on="CO_UNIDADE", how="inner")
-    .join(prof.select(["CO_CBO", "DS_ATIVIDADE_PROFISSIONAL", "TP_CLASSIFICACAO_PROFISSIONAL", "TP_CBO_SAUDE"]).rename({
-        "DS_ATIVIDADE_PROFISSIONAL": "atividade_profissional",
-        "TP_CLASSIFICACAO_PROFISSIONAL": "classificacao_profissional",
-        "TP_CBO_SAUDE": "cbo_saude",
-    }), on="CO_CBO", how="inner")
-    .join(mun.select(["CO_MUNICIPIO", "NO_MUNICIPIO", "CO_SIGLA_ESTADO"]).rename({
-        "CO_MUNICIPIO": "codigo_municipio",
-        "NO_MUNICIPIO": "municipio",
-        "CO_SIGLA_ESTADO": "uf",
-    }), left_on="CO_MUNICIPIO_GESTOR", right_on="codigo_municipio", how="inner")
-    .select([
-        pl.col("CO_UNIDADE").alias("codigo_unidade"),
-        pl.col("nome_fantasia"),
-        pl.col("codigo_municipio"),
-        pl.col("municipio"),
-        pl.col("uf"),
-        pl.col("CO_PROFISSIONAL_SUS").alias("codigo_profissional"),
-        pl.col("atividade_profissional"),
-        pl.col("classificacao_profissional"),
-        pl.col("cbo_saude"),
-        pl.col("TP_SUS_NAO_SUS").alias("sus"),
-    ])
-)
-
-medicos = (
-    profissionais
-    .filter(pl.col("atividade_profissional").str.contains("(?i)medic", literal=False))
-    .group_by("codigo_municipio")
-    .agg(pl.col("codigo_profissional").n_unique().alias("qtd_medicos"))
-    .rename({'codigo_municipio': 'CO_MUNICIPIO'})
-)
-
-enfermeiros = (
-    profissionais
-    .filter(pl.col("atividade_profissional").str.contains("(?i)enfermei", literal=False))
-    .group_by("codigo_municipio")
-    .agg(pl.col("codigo_profissional").n_unique().alias("qtd_enfermeiros"))
-    .rename({'codigo_municipio': 'CO_MUNICIPIO'})
-)
+def gerar_tabela_final(ano=ANO, caminho=os.path.join(DIRS['TABELA_FINAL'], "tabela_final.parquet")) -> pl.DataFrame:
+    """
+    Executa o plano da tabela_final do ano e grava o Parquet, com as linhas na ordem de
+    EXPORTACAO_ORDENACAO (a mesma da exportação do DuckDB).
+    """
+    df_final = construir_tabela_final(ano).sort(EXPORTACAO_ORDENACAO, nulls_last=True).collect()
 
-# -----------------------------------------------------------------------------
-# Montagem da tabela_final (joins + agregações)
-# -----------------------------------------------------------------------------
-
-# PIVOT de tipos de unidade (contagem por município)
-pivot_unidades = (
-    estab_base
-    .select(["CO_MUNICIPIO", "DS_TIPO_UNIDADE"])
-    .with_columns(pl.col("DS_TIPO_UNIDADE").fill_null("DESCONHECIDO"))
-    .group_by(["CO_MUNICIPIO", "DS_TIPO_UNIDADE"])
-    .agg(pl.len().alias("qtd_unidades"))
-    .collect()  # vira DataFrame
-    .pivot(
-        index="CO_MUNICIPIO",
-        columns="DS_TIPO_UNIDADE",
-        values="qtd_unidades",
-        aggregate_function="sum",
-    )
-    .lazy()     # volta a ser LazyFrame pra poder fazer joins depois
-)
-
-# Bloco principal
-base_join = (
-    estab_com_obitos
-    .join(socio,         left_on="CO_MUNICIPIO", right_on="codigo_municipio", how="left")
-    .join(obitos_total,  left_on="CO_MUNICIPIO", right_on="codigo", how="left")
-    .join(ibge_taxa_alf, left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_coleta,   left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_esgoto,   left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_estudo,   left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_instr,    left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_favela,   left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_dom,      left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_freq,     left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(ibge_etaria,   left_on=pl.col("CO_MUNICIPIO").cast(pl.Utf8), right_on=pl.col("codigo").str.slice(0, 6), how="left")
-    .join(medicos,       left_on="CO_MUNICIPIO", right_on="codigo_municipio", how="left")
-    .join(enfermeiros,   left_on="CO_MUNICIPIO", right_on="codigo_municipio", how="left")
-    .join(estab_com_leito, on="CO_MUNICIPIO", how="left")
-)
-
-# Agregações finais por município
-agg = (
-    base_join
-    .group_by([
-        "uf", "codigo_municipio", "nome", "populacao", "idh",
-        "mortalidade_infantil", "area_territorial", "densidade_demografica",
-        "matriculas_ensino_medio", "total_receitas_brutas", "total_despesas_brutas",
-        "pib_per_capita"
-    ])
-    .agg([
-        pl.col("CO_UNIDADE").n_unique().alias("qtd_unidades"),
-        pl.col("hab_por_unidade").first().round(2),
-        (pl.col("CO_UNIDADE").n_unique() / pl.col("populacao").max() * 1000).alias("unidades_por_k_hab"),
-        ((pl.col("qtd_medicos") / pl.col("populacao")) * 1000).alias("medicos_por_k_habitante"),
-        (pl.col("populacao") / pl.col("qtd_medicos")).alias("habitantes_por_medico"),
-        ((pl.col("qtd_enfermeiros") / pl.col("populacao")) * 1000).alias("enfermeiros_por_k_habitante"),
-        (pl.col("populacao") / pl.col("qtd_enfermeiros")).alias("habitantes_por_enfermeiros"),
-        pl.col("leitos_existentes").sum().alias("leitos_existentes"),
-        pl.col("quantidade_unidades_com_leito").sum().alias("quantidade_unidades_com_leito"),
-        (pl.col("quantidade_unidades_com_leito").sum() / pl.col("populacao").sum() * 1000).alias("quantidade_unidades_com_leito_por_k_hab"),
-        (pl.col("leitos_existentes").sum() / pl.col("CO_UNIDADE").n_unique()).round(2).alias("total_leitos_unidade"),
-        (pl.col("leitos_existentes").sum() / pl.col("populacao").max() * 1000).alias("leitos_por_k_hab"),
-        pl.col("leitos_sus").sum().alias("leitos_sus"),
-        (pl.col("leitos_sus").sum() / pl.col("CO_UNIDADE").n_unique()).round(2).alias("total_leitos_sus_unidade"),
-        (pl.col("leitos_sus").sum() / pl.col("populacao").max() * 1000).alias("leitos_sus_por_k_hab"),
-        (pl.col("qtd_obitos").sum() / pl.col("CO_UNIDADE").n_unique()).round(2).alias("obitos_por_unidade"),
-        pl.col("qtd_obitos").sum().alias("obitos_em_estabelecimentos"),
-        pl.col("total_obitos").first().alias("total_obitos"),
-        ((pl.col("total_obitos") / pl.col("populacao")).first() * 1000).round(2).alias("taxa_mortalidade_geral"),
-        # Colunas IBGE adicionais (mantidas como first, pois 1:1 por município)
-        pl.col("total").first().alias("taxa_de_alfabetizados"),
-        (100 - pl.col("total").first()).alias("taxa_de_nao_alfabetizados"),
-        pl.col("pct_coletado").first().alias("pct_coleta_lixo"),
-        pl.col("sim").first().alias("pct_com_rede_esgoto"),
-        pl.col("nao").first().alias("pct_sem_rede_esgoto"),
-        pl.col("11_14").first().alias("media_anos_estudo_11_14"),
-        pl.col("15_17").first().alias("media_anos_estudo_15_17"),
-        pl.col("18_24").first().alias("media_anos_estudo_18_24"),
-        pl.col("25_mais").first().alias("media_anos_estudo_25_mais"),
-        pl.col("sem_instrucao_fundamental_incompleto").first().alias("taxa_adultos_sem_instrucao"),
-        pl.col("fundamental_completo_medio_incompleto").first().alias("taxa_adultos_fundamental_completo"),
-        pl.col("medio_completo_superior_incompleto").first().alias("taxa_adultos_medio_completo"),
-        pl.col("superior_completo").first().alias("taxa_adultos_superior_completo"),
-        pl.col("pct_60_mais").first().alias("pct_idoso"),
-        (pl.col("total")/pl.col("populacao").first()).alias("taxa_pop_residente_favela"),
-        pl.col("urbana").first().alias("taxa_populacao_urbana"),
-        pl.col("rural").first().alias("taxa_populacao_rural"),
-        pl.col("total_right").first().alias("taxa_freq_escolar"),
-        pl.col("total_left").first().alias("media_anos_estudo_geral"),
-    ])
-)
-
-# Observação: as colunas "total_left"/"total_right" acima podem variar conforme o schema
-# dos parquets IBGE. Se os nomes divergirem, ajuste os aliases conforme suas colunas reais.
-
-# Join com PIVOT dos tipos de unidade
-result = (
-    agg.join(
-        pivot_unidades,
-        left_on="codigo_municipio",
-        right_on="CO_MUNICIPIO",
-        how="left",
-    )
-)
-
-# -----------------------------------------------------------------------------
-# Materializa e salva
-# -----------------------------------------------------------------------------
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    df_final.write_parquet(caminho)
+    return df_final
 
-df_final = result.collect()
 
-out_parquet = os.path.join(DIRS['TABELA_FINAL'], "tabela_final.parquet")
-df_final.write_parquet(out_parquet)
+if __name__ == "__main__":
+    out_parquet = os.path.join(DIRS['TABELA_FINAL'], "tabela_final.parquet")
+    df_final = gerar_tabela_final(ANO, out_parquet)
 
-# opcional: CSV
-try:
-    out_csv = os.path.join(DIRS['TABELA_FINAL'], "tabela_final.csv")
-    df_final.write_csv(out_csv)
-except Exception:
-    pass
+    # opcional: CSV
+    try:
+        out_csv = os.path.join(DIRS['TABELA_FINAL'], "tabela_final.csv")
+        df_final.write_csv(out_csv)
+    except Exception:
+        pass
 
-print(f"OK! Salvo em: {out_parquet}")
+    print(f"OK! Salvo em: {out_parquet}")
@@ -1,8 +1,45 @@
 import os
+import csv
+import hashlib
 import logging
+import multiprocessing as mp
 import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import repeat
 import unicodedata
 import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from polars.io.plugins import register_io_source
+from scripts.configs import DIRS, ANO_INICIO, ANO_FIM, MESES, PLANILHAS_WORKERS
+from scripts.esquemas import aplicar_esquema, esquema_tabela, coluna_municipio
+
+# Tamanho do bloco lido por vez nos CSVs do CNES.
+# O leitor do PyArrow lê blocos à frente, então blocos maiores elevam o pico de memória.
+TAMANHO_BLOCO_CSV = 2 * 1024 * 1024
+
+# Versões dos leitores de planilhas, parte da chave do cache (ver `ler_planilhas`).
+# Incremente ao mudar o tratamento feito pelo leitor para que as planilhas sejam relidas.
+VERSAO_LEITOR_CIDADES = 1
+VERSAO_LEITOR_PLANILHA = 1
+
+# Versão da conversão dos CSVs mensais do CNES (tipos, colunas derivadas, `hash_linha`),
+# parte da impressão registrada no manifesto (ver `transformar_dados`).
+# Incremente ao mudar `converter_csv_cnes_para_parquet` para que os CSVs sejam reconvertidos.
+VERSAO_CONVERSAO_CNES = 1
+
+# Municípios cujo dígito verificador do código IBGE foge do cálculo padrão
+# (código de 6 dígitos → dígito verificador oficial)
+EXCECOES_DV_IBGE = {
+    220191: 9, 220198: 8, 220225: 1, 261153: 3, 311783: 6,
+    315213: 1, 430587: 1, 520393: 9, 520396: 2,
+}
+
+# Chaves normalizadas de município; derivadas de outra coluna, ficam fora do `hash_linha`
+COLUNAS_CODIGO_MUNICIPIO = ('cod_mun6', 'cod_mun7')
 
 def criar_pastas(pastas: list):
     """
@@ -36,24 +73,37 @@ def configurar_logger(nome_logger="engenharia_de_dados"):
     
     return logger
 
-def ler_arquivo_polars(caminho: str) -> pl.DataFrame:
+def ler_arquivo_polars(caminho: str, tabela: str | None = None) -> pl.DataFrame:
     """
     Lê um arquivo csv, xlsx ou Parquet usando Polars, de forma inteligente baseado na extensão.
 
+    Se `tabela` estiver no registro de esquemas (`scripts.esquemas`), as colunas declaradas
+    recebem os tipos do registro; CSVs dessas tabelas são lidos sem inferência de tipos.
+
     Args:
         caminho (str): Caminho completo do arquivo.
+        tabela (str, opcional): Nome da tabela do CNES (ex.: 'tbestabelecimento').
 
     Returns:
         pl.DataFrame: DataFrame lido.
     """
     extensao = os.path.splitext(caminho)[-1].lower()
+    declarada = tabela is not None and bool(esquema_tabela(tabela))
 
     if extensao == '.parquet':
-        return pl.read_parquet(caminho)
+        df = pl.read_parquet(caminho)
     elif extensao == '.xlsx':
-        return pl.read_excel(caminho)
+        df = pl.read_excel(caminho)
+    elif extensao == '.csv' and declarada:
+        df = pl.read_csv(
+                caminho,
+                separator=';',
+                encoding='latin1',
+                infer_schema=False,
+                low_memory=True
+            )
     elif extensao == '.csv':
-        return pl.read_csv(
+        df = pl.read_csv(
                 caminho, 
                 separator=';', 
                 encoding='latin1', 
@@ -65,6 +115,105 @@ def ler_arquivo_polars(caminho: str) -> pl.DataFrame:
             )
     else:
         raise ValueError(f"Extensão de arquivo não suportada: {extensao}")
+
+    return aplicar_esquema(df, tabela) if declarada else df
+
+def escanear_csv_cnes(fonte, tabela: str | None = None) -> pl.LazyFrame:
+    """
+    Cria um LazyFrame sobre um CSV do CNES (latin1, separado por ';') lido em blocos.
+
+    A fonte pode ser um caminho ou qualquer objeto binário com `read()`, como um membro
+    aberto com `ZipFile.open`. Os blocos são decodificados pelo leitor incremental do
+    PyArrow, então a memória usada fica limitada ao tamanho de um bloco. Como a fonte
+    é consumida em sequência, o LazyFrame só pode ser executado uma vez.
+
+    Todas as colunas são lidas como texto, sem inferência; com `tabela`, as colunas
+    declaradas no registro de esquemas são convertidas no próprio plano.
+
+    Args:
+        fonte (str | BinaryIO): Caminho do CSV ou stream binário.
+        tabela (str, opcional): Nome da tabela do CNES (ex.: 'tbestabelecimento').
+
+    Returns:
+        pl.LazyFrame: LazyFrame com os dados do CSV.
+    """
+    arquivo_proprio = isinstance(fonte, (str, os.PathLike))
+    if arquivo_proprio:
+        fonte = open(fonte, 'rb')
+
+    cabecalho = fonte.readline().decode('latin1').rstrip('\r\n')
+    colunas = next(csv.reader([cabecalho], delimiter=';'))
+
+    leitor = pacsv.open_csv(
+        fonte,
+        read_options=pacsv.ReadOptions(encoding='latin1', block_size=TAMANHO_BLOCO_CSV, column_names=colunas),
+        parse_options=pacsv.ParseOptions(delimiter=';'),
+        convert_options=pacsv.ConvertOptions(
+            column_types={coluna: pa.string() for coluna in colunas},
+            quoted_strings_can_be_null=False
+        )
+    )
+    schema = pl.from_arrow(leitor.schema.empty_table()).schema
+
+    def gerar_lotes(with_columns, predicate, n_rows, batch_size):
+        try:
+            for lote in leitor:
+                df = pl.from_arrow(lote)
+                if with_columns is not None:
+                    df = df.select(with_columns)
+                if predicate is not None:
+                    df = df.filter(predicate)
+                if n_rows is not None:
+                    df = df.head(n_rows)
+                    n_rows -= df.height
+                yield df
+                if n_rows == 0:
+                    break
+        finally:
+            if arquivo_proprio:
+                fonte.close()
+
+    lf = register_io_source(gerar_lotes, schema=schema)
+    return aplicar_esquema(lf, tabela) if tabela is not None else lf
+
+def converter_csv_cnes_para_parquet(fonte, nome_arquivo: str, caminho_parquet: str):
+    """
+    Converte um CSV mensal do CNES em Parquet em streaming, com memória constante.
+
+    O CSV é lido em blocos (`escanear_csv_cnes`) já com os tipos do registro de esquemas;
+    `data_competencia`, a correção dos municípios do DF, as chaves `cod_mun6`/`cod_mun7`
+    e o `hash_linha` entram no plano
+    como expressões lazy e o resultado é gravado com `sink_parquet`, sem materializar o
+    mês inteiro. Se a conversão falhar, `caminho_parquet` não é criado nem alterado.
+
+    Args:
+        fonte (str | BinaryIO): Caminho do CSV ou stream binário.
+        nome_arquivo (str): Nome original do CSV (ex.: 'tbEstabelecimento202212.csv').
+        caminho_parquet (str): Caminho do Parquet de saída.
+    """
+    nome_base = os.path.splitext(os.path.basename(nome_arquivo))[0].lower()
+    tabela, _, _ = separar_tabela_competencia(nome_arquivo)
+
+    lf = escanear_csv_cnes(fonte, tabela)
+    lf = adicionar_coluna_data(lf, nome_arquivo)
+
+    if 'CO_ESTADO_GESTOR' in lf.collect_schema().names():
+        lf = tratar_codigos_municipais(lf, nome_base)
+
+    if coluna := coluna_municipio(tabela):
+        lf = adicionar_codigos_municipio(lf, coluna)
+
+    lf = adicionar_hash_linha(lf)
+
+    # Grava à parte e só substitui o destino no final: uma falha não deixa Parquet incompleto
+    temporario = f'{caminho_parquet}.tmp'
+    try:
+        lf.sink_parquet(temporario)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, caminho_parquet)
     
 def limpar_nome_coluna(coluna: str) -> str:
     """
@@ -158,52 +307,454 @@ def ler_cidades_ibge(path_csv):
 
     return df
 
+def _resumo(*partes) -> str:
+    return hashlib.sha256('|'.join(map(str, partes)).encode('utf-8')).hexdigest()[:12]
+
+def caminho_cache_planilha(caminho, leitor, versao, pasta_cache=DIRS['CACHE_PLANILHAS']) -> str:
+    """
+    Caminho do Parquet em cache da planilha lida por `leitor`:
+    `pasta_cache/<nome>-<arquivo e leitor>-<data de modificação, tamanho e versão>.parquet`.
+    """
+    info = os.stat(caminho)
+    nome = os.path.splitext(os.path.basename(caminho))[0]
+    fonte = _resumo(os.path.abspath(caminho), leitor.__module__, leitor.__qualname__)
+    conteudo = _resumo(info.st_mtime_ns, info.st_size, versao)
+    return os.path.join(pasta_cache, f'{nome}-{fonte}-{conteudo}.parquet')
+
+def atualizar_cache_planilha(caminho, leitor, versao, pasta_cache=DIRS['CACHE_PLANILHAS']) -> str:
+    """
+    Lê a planilha com `leitor` e grava o resultado em cache, se ainda não estiver lá.
+    Versões antigas do cache da mesma planilha e leitor são removidas.
+
+    Returns:
+        str: Caminho do Parquet em cache.
+    """
+    destino = caminho_cache_planilha(caminho, leitor, versao, pasta_cache)
+    if os.path.exists(destino):
+        return destino
+
+    os.makedirs(pasta_cache, exist_ok=True)
+    temporario = f'{destino}.tmp'
+    leitor(caminho).write_parquet(temporario)
+    os.replace(temporario, destino)
+
+    prefixo = os.path.basename(destino).rsplit('-', 1)[0] + '-'
+    for antigo in os.listdir(pasta_cache):
+        if antigo.startswith(prefixo) and antigo != os.path.basename(destino):
+            os.remove(os.path.join(pasta_cache, antigo))
+
+    return destino
+
+def ler_planilhas(caminhos, leitor, versao, pasta_cache=DIRS['CACHE_PLANILHAS'], max_workers=PLANILHAS_WORKERS) -> list:
+    """
+    Lê várias planilhas com `leitor` (função de módulo que recebe o caminho e retorna
+    um DataFrame), na ordem de `caminhos`.
+
+    O resultado de cada planilha fica em cache como Parquet, com chave formada pelo
+    caminho, data de modificação e tamanho do arquivo e pela `versao` do leitor. Só as
+    planilhas sem cache válido são lidas de novo, em paralelo em `max_workers` processos.
+    """
+    caminhos = list(caminhos)
+    pendentes = [c for c in caminhos if not os.path.exists(caminho_cache_planilha(c, leitor, versao, pasta_cache))]
+
+    if pendentes:
+        print(f"Lendo {len(pendentes)} de {len(caminhos)} planilha(s); as demais vêm do cache.")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('spawn')) as executor:
+            list(executor.map(atualizar_cache_planilha, pendentes, repeat(leitor), repeat(versao), repeat(pasta_cache)))
+
+    return [pl.read_parquet(caminho_cache_planilha(c, leitor, versao, pasta_cache)) for c in caminhos]
+
 def tratar_codigos_municipais(df, nome_base):
     """
     Atribui a alguns municipios do Distrito Federal que não estão cadastrados no IBGE
-    o código 5300108, pois eles pertencem a Brasília.
+    o código 5300108, pois eles pertencem a Brasília. Aceita DataFrame ou LazyFrame
+    com os códigos já tipados pelo registro de esquemas.
     """
     codigos = [
-        '530170', '530040', '530060', '530180',
-        '530050', '530130', '530090', '530070',
-        '530080', '530120', '530135', '530100',
-        '530020', '530150'
+        530170, 530040, 530060, 530180,
+        530050, 530130, 530090, 530070,
+        530080, 530120, 530135, 530100,
+        530020, 530150
     ]
 
     print("Corrigindo Codigo dos Municípios do DF na tabela: ", nome_base)
-    df = df.with_columns([
-        pl.col('CO_ESTADO_GESTOR').cast(pl.Utf8),
-        pl.col('CO_MUNICIPIO_GESTOR').cast(pl.Utf8)
-    ])
-
     df = df.with_columns(
         pl.when(pl.col('CO_MUNICIPIO_GESTOR').is_in(codigos))
-        .then(pl.lit('530010'))
+        .then(pl.lit(530010, dtype=pl.Int32))
         .otherwise(pl.col('CO_MUNICIPIO_GESTOR'))
         .alias('CO_MUNICIPIO_GESTOR')
     )
 
     return df
 
+def codigo_municipio_6(coluna) -> pl.Expr:
+    """
+    Expressão com o código de município de 6 dígitos (Int32) a partir de uma coluna de
+    texto ou inteira com 6 ou 7 dígitos (o sétimo, verificador, é descartado). Valores
+    não numéricos viram nulo.
+    """
+    codigo = pl.col(coluna)
+    codigo = codigo.cast(pl.Utf8).str.strip_chars().cast(pl.Int64, strict=False)
+    return pl.when(codigo >= 1_000_000).then(codigo // 10).otherwise(codigo).cast(pl.Int32)
+
+def digito_verificador_ibge(cod_mun6: pl.Expr) -> pl.Expr:
+    """
+    Dígito verificador do código IBGE do município: pesos 1-2-1-2-1-2 sobre os 6 dígitos,
+    somando os algarismos de cada produto; o dígito completa a soma até a dezena
+    seguinte. Os municípios de EXCECOES_DV_IBGE usam o dígito oficial.
+
+    >>> df = pl.DataFrame({'c': [355030, 530010, 220191]}, schema={'c': pl.Int32})
+    >>> df.select(digito_verificador_ibge(pl.col('c'))).to_series().to_list()
+    [8, 8, 9]
+    """
+    soma = pl.lit(0, dtype=pl.Int32)
+    for posicao, peso in enumerate((1, 2, 1, 2, 1, 2)):
+        produto = (cod_mun6 // 10 ** (5 - posicao) % 10) * peso
+        soma = soma + produto // 10 + produto % 10
+    digito = (10 - soma % 10) % 10
+    return (
+        pl.when(cod_mun6.is_in(list(EXCECOES_DV_IBGE)))
+          .then(cod_mun6.replace_strict(EXCECOES_DV_IBGE, default=None))
+          .otherwise(digito)
+          .cast(pl.Int32)
+    )
+
+def adicionar_codigos_municipio(df, coluna):
+    """
+    Adiciona as chaves normalizadas de município a partir de `coluna` (texto ou inteiro,
+    com 6 ou 7 dígitos): `cod_mun6`, código de 6 dígitos usado nos joins, e `cod_mun7`,
+    código IBGE completo com dígito verificador. Aceita DataFrame ou LazyFrame.
+    """
+    return df.with_columns(codigo_municipio_6(coluna).alias('cod_mun6')).with_columns(
+        (pl.col('cod_mun6') * 10 + digito_verificador_ibge(pl.col('cod_mun6'))).alias('cod_mun7')
+    )
+
+def conferir_codigos_municipio(df: pl.DataFrame, coluna, nome) -> pl.DataFrame:
+    """
+    Avisa quantas linhas de `df` (já com `cod_mun6`/`cod_mun7`) têm código de município
+    inválido em `coluna`: não numérico ou, com 7 dígitos, com dígito verificador diferente
+    do calculado. Essas linhas não casam nos joins por município.
+    """
+    original = pl.col(coluna).cast(pl.Utf8).str.strip_chars()
+    invalidos = df.filter(
+        pl.col(coluna).is_not_null() & (
+            pl.col('cod_mun6').is_null()
+            | ((original.str.len_chars() == 7) & (original.cast(pl.Int32, strict=False) != pl.col('cod_mun7')))
+        )
+    )
+    if invalidos.height:
+        exemplos = ', '.join(map(str, invalidos[coluna].head(5).to_list()))
+        print(f"Atenção: {invalidos.height} código(s) de município inválido(s) em {nome}.{coluna} (ex.: {exemplos}).")
+    return df
+
+def agregar_internacoes_arquivo(caminho: str, destino: str) -> str:
+    """
+    Agrega um arquivo mensal do SIH por município de atendimento (MUNIC_MOV), hospital
+    (CNES) e município de residência (MUNIC_RES), gravando o parcial em streaming.
+
+    O grão mantém hospitais e municípios atendidos para que as contagens distintas
+    possam ser refeitas ao juntar os meses; as demais medidas são somas.
+    """
+    (
+        pl.scan_parquet(caminho)
+          .group_by(
+              codigo_municipio_6('MUNIC_MOV').alias('cod_mun6'),
+              pl.col('CNES').cast(pl.Utf8).str.strip_chars(),
+              codigo_municipio_6('MUNIC_RES').alias('cod_mun6_residencia'),
+          )
+          .agg(
+              pl.len().cast(pl.Int64).alias('internacoes'),
+              pl.col('MORTE').cast(pl.Int64, strict=False).sum().alias('obitos'),
+              pl.col('DIAS_PERM').cast(pl.Int64, strict=False).sum().alias('dias_permanencia'),
+              pl.col('QT_DIARIAS').cast(pl.Int64, strict=False).sum().alias('diarias'),
+              pl.col('VAL_TOT').cast(pl.Float64, strict=False).sum().alias('valor'),
+          )
+          .sink_parquet(destino)
+    )
+    return destino
+
 def adicionar_coluna_data(df, nome_arquivo):
     """
-    Adiciona a coluna 'data_competencia' ao DataFrame com base no nome do arquivo.
+    Adiciona a coluna 'data_competencia' ao DataFrame (ou LazyFrame) com base no nome do arquivo.
     """
     ano_mes = nome_arquivo.split('.')[0][-6:]  # Captura os últimos 6 caracteres do nome do arquivo (YYYYMM)
     ano = ano_mes[:4]
     mes = ano_mes[-2:]
     df = df.with_columns(
-        pl.concat_str(
-            pl.lit(ano),
-            pl.lit('-'),
-            pl.lit(mes),
-            pl.lit('-01')
-        ).alias('data_competencia')
+        pl.lit(f'{ano}-{mes}-01').alias('data_competencia')
     )
     return df
 
+def _blake2b_64(textos: pl.Series) -> pl.Series:
+    """
+    Resume cada texto da série em um inteiro de 64 bits (BLAKE2b de 8 bytes, little-endian).
+    """
+    return pl.Series(
+        textos.name,
+        [int.from_bytes(hashlib.blake2b(texto.encode(), digest_size=8).digest(), 'little') for texto in textos],
+        dtype=pl.UInt64
+    )
+
+def adicionar_hash_linha(df, ignorar=('data_competencia',)):
+    """
+    Adiciona `hash_linha`, impressão digital de 64 bits do conteúdo da linha, calculada
+    sobre todas as colunas exceto `ignorar` e as chaves derivadas `cod_mun6`/`cod_mun7`.
+    Aceita DataFrame ou LazyFrame.
+
+    Cada linha é codificada como texto canônico (colunas em ordem alfabética, cada uma
+    como `nome=tamanho:valor` ou `nome=-` se nula, categóricas pelo texto) e resumida
+    com BLAKE2b. Ao contrário do hash interno do Polars, o resultado não muda entre
+    versões da biblioteca nem depende da ordem das colunas ou da codificação das
+    categorias de cada arquivo.
+    """
+    schema = df.collect_schema() if isinstance(df, pl.LazyFrame) else df.schema
+    campos = []
+    for coluna in sorted(schema):
+        if coluna in ignorar or coluna in COLUNAS_CODIGO_MUNICIPIO or coluna == 'hash_linha':
+            continue
+        valor = pl.col(coluna).cast(pl.Utf8)
+        campos.append(
+            pl.when(valor.is_null())
+              .then(pl.lit(f'{coluna}=-'))
+              .otherwise(pl.concat_str(pl.lit(f'{coluna}='), valor.str.len_bytes().cast(pl.Utf8), pl.lit(':'), valor))
+        )
+
+    linha = pl.concat_str(campos, separator='|') if campos else pl.lit('')
+    return df.with_columns(
+        linha.map_batches(_blake2b_64, return_dtype=pl.UInt64, is_elementwise=True).alias('hash_linha')
+    )
+
 def listar_arquivos(pasta, extensao=''):
     """
     Lista arquivos de uma pasta por extensão.
     """
-    return [f for f in os.listdir(pasta) if f.endswith(extensao)]
\ No newline at end of file
+    return [f for f in os.listdir(pasta) if f.endswith(extensao)]
+
+def listar_competencias(ano_inicio=ANO_INICIO, ano_fim=ANO_FIM, meses=MESES):
+    """
+    Lista as competências (ano, mês) do período configurado.
+    """
+    return [(ano, mes) for ano in range(int(ano_inicio), int(ano_fim) + 1) for mes in meses]
+
+def competencia_referencia(ano) -> str:
+    """
+    Retorna a última competência do ano no formato de `data_competencia` (AAAA-MM-01).
+    """
+    return f'{ano}-{max(MESES):02d}-01'
+
+def separar_tabela_competencia(nome_arquivo):
+    """
+    Separa o nome da tabela e a competência de um arquivo do CNES.
+
+    Ex.: 'tbEstabelecimento202212.csv' → ('tbestabelecimento', 2022, 12)
+    """
+    nome = os.path.splitext(os.path.basename(nome_arquivo))[0]
+    ano_mes = nome[-6:]
+    tabela = ''.join(filter(str.isalpha, nome)).lower()
+    return tabela, int(ano_mes[:4]), int(ano_mes[4:])
+
+def caminho_particao(base, tabela, ano, mes=None, nome_arquivo='dados.parquet'):
+    """
+    Monta (e cria, se preciso) o caminho de uma partição Hive do dataset da tabela:
+    `base/tabela/ano=AAAA[/mes=MM]/nome_arquivo`.
+    """
+    pasta = os.path.join(base, tabela, f'ano={int(ano)}')
+    if mes is not None:
+        pasta = os.path.join(pasta, f'mes={int(mes):02d}')
+    os.makedirs(pasta, exist_ok=True)
+    return os.path.join(pasta, nome_arquivo)
+
+def padrao_dataset(base, tabela):
+    """
+    Padrão glob com todos os arquivos Parquet do dataset particionado da tabela.
+    """
+    return os.path.join(base, tabela, '**', '*.parquet')
+
+def listar_tabelas_dataset(base):
+    """
+    Lista as tabelas (subpastas) de um diretório de datasets particionados.
+    """
+    if not os.path.isdir(base):
+        return []
+    return sorted(d for d in os.listdir(base) if os.path.isdir(os.path.join(base, d)))
+
+def listar_anos_dataset(base, tabela):
+    """
+    Lista os anos com partição `ano=AAAA` no dataset da tabela.
+    """
+    pasta = os.path.join(base, tabela)
+    if not os.path.isdir(pasta):
+        return []
+    return sorted(int(d.split('=')[1]) for d in os.listdir(pasta) if d.startswith('ano='))
+
+def ler_dataset(base, tabela, ano=None) -> pl.LazyFrame:
+    """
+    Lê o dataset particionado da tabela como LazyFrame, com as colunas de partição
+    (`ano`, `mes`) vindas do caminho. Com `ano`, lê só a partição daquele ano.
+    """
+    lf = pl.scan_parquet(padrao_dataset(base, tabela), hive_partitioning=True)
+    if ano is not None:
+        lf = lf.filter(pl.col('ano') == int(ano))
+    return lf
+
+def listar_arquivos_particao(base, tabela, ano):
+    """
+    Lista os Parquets da partição `ano=AAAA` da tabela: o arquivo anual ou os
+    mensais das subpartições `mes=MM`.
+    """
+    pasta = os.path.join(base, tabela, f'ano={int(ano)}')
+    return sorted(
+        os.path.join(raiz, arquivo)
+        for raiz, _, arquivos in os.walk(pasta)
+        for arquivo in arquivos
+        if arquivo.endswith('.parquet')
+    )
+
+def escanear_particao(base, tabela, ano) -> pl.LazyFrame:
+    """
+    Lê todos os Parquets da partição `ano=AAAA` da tabela como um único LazyFrame.
+
+    Os esquemas vêm só dos metadados dos arquivos: colunas ausentes em algum mês
+    entram como nulas (concatenação diagonal) e os tipos seguem o registro de
+    esquemas. Os arquivos entram em ordem cronológica e as colunas em ordem alfabética.
+    """
+    arquivos = listar_arquivos_particao(base, tabela, ano)
+    if not arquivos:
+        raise FileNotFoundError(f"Nenhum Parquet em {os.path.join(base, tabela, f'ano={int(ano)}')}")
+
+    lfs = []
+    for arquivo in arquivos:
+        lf = aplicar_esquema(pl.scan_parquet(arquivo), tabela)
+        coluna = coluna_municipio(tabela)
+        if coluna and 'cod_mun6' not in lf.collect_schema().names():
+            # Parquets convertidos antes das chaves normalizadas de município
+            lf = adicionar_codigos_municipio(lf, coluna)
+        if 'hash_linha' not in lf.collect_schema().names():
+            # Parquets convertidos antes da existência do hash
+            lf = adicionar_hash_linha(lf)
+        lfs.append(lf)
+
+    lf = pl.concat(lfs, how='diagonal_relaxed')
+    return lf.select(sorted(lf.collect_schema().names()))
+
+def limpar_particao(base, tabela, ano):
+    """
+    Remove a partição `ano=AAAA` da tabela (arquivo anual e subpartições mensais).
+    """
+    pasta = os.path.join(base, tabela, f'ano={int(ano)}')
+    if os.path.isdir(pasta):
+        shutil.rmtree(pasta)
+
+def gravar_particao(df, base, tabela, ano) -> str:
+    """
+    Substitui a partição `ano=AAAA` da tabela por um único arquivo com `df`.
+
+    Aceita DataFrame ou LazyFrame (gravado em streaming). O arquivo é escrito à parte e
+    só substitui a partição no final, então `df` pode ser lido da própria partição.
+    """
+    temporario = os.path.join(base, tabela, f'.ano={int(ano)}.parquet.tmp')
+    os.makedirs(os.path.dirname(temporario), exist_ok=True)
+    if isinstance(df, pl.LazyFrame):
+        df.sink_parquet(temporario)
+    else:
+        df.write_parquet(temporario)
+
+    limpar_particao(base, tabela, ano)
+    caminho = caminho_particao(base, tabela, ano)
+    os.replace(temporario, caminho)
+    return caminho
+
+def contar_linhas_parquet(*caminhos) -> int:
+    """
+    Soma o número de linhas dos Parquets lendo apenas os metadados.
+    """
+    return sum(pq.ParquetFile(caminho).metadata.num_rows for caminho in caminhos)
+
+def vincular_particao(origem, destino, tabela, ano):
+    """
+    Registra os Parquets mensais da tabela em `origem` como a partição do ano em
+    `destino`, sem copiar os dados: cada `mes=MM/dados.parquet` vira um hard link
+    (ou uma cópia, se o link não for possível, ex.: outro sistema de arquivos).
+
+    Returns:
+        list: Caminhos criados em `destino`.
+    """
+    limpar_particao(destino, tabela, ano)
+    pasta_origem = os.path.join(origem, tabela, f'ano={int(ano)}')
+
+    vinculados = []
+    for arquivo in listar_arquivos_particao(origem, tabela, ano):
+        caminho = os.path.join(destino, tabela, f'ano={int(ano)}', os.path.relpath(arquivo, pasta_origem))
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        try:
+            os.link(arquivo, caminho)
+        except OSError:
+            shutil.copy2(arquivo, caminho)
+        vinculados.append(caminho)
+    return vinculados
+
+def montar_intervalos_validade(lf: pl.LazyFrame, chaves: list) -> pl.LazyFrame:
+    """
+    Converte retratos mensais (uma linha por registro e competência) em intervalos de
+    validade no formato SCD tipo 2.
+
+    Meses consecutivos com o mesmo registro (chaves + `hash_linha`) viram uma linha com
+    `valid_from` (primeira competência) e `valid_to` (primeira competência em que o
+    registro não aparece mais, exclusiva; nula se ainda está na última competência).
+    "Consecutivo" considera as competências presentes nos dados, não o calendário.
+    Linhas idênticas repetidas dentro de um mesmo mês viram uma só.
+    """
+    grupo = chaves + ['hash_linha']
+    colunas = [c for c in lf.collect_schema().names() if c not in grupo and c != 'data_competencia']
+
+    lf = lf.with_columns(pl.col('data_competencia').str.to_date().alias('valid_from'))
+
+    competencias = (
+        lf.select('valid_from')
+          .unique()
+          .sort('valid_from')
+          .with_row_index('_indice')
+          .with_columns(pl.col('_indice').cast(pl.Int64))
+          .collect()
+    )
+    proximas = competencias.select(
+        (pl.col('_indice') - 1).alias('_ultimo'),
+        pl.col('valid_from').alias('valid_to')
+    )
+
+    return (
+        lf.join(competencias.lazy(), on='valid_from')
+          .with_columns(
+              # novo intervalo quando o registro some por ao menos uma competência;
+              # a ordem cronológica vale só dentro de cada registro (sem ordenar a tabela toda)
+              (pl.col('_indice').diff().fill_null(1) > 1).cum_sum()
+                .over(grupo, order_by='_indice').alias('_intervalo')
+          )
+          .group_by(grupo + ['_intervalo'])
+          .agg(
+              *[pl.col(c).first() for c in colunas],
+              pl.col('valid_from').min(),
+              pl.col('_indice').max().alias('_ultimo')
+          )
+          .join(proximas.lazy(), on='_ultimo', how='left')
+          .select(chaves + colunas + ['hash_linha', 'valid_from', 'valid_to'])
+    )
+
+def escanear_snapshot(base, tabela, data) -> pl.LazyFrame:
+    """
+    Reconstrói, a partir do histórico SCD tipo 2 da tabela, o retrato da competência
+    que contém `data` (date ou texto AAAA-MM-DD), com a coluna `data_competencia`.
+    """
+    if isinstance(data, str):
+        data = date.fromisoformat(data)
+    competencia = data.replace(day=1)
+
+    return (
+        pl.scan_parquet(os.path.join(base, tabela.lower(), 'dados.parquet'))
+          .filter(
+              (pl.col('valid_from') <= competencia)
+              & (pl.col('valid_to').is_null() | (pl.col('valid_to') > competencia))
+          )
+          .drop(['valid_from', 'valid_to'])
+          .with_columns(pl.lit(competencia.isoformat()).alias('data_competencia'))
+    )
@@ -0,0 +1,175 @@
+# tests/compressor_implode.py
+
+"""
+Compressor PKWARE DCL "implode" mínimo e gravação de DBF/DBC, usados só para gerar os
+dados de teste de `scripts.dbc`. Os códigos de Huffman saem das mesmas tabelas usadas
+na descompressão.
+
+Como script, regrava as amostras de tests/dados:
+    python tests/compressor_implode.py
+"""
+
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from scripts.dbc import _tabelas, _BASE, _EXTRA
+
+PASTA_DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados')
+
+def _codigos(tabela):
+    """{símbolo: (código como lido da entrada, bits)} a partir da tabela de decodificação."""
+    codigos = {}
+    for indice, entrada in enumerate(tabela):
+        if entrada is not None and entrada[0] not in codigos:
+            simbolo, bits = entrada
+            codigos[simbolo] = (indice & ((1 << bits) - 1), bits)
+    return codigos
+
+class _EscritorBits:
+    def __init__(self):
+        self.valor = 0
+        self.quantidade = 0
+        self.saida = bytearray()
+
+    def bits(self, valor, n):
+        self.valor |= valor << self.quantidade
+        self.quantidade += n
+        while self.quantidade >= 8:
+            self.saida.append(self.valor & 0xFF)
+            self.valor >>= 8
+            self.quantidade -= 8
+
+    def finalizar(self):
+        if self.quantidade:
+            self.saida.append(self.valor & 0xFF)
+        return bytes(self.saida)
+
+def implode(dados: bytes, codificados=1, dicionario=6, candidatos=32) -> bytes:
+    """
+    Comprime `dados` no formato implode, com busca gulosa de repetições (cadeias de
+    hash dos 3 primeiros bytes, no máximo `candidatos` posições por busca).
+
+    Args:
+        codificados (int): 1 para literais com código de Huffman, 0 para literais crus.
+        dicionario (int): 4, 5 ou 6 (janela de 1, 2 ou 4 KB).
+    """
+    literais, comprimentos, distancias = (_codigos(tabela) for tabela in _tabelas())
+    janela = 64 << dicionario
+    escritor = _EscritorBits()
+    escritor.bits(codificados, 8)
+    escritor.bits(dicionario, 8)
+
+    def comprimento(valor):
+        for simbolo in range(16):
+            if _BASE[simbolo] <= valor < _BASE[simbolo] + (1 << _EXTRA[simbolo]):
+                escritor.bits(*comprimentos[simbolo])
+                escritor.bits(valor - _BASE[simbolo], _EXTRA[simbolo])
+                return
+        raise ValueError(valor)
+
+    posicoes = {}
+    i = 0
+    while i < len(dados):
+        melhor, distancia_melhor = 0, 0
+        for j in reversed(posicoes.get(dados[i:i + 3], [])[-candidatos:]):
+            distancia = i - j
+            if distancia > janela:
+                break
+            n = 0
+            while n < 518 and i + n < len(dados) and dados[i + n] == dados[i + n - distancia]:
+                n += 1
+            if n > melhor:
+                melhor, distancia_melhor = n, distancia
+                if n == 518:
+                    break
+        # Repetições de 2 bytes só alcançam 256 bytes para trás
+        if melhor == 2 and distancia_melhor > 256:
+            melhor = 0
+
+        passo = melhor if melhor >= 2 else 1
+        if melhor >= 2:
+            deslocamento = 2 if melhor == 2 else dicionario
+            escritor.bits(1, 1)
+            comprimento(melhor)
+            escritor.bits(*distancias[(distancia_melhor - 1) >> deslocamento])
+            escritor.bits((distancia_melhor - 1) & ((1 << deslocamento) - 1), deslocamento)
+        else:
+            escritor.bits(0, 1)
+            if codificados:
+                escritor.bits(*literais[dados[i]])
+            else:
+                escritor.bits(dados[i], 8)
+
+        for k in range(i, i + passo):
+            posicoes.setdefault(dados[k:k + 3], []).append(k)
+        i += passo
+
+    escritor.bits(1, 1)
+    comprimento(519)
+    return escritor.finalizar()
+
+def escrever_dbf(campos, linhas, excluidos=()) -> bytes:
+    """
+    Monta um DBF (dBase III) com `campos` [(nome, tipo, largura, decimais)] e `linhas`
+    de textos; os índices em `excluidos` são marcados como apagados ('*').
+    """
+    tamanho_registro = 1 + sum(largura for _, _, largura, _ in campos)
+    tamanho_cabecalho = 32 + 32 * len(campos) + 1
+    cabecalho = struct.pack('<BBBBIHH20x', 3, 124, 1, 1, len(linhas), tamanho_cabecalho, tamanho_registro)
+    for nome, tipo, largura, decimais in campos:
+        cabecalho += nome.encode('latin1').ljust(11, b'\x00') + tipo.encode() + bytes(4)
+        cabecalho += bytes([largura, decimais]) + bytes(14)
+    cabecalho += b'\x0d'
+
+    corpo = bytearray()
+    for indice, linha in enumerate(linhas):
+        corpo += b'*' if indice in excluidos else b' '
+        for (_, tipo, largura, _), valor in zip(campos, linha):
+            valor = valor.encode('latin1')
+            corpo += (valor.rjust(largura) if tipo in 'NF' else valor.ljust(largura))[:largura]
+    return cabecalho + bytes(corpo) + b'\x1a'
+
+def escrever_dbc(dbf: bytes, codificados=1, dicionario=6) -> bytes:
+    """
+    Monta o .dbc de um DBF: o cabeçalho DBF como está, 4 bytes de CRC (não conferidos
+    pela leitura) e os registros comprimidos com `implode`.
+    """
+    tamanho_cabecalho = struct.unpack('<H', dbf[8:10])[0]
+    return dbf[:tamanho_cabecalho] + bytes(4) + implode(dbf[tamanho_cabecalho:], codificados, dicionario)
+
+# Amostra com os tipos de campo do SIH/SIM: texto com acentos e vazios, inteiros,
+# decimais, datas (inclusive vazia e inválida) e lógicos; os registros 2 e 7 estão apagados
+CAMPOS_AMOSTRA = [
+    ('UF_ZI', 'C', 6, 0),
+    ('MUNIC_RES', 'C', 6, 0),
+    ('NOME_MUN', 'C', 14, 0),
+    ('IDADE', 'N', 3, 0),
+    ('VAL_TOT', 'N', 10, 2),
+    ('DT_INTER', 'D', 8, 0),
+    ('MORTE', 'L', 1, 0),
+]
+LINHAS_AMOSTRA = [
+    [uf, mun, nome, idade, valor, data, morte]
+    for uf, mun, nome, idade, valor, data, morte in (
+        ('350000', '355030', 'São Paulo', '34', '1520.75', '20220103', 'F'),
+        ('350000', '355030', 'São Paulo', '0', '88.10', '20220115', 'T'),
+        ('330000', '330455', 'Rio de Janeiro', '71', '301.00', '20220120', 'F'),
+        ('310000', '310620', 'Belo Horizonte', '', '12.5', '20220201', '?'),
+        ('350000', '350950', 'Campinas', '102', '', '', 'F'),
+        ('530000', '530010', 'Brasília', '45', '99999.99', '20220230', 'S'),
+        ('150000', '150140', 'Belém', '18', '0.00', '20221231', 'N'),
+        ('230000', '230440', 'Fortaleza', '60', '450.40', '20220704', 'T'),
+        ('', '', '', '5', '7.00', '20220815', ' '),
+        ('350000', '355030', 'São Paulo', '29', '1234.56', '20220909', 'F'),
+    )
+]
+EXCLUIDOS_AMOSTRA = {2, 7}
+
+if __name__ == '__main__':
+    dbf = escrever_dbf(CAMPOS_AMOSTRA, LINHAS_AMOSTRA, EXCLUIDOS_AMOSTRA)
+    with open(os.path.join(PASTA_DADOS, 'amostra.dbf'), 'wb') as f:
+        f.write(dbf)
+    with open(os.path.join(PASTA_DADOS, 'amostra.dbc'), 'wb') as f:
+        f.write(escrever_dbc(dbf))
@@ -0,0 +1,32 @@
+# tests/conftest.py
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def servidor_ftp(tmp_path):
+    """Servidor FTP anônimo local servindo `tmp_path/remoto`; `handler` é a classe que
+    atende as conexões, para os testes alterarem os comandos aceitos."""
+    pytest.importorskip("pyftpdlib")
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.servers import ThreadedFTPServer
+
+    remoto = tmp_path / "remoto"
+    remoto.mkdir()
+
+    autorizador = DummyAuthorizer()
+    autorizador.add_anonymous(str(remoto))
+    handler = type("Handler", (FTPHandler,), {"authorizer": autorizador, "passive_ports": None})
+    servidor = ThreadedFTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=servidor.serve_forever, kwargs={"timeout": 0.05}, daemon=True)
+    thread.start()
+
+    host, porta = servidor.address
+    yield SimpleNamespace(pasta=remoto, handler=handler, kwargs={"host": host, "porta": porta, "diretorio": "/"})
+
+    servidor.close_all()
+    thread.join(5)
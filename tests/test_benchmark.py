@@ -0,0 +1,58 @@
+# tests/test_benchmark.py
+
+import polars as pl
+
+from scripts.benchmark import comparar_saidas, colunas_divergentes
+
+CHAVES = ['uf', 'codigo_municipio']
+
+
+def saida(**colunas):
+    base = {'uf': ['RJ', 'SP', 'SP'], 'codigo_municipio': ['330455', '350950', '355030']}
+    return pl.DataFrame({**base, **colunas})
+
+
+def por_coluna(diferencas):
+    return {linha['coluna']: linha for linha in diferencas.to_dicts()}
+
+
+def test_saidas_iguais_sao_equivalentes():
+    duckdb = saida(leitos=[1, None, 35], taxa=[0.1, 0.2, 0.3])
+    polars = saida(leitos=[1, None, 35], taxa=[0.1, 0.2, 0.3 + 1e-12]).sample(fraction=1.0, shuffle=True, seed=1)
+
+    diferencas = comparar_saidas(duckdb, polars, chaves=CHAVES)
+
+    assert colunas_divergentes(diferencas).is_empty()
+    assert por_coluna(diferencas)['taxa']['max_diferenca'] < 1e-9
+
+
+def test_tipos_diferentes_com_os_mesmos_valores_divergem():
+    duckdb = saida(leitos=pl.Series([1.0, None, 35.0], dtype=pl.Float64))
+    polars = saida(leitos=pl.Series([1, None, 35], dtype=pl.Int64))
+
+    diferencas = por_coluna(comparar_saidas(duckdb, polars, chaves=CHAVES))
+
+    assert diferencas['leitos']['divergencias'] == 0
+    assert diferencas['leitos']['mesmo_tipo'] is False
+    assert (diferencas['leitos']['tipo_duckdb'], diferencas['leitos']['tipo_polars']) == ('Float64', 'Int64')
+    assert colunas_divergentes(comparar_saidas(duckdb, polars, chaves=CHAVES))['coluna'].to_list() == ['leitos']
+
+
+def test_valores_nulos_e_linhas_divergentes():
+    duckdb = saida(leitos=[1, 2, 35], nome=['Rio', 'Campinas', 'São Paulo'])
+    polars = saida(leitos=[1, None, 36], nome=['Rio', 'Campinas', 'Sao Paulo']).head(2).vstack(
+        pl.DataFrame({'uf': ['SP'], 'codigo_municipio': ['355031'], 'leitos': [36], 'nome': ['Sao Paulo']})
+    )
+
+    diferencas = por_coluna(comparar_saidas(duckdb, polars, chaves=CHAVES))
+
+    # 355030 só no DuckDB e 355031 só no Polars; em 350950, nulo só de um lado
+    assert diferencas['codigo_municipio']['divergencias'] == 2
+    assert diferencas['leitos']['divergencias'] == 3
+    assert diferencas['nome']['divergencias'] == 2
+
+
+def test_coluna_presente_em_uma_saida():
+    diferencas = comparar_saidas(saida(leitos=[1, 2, 3]), saida(leitos=[1, 2, 3], extra=[0, 0, 0]), chaves=CHAVES)
+
+    assert colunas_divergentes(diferencas)['coluna'].to_list() == ['extra']
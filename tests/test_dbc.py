@@ -0,0 +1,229 @@
+# tests/test_dbc.py
+
+import io
+import os
+import random
+import shutil
+from datetime import date
+
+import polars as pl
+import pyarrow.parquet as pq
+import pytest
+
+from compressor_implode import (
+    PASTA_DADOS, CAMPOS_AMOSTRA, LINHAS_AMOSTRA, EXCLUIDOS_AMOSTRA,
+    implode, escrever_dbf, escrever_dbc
+)
+from scripts import dbc
+from scripts.dbc import (
+    explodir, ler_blocos_dbc, ler_blocos_dbf, ler_dbf_em_lotes, _decodificar_lote, _ler_cabecalho_dbf,
+    converter_dbc_para_parquet, converter_arquivos_dbc
+)
+
+AMOSTRA_DBC = os.path.join(PASTA_DADOS, 'amostra.dbc')
+AMOSTRA_DBF = os.path.join(PASTA_DADOS, 'amostra.dbf')
+
+ESPERADO = pl.DataFrame(
+    {
+        'UF_ZI': ['350000', '350000', '310000', '350000', '530000', '150000', None, '350000'],
+        'MUNIC_RES': ['355030', '355030', '310620', '350950', '530010', '150140', None, '355030'],
+        'NOME_MUN': ['São Paulo', 'São Paulo', 'Belo Horizonte', 'Campinas', 'Brasília', 'Belém', None, 'São Paulo'],
+        'IDADE': [34, 0, None, 102, 45, 18, 5, 29],
+        'VAL_TOT': [1520.75, 88.10, 12.5, None, 99999.99, 0.0, 7.0, 1234.56],
+        'DT_INTER': [
+            date(2022, 1, 3), date(2022, 1, 15), date(2022, 2, 1), None,
+            None, date(2022, 12, 31), date(2022, 8, 15), date(2022, 9, 9),
+        ],
+        'MORTE': [False, True, False, False, True, False, None, False],
+    },
+    schema={
+        'UF_ZI': pl.Utf8, 'MUNIC_RES': pl.Utf8, 'NOME_MUN': pl.Utf8, 'IDADE': pl.Int64,
+        'VAL_TOT': pl.Float64, 'DT_INTER': pl.Date, 'MORTE': pl.Boolean,
+    },
+)
+
+
+@pytest.fixture(params=[False, True], ids=['python', 'compilado'])
+def compilado(request):
+    """Descompressor dos .dbc: `explodir` ou o pacote opcional datasus-dbc."""
+    if request.param and dbc.datasus_dbc is None:
+        pytest.skip('datasus-dbc não instalado')
+    return request.param
+
+
+def explodir_tudo(dados, **kwargs):
+    return b''.join(explodir(io.BytesIO(dados), **kwargs))
+
+
+# -----------------------------------------------------------------------------
+# Descompressão
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('codificados', [0, 1])
+@pytest.mark.parametrize('dicionario', [4, 5, 6])
+def test_explodir_recupera_os_dados(codificados, dicionario):
+    aleatorio = random.Random(dicionario * 10 + codificados)
+    dados = bytes(aleatorio.choice(b'AB C0123\xe7') for _ in range(6_000)) + b' ' * 3_000 + os.urandom(500)
+
+    comprimido = implode(dados, codificados, dicionario)
+
+    assert explodir_tudo(comprimido) == dados
+    # Blocos pequenos exercitam a janela guardada entre um bloco e o seguinte
+    assert explodir_tudo(comprimido, tamanho_saida=100) == dados
+
+
+def test_explodir_copias_sobrepostas():
+    # Repetições com distância menor que o comprimento (ex.: 1 byte repetido 518 vezes)
+    dados = b'x' + b'y' * 2_000 + b'xyz' * 700
+    assert explodir_tudo(implode(dados)) == dados
+
+
+def test_explodir_entrega_em_blocos():
+    dados = bytes(range(256)) * 40
+    blocos = list(explodir(io.BytesIO(implode(dados)), tamanho_saida=1_000))
+
+    assert b''.join(blocos) == dados
+    assert len(blocos) > 1
+    assert all(len(bloco) >= 1_000 for bloco in blocos[:-1])
+
+
+def test_explodir_cabecalho_invalido():
+    with pytest.raises(ValueError, match='tipo de literal'):
+        explodir_tudo(bytes([2, 6, 0, 0]))
+    with pytest.raises(ValueError, match='dicionário'):
+        explodir_tudo(bytes([0, 7, 0, 0]))
+
+
+def test_explodir_dados_truncados():
+    comprimido = implode(b'DATASUS ' * 100 + bytes(range(200)))
+    with pytest.raises(EOFError):
+        explodir_tudo(comprimido[:len(comprimido) // 2])
+
+
+# -----------------------------------------------------------------------------
+# Leitura de DBF
+# -----------------------------------------------------------------------------
+
+def test_cabecalho_da_amostra():
+    with open(AMOSTRA_DBF, 'rb') as f:
+        dbf = f.read()
+    registros, tamanho_cabecalho, tamanho_registro, campos = _ler_cabecalho_dbf(dbf[:32 * 9])
+
+    assert registros == len(LINHAS_AMOSTRA)
+    assert tamanho_cabecalho == 32 + 32 * len(CAMPOS_AMOSTRA) + 1
+    assert tamanho_registro == 1 + sum(largura for _, _, largura, _ in CAMPOS_AMOSTRA)
+    assert [(nome, tipo, largura, decimais) for nome, tipo, _, largura, decimais in campos] == CAMPOS_AMOSTRA
+    assert campos[0][2] == 1
+
+
+def test_dbc_da_amostra_e_o_dbf_comprimido(compilado):
+    with open(AMOSTRA_DBF, 'rb') as f:
+        dbf = f.read()
+    assert b''.join(ler_blocos_dbc(AMOSTRA_DBC, compilado)) == dbf
+    assert os.path.getsize(AMOSTRA_DBC) < len(dbf)
+
+
+@pytest.mark.parametrize('caminho', [AMOSTRA_DBC, AMOSTRA_DBF])
+def test_tipos_e_valores(caminho, compilado):
+    blocos = ler_blocos_dbc(caminho, compilado) if caminho.endswith('.dbc') else ler_blocos_dbf(caminho)
+    df = pl.concat(ler_dbf_em_lotes(blocos))
+
+    assert df.schema == ESPERADO.schema
+    assert df.equals(ESPERADO)
+
+
+def test_registros_apagados_sao_descartados():
+    df = pl.concat(ler_dbf_em_lotes(ler_blocos_dbf(AMOSTRA_DBF)))
+    apagados = [LINHAS_AMOSTRA[i][2] for i in sorted(EXCLUIDOS_AMOSTRA)]
+
+    assert df.height == len(LINHAS_AMOSTRA) - len(EXCLUIDOS_AMOSTRA)
+    assert not set(apagados) & set(df['NOME_MUN'].drop_nulls())
+
+
+def test_lotes_independem_dos_blocos_de_entrada():
+    with open(AMOSTRA_DBF, 'rb') as f:
+        dbf = f.read()
+    # Blocos de 7 bytes cortam o cabeçalho e os registros em qualquer ponto
+    blocos = [dbf[i:i + 7] for i in range(0, len(dbf), 7)]
+
+    lotes = list(ler_dbf_em_lotes(blocos, linhas_por_lote=3))
+
+    # 10 registros em lotes de 3, já sem os apagados (índices 2 e 7)
+    assert [lote.height for lote in lotes] == [2, 3, 2, 1]
+    assert pl.concat(lotes).equals(ESPERADO)
+
+
+def test_dbf_truncado_le_os_registros_completos():
+    with open(AMOSTRA_DBF, 'rb') as f:
+        dbf = f.read()
+    _, tamanho_cabecalho, tamanho_registro, _ = _ler_cabecalho_dbf(dbf)
+    truncado = dbf[:tamanho_cabecalho + 4 * tamanho_registro + 5]
+
+    df = pl.concat(ler_dbf_em_lotes([truncado]))
+
+    assert df.equals(ESPERADO.head(3))
+
+
+def test_compilado_indisponivel(monkeypatch):
+    monkeypatch.setattr(dbc, 'datasus_dbc', None)
+    with pytest.raises(ImportError, match='datasus-dbc'):
+        list(ler_blocos_dbc(AMOSTRA_DBC, compilado=True))
+
+
+def test_dbf_vazio():
+    with pytest.raises(ValueError, match='vazio ou truncado'):
+        list(ler_dbf_em_lotes([b'\x03']))
+
+
+def test_decodificar_lote_campo_numerico_invalido_vira_nulo():
+    # (nome, tipo, deslocamento, largura, decimais); cada registro tem 1 + 4 + 6 bytes
+    campos = [('QTD', 'N', 1, 4, 0), ('TAXA', 'N', 5, 6, 2)]
+    dados = b' ' + b'  12' + b'  0.50' + b' ' + b' abc' + b'  1,5 '
+
+    df = _decodificar_lote(dados, 11, campos)
+
+    assert df['QTD'].to_list() == [12, None]
+    assert df['TAXA'].to_list() == [0.5, None]
+
+
+# -----------------------------------------------------------------------------
+# Conversão para Parquet
+# -----------------------------------------------------------------------------
+
+def test_converter_um_row_group_por_lote(tmp_path, compilado):
+    destino = tmp_path / 'amostra.parquet'
+
+    total = converter_dbc_para_parquet(AMOSTRA_DBC, str(destino), linhas_por_lote=3, compilado=compilado)
+
+    assert total == ESPERADO.height
+    arquivo = pq.ParquetFile(destino)
+    assert [arquivo.metadata.row_group(i).num_rows for i in range(arquivo.num_row_groups)] == [2, 3, 2, 1]
+    assert pl.read_parquet(destino).equals(ESPERADO)
+    assert os.listdir(tmp_path) == ['amostra.parquet']
+
+
+def test_converter_arquivo_sem_registros(tmp_path):
+    caminho = tmp_path / 'vazio.dbf'
+    caminho.write_bytes(escrever_dbf(CAMPOS_AMOSTRA, []))
+
+    with pytest.raises(ValueError, match='Nenhum registro'):
+        converter_dbc_para_parquet(str(caminho), str(tmp_path / 'vazio.parquet'))
+    assert not (tmp_path / 'vazio.parquet').exists()
+
+
+def test_converter_arquivos_em_paralelo(tmp_path):
+    for nome in ('RDSP2201.dbc', 'RDRJ2201.dbc'):
+        shutil.copy(AMOSTRA_DBC, tmp_path / nome)
+    (tmp_path / 'RDMG2201.dbc').write_bytes(escrever_dbc(escrever_dbf(CAMPOS_AMOSTRA, LINHAS_AMOSTRA))[:-20])
+
+    resultados = {
+        os.path.basename(caminho): (registros, erro)
+        for caminho, registros, erro in converter_arquivos_dbc(sorted(map(str, tmp_path.iterdir())), max_workers=2)
+    }
+
+    assert resultados['RDSP2201.dbc'] == (ESPERADO.height, None)
+    assert resultados['RDRJ2201.dbc'] == (ESPERADO.height, None)
+    # EOFError no `explodir`; ValueError no descompressor compilado
+    assert isinstance(resultados['RDMG2201.dbc'][1], (EOFError, ValueError))
+    assert pl.read_parquet(tmp_path / 'RDSP2201.parquet').equals(ESPERADO)
+    assert not (tmp_path / 'RDMG2201.parquet').exists()
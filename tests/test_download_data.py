@@ -0,0 +1,180 @@
+# tests/test_download_data.py
+
+import ftplib
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyftpdlib")
+
+from scripts import download_data
+from scripts.download_data import baixar_arquivo_ftp, baixar_arquivos_ftp
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Substitui o `time.sleep` do download e devolve a lista das esperas pedidas."""
+    registradas = []
+    monkeypatch.setattr(download_data, "time", SimpleNamespace(sleep=registradas.append))
+    return registradas
+
+
+def criar_remoto(servidor, nome, tamanho):
+    conteudo = os.urandom(tamanho)
+    (servidor.pasta / nome).write_bytes(conteudo)
+    return conteudo
+
+
+def registrar_rest(monkeypatch):
+    """Guarda o `rest` de cada RETR feito pelo download."""
+    offsets = []
+    original = ftplib.FTP.retrbinary
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        offsets.append(rest)
+        return original(self, cmd, callback, blocksize, rest)
+
+    monkeypatch.setattr(ftplib.FTP, "retrbinary", retrbinary)
+    return offsets
+
+
+def test_retoma_download_do_arquivo_parcial(servidor_ftp, tmp_path, monkeypatch, esperas):
+    conteudo = criar_remoto(servidor_ftp, "base.zip", 200_000)
+    destino = tmp_path / "base.zip"
+    (tmp_path / "base.zip.part").write_bytes(conteudo[:70_000])
+    offsets = registrar_rest(monkeypatch)
+
+    assert baixar_arquivo_ftp("base.zip", str(destino), **servidor_ftp.kwargs) == str(destino)
+
+    assert destino.read_bytes() == conteudo
+    assert not (tmp_path / "base.zip.part").exists()
+    assert offsets == [70_000]
+    assert esperas == []
+
+
+def test_parcial_maior_que_o_remoto_e_baixado_de_novo(servidor_ftp, tmp_path, monkeypatch, esperas):
+    conteudo = criar_remoto(servidor_ftp, "base.zip", 10_000)
+    destino = tmp_path / "base.zip"
+    (tmp_path / "base.zip.part").write_bytes(os.urandom(20_000))
+    offsets = registrar_rest(monkeypatch)
+
+    baixar_arquivo_ftp("base.zip", str(destino), **servidor_ftp.kwargs)
+
+    assert destino.read_bytes() == conteudo
+    assert offsets == [None]
+
+
+def test_queda_no_meio_retoma_com_rest(servidor_ftp, tmp_path, monkeypatch, esperas):
+    conteudo = criar_remoto(servidor_ftp, "base.zip", 100_000)
+    destino = tmp_path / "base.zip"
+    offsets = registrar_rest(monkeypatch)
+    com_rest = ftplib.FTP.retrbinary
+    quedas = []
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        if quedas:
+            return com_rest(self, cmd, callback, blocksize, rest)
+
+        def cai_depois_do_primeiro_bloco(dados):
+            callback(dados)
+            quedas.append(len(dados))
+            raise ConnectionResetError("conexão perdida")
+
+        return com_rest(self, cmd, cai_depois_do_primeiro_bloco, blocksize, rest)
+
+    monkeypatch.setattr(ftplib.FTP, "retrbinary", retrbinary)
+
+    baixar_arquivo_ftp("base.zip", str(destino), backoff=0.5, **servidor_ftp.kwargs)
+
+    assert destino.read_bytes() == conteudo
+    assert offsets == [None, quedas[0]]
+    assert esperas == [0.5]
+
+
+def test_arquivo_inexistente_falha_sem_novas_tentativas(servidor_ftp, tmp_path, esperas):
+    with pytest.raises(ftplib.error_perm):
+        baixar_arquivo_ftp("nao_existe.zip", str(tmp_path / "nao_existe.zip"), tentativas=5, **servidor_ftp.kwargs)
+    assert esperas == []
+
+
+def test_backoff_exponencial_ate_conectar(servidor_ftp, tmp_path, monkeypatch, esperas):
+    conteudo = criar_remoto(servidor_ftp, "base.zip", 1_000)
+    conectar = download_data.conectar_ftp
+    chamadas = []
+
+    def conectar_instavel(*args, **kwargs):
+        chamadas.append(args)
+        if len(chamadas) <= 2:
+            raise ConnectionRefusedError("servidor ocupado")
+        return conectar(*args, **kwargs)
+
+    monkeypatch.setattr(download_data, "conectar_ftp", conectar_instavel)
+
+    baixar_arquivo_ftp("base.zip", str(tmp_path / "base.zip"), backoff=2.0, **servidor_ftp.kwargs)
+
+    assert (tmp_path / "base.zip").read_bytes() == conteudo
+    assert len(chamadas) == 3
+    assert esperas == [2.0, 4.0]
+
+
+def test_desiste_apos_todas_as_tentativas(tmp_path, monkeypatch, esperas):
+    def conectar_recusado(*args, **kwargs):
+        raise ConnectionRefusedError("servidor fora do ar")
+
+    monkeypatch.setattr(download_data, "conectar_ftp", conectar_recusado)
+
+    with pytest.raises(ConnectionRefusedError):
+        baixar_arquivo_ftp("base.zip", str(tmp_path / "base.zip"), tentativas=4, backoff=1.0)
+    assert esperas == [1.0, 2.0, 4.0]
+
+
+def test_limite_de_conexoes_simultaneas(servidor_ftp, tmp_path, monkeypatch, esperas):
+    arquivos = {f"BASE_{i:02d}.zip": criar_remoto(servidor_ftp, f"BASE_{i:02d}.zip", 50_000) for i in range(8)}
+    conectar = download_data.conectar_ftp
+    trava = threading.Lock()
+    ativas = {"agora": 0, "pico": 0}
+    todas_abertas = threading.Event()
+
+    def conectar_contando(*args, **kwargs):
+        ftp = conectar(*args, **kwargs)
+        with trava:
+            ativas["agora"] += 1
+            ativas["pico"] = max(ativas["pico"], ativas["agora"])
+            if ativas["agora"] == 2:
+                todas_abertas.set()
+        # Segura a conexão até haver duas abertas, para que a concorrência apareça
+        todas_abertas.wait(2)
+        fechar = ftp.close
+
+        def close():
+            with trava:
+                ativas["agora"] -= 1
+            fechar()
+
+        ftp.close = close
+        return ftp
+
+    monkeypatch.setattr(download_data, "conectar_ftp", conectar_contando)
+
+    resultados = list(baixar_arquivos_ftp(arquivos, str(tmp_path), max_conexoes=2, **servidor_ftp.kwargs))
+
+    assert sorted(arquivo for arquivo, _, _ in resultados) == sorted(arquivos)
+    assert all(erro is None for _, _, erro in resultados)
+    assert ativas["pico"] == 2
+    for nome, conteudo in arquivos.items():
+        assert (tmp_path / nome).read_bytes() == conteudo
+
+
+def test_falha_de_um_arquivo_nao_interrompe_os_demais(servidor_ftp, tmp_path, esperas):
+    conteudo = criar_remoto(servidor_ftp, "BASE_01.zip", 5_000)
+
+    resultados = {
+        arquivo: erro
+        for arquivo, _, erro in baixar_arquivos_ftp(["BASE_01.zip", "BASE_02.zip"], str(tmp_path), **servidor_ftp.kwargs)
+    }
+
+    assert resultados["BASE_01.zip"] is None
+    assert isinstance(resultados["BASE_02.zip"], ftplib.error_perm)
+    assert (tmp_path / "BASE_01.zip").read_bytes() == conteudo
@@ -0,0 +1,50 @@
+# tests/test_esquemas.py
+
+import polars as pl
+import pytest
+from polars.exceptions import InvalidOperationError
+
+from scripts.esquemas import aplicar_esquema, esquema_tabela, SIM_NAO
+
+
+def test_aplicar_esquema_converte_as_colunas_declaradas():
+    df = pl.DataFrame({
+        'CO_UNIDADE': ['3550302077477', '3550302078015'],
+        'CO_CNES': [' 2077477 ', ''],
+        'CO_MOTIVO_DESAB': ['', '01'],
+        'TP_ESTAB_SEMPRE_ABERTO': ['S', ''],
+        'NO_FANTASIA': ['HOSPITAL', 'UBS'],
+    })
+
+    convertido = aplicar_esquema(df, 'TBESTABELECIMENTO')
+
+    assert dict(convertido.schema) == {
+        'CO_UNIDADE': pl.Utf8, 'CO_CNES': pl.Int32, 'CO_MOTIVO_DESAB': pl.Categorical,
+        'TP_ESTAB_SEMPRE_ABERTO': SIM_NAO, 'NO_FANTASIA': pl.Utf8,
+    }
+    # vazios viram nulo nos códigos e nos Enums, mas não nas categorias
+    assert convertido['CO_CNES'].to_list() == [2077477, None]
+    assert convertido['TP_ESTAB_SEMPRE_ABERTO'].to_list() == ['S', None]
+    assert convertido['CO_MOTIVO_DESAB'].cast(pl.Utf8).to_list() == ['', '01']
+    assert aplicar_esquema(convertido, 'tbestabelecimento').equals(convertido)
+
+
+@pytest.mark.parametrize('coluna, valores', [
+    ('CO_CNES', ['2077477', '207747A']),   # código não numérico
+    ('CO_ESTADO_GESTOR', ['35', '999']),   # fora do Int8
+    ('TP_ESTAB_SEMPRE_ABERTO', ['S', 'X']),  # fora do Enum
+])
+def test_aplicar_esquema_falha_com_valor_fora_do_tipo(coluna, valores):
+    df = pl.DataFrame({coluna: valores})
+
+    with pytest.raises(InvalidOperationError):
+        aplicar_esquema(df, 'tbestabelecimento')
+    with pytest.raises(InvalidOperationError):
+        aplicar_esquema(df.lazy(), 'tbestabelecimento').collect()
+
+
+def test_tabela_sem_esquema_fica_como_esta():
+    df = pl.DataFrame({'CO_QUALQUER': ['01', 'x']})
+
+    assert esquema_tabela('tbinexistente') == {}
+    assert aplicar_esquema(df, 'tbinexistente') is df
@@ -0,0 +1,260 @@
+# tests/test_extract_transform.py
+
+import multiprocessing as mp
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from scripts.configs import DIRS, SIH_AGREGADO
+from scripts.extract_transform import (
+    transformar_dados, limitar_threads_polars, concatenar_parquets_por_tabela,
+    tratar_e_deduplicar_tabelas, gerar_historico_cnes,
+    carregar_dicionario_sim, transformar_dados_mortalidade, agregar_internacoes
+)
+from scripts.manifesto import carregar_manifesto, salvar_manifesto, registrar_tabela
+from scripts.utils import caminho_particao, adicionar_hash_linha, codigo_municipio_6
+
+CSVS = {
+    'tbEstado202212.csv': '"CO_UF";"CO_SIGLA_ESTADO";"NO_ESTADO"\n"35";"SP";"SAO PAULO"\n"33";"RJ";"RIO DE JANEIRO"\n',
+    'tbTipoUnidade202212.csv': '"CO_TIPO_UNIDADE";"DS_TIPO_UNIDADE"\n"5";"HOSPITAL GERAL"\n',
+    # código de UF não numérico: a conversão estrita falha
+    'tbEstado202211.csv': '"CO_UF";"CO_SIGLA_ESTADO";"NO_ESTADO"\n"XX";"SP";"SAO PAULO"\n',
+}
+
+
+@pytest.fixture
+def csvs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(DIRS['RAW_CNES'])
+    for nome, conteudo in CSVS.items():
+        with open(os.path.join(DIRS['RAW_CNES'], nome), 'w', encoding='latin1') as f:
+            f.write(conteudo)
+
+
+def test_falha_em_uma_tabela_nao_interrompe_as_demais(csvs, monkeypatch):
+    monkeypatch.delenv('POLARS_MAX_THREADS', raising=False)
+
+    with pytest.raises(RuntimeError, match=r'1 arquivo\(s\): tbEstado202211.csv'):
+        transformar_dados(max_workers=2)
+
+    estados = pl.read_parquet(caminho_particao(DIRS['PARQUET_CNES'], 'tbestado', 2022, 12))
+    assert estados.sort('CO_UF')['CO_SIGLA_ESTADO'].cast(pl.Utf8).to_list() == ['RJ', 'SP']
+    tipos = pl.read_parquet(caminho_particao(DIRS['PARQUET_CNES'], 'tbtipounidade', 2022, 12))
+    assert tipos['CO_TIPO_UNIDADE'].to_list() == [5]
+    assert not os.path.exists(os.path.join(DIRS['PARQUET_CNES'], 'tbestado', 'ano=2022', 'mes=11', 'dados.parquet'))
+
+    # o limite de threads vale só nos processos de conversão
+    assert 'POLARS_MAX_THREADS' not in os.environ
+
+
+def test_limite_de_threads_aplicado_em_cada_processo():
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn'),
+                             initializer=limitar_threads_polars, initargs=(3,)) as executor:
+        assert executor.submit(pl.thread_pool_size).result() == 3
+
+
+def versoes(*pastas):
+    """Identifica cada arquivo gravado nas pastas, para saber quais foram reescritos."""
+    return {
+        os.path.join(raiz, arquivo): (os.stat(os.path.join(raiz, arquivo)).st_ino, os.stat(os.path.join(raiz, arquivo)).st_mtime_ns)
+        for pasta in pastas
+        for raiz, _, arquivos in os.walk(pasta)
+        for arquivo in arquivos
+        if arquivo.endswith('.parquet')
+    }
+
+
+def reescritos(antes, depois):
+    return sorted(os.path.relpath(c, 'data') for c in depois if antes.get(c) != depois[c])
+
+
+def test_conversao_so_refaz_csvs_alterados(csvs):
+    os.remove(os.path.join(DIRS['RAW_CNES'], 'tbEstado202211.csv'))
+    transformar_dados(max_workers=1)
+    antes = versoes(DIRS['PARQUET_CNES'])
+
+    transformar_dados(max_workers=1)
+    assert versoes(DIRS['PARQUET_CNES']) == antes
+
+    caminho = os.path.join(DIRS['RAW_CNES'], 'tbEstado202212.csv')
+    with open(caminho, 'a', encoding='latin1') as f:
+        f.write('"53";"DF";"DISTRITO FEDERAL"\n')
+    transformar_dados(max_workers=1)
+    assert reescritos(antes, versoes(DIRS['PARQUET_CNES'])) == ['parquet/tbestado/ano=2022/mes=12/dados.parquet']
+
+    transformar_dados(max_workers=1, forcar=True)
+    assert len(reescritos(antes, versoes(DIRS['PARQUET_CNES']))) == 2
+
+
+def test_conversao_usa_o_hash_registrado_no_download(csvs):
+    os.remove(os.path.join(DIRS['RAW_CNES'], 'tbEstado202211.csv'))
+    manifesto = carregar_manifesto()
+    for nome in os.listdir(DIRS['RAW_CNES']):
+        registrar_tabela(manifesto, os.path.splitext(nome)[0].lower(), os.path.join(DIRS['RAW_CNES'], nome), 'zip')
+    salvar_manifesto(manifesto)
+
+    transformar_dados(max_workers=1)
+    antes = versoes(DIRS['PARQUET_CNES'])
+
+    # CSV extraído de novo com o mesmo conteúdo: nova data de modificação, mesmo hash
+    os.utime(os.path.join(DIRS['RAW_CNES'], 'tbEstado202212.csv'), (0, 0))
+    transformar_dados(max_workers=1)
+    assert versoes(DIRS['PARQUET_CNES']) == antes
+
+
+# Tabelas deduplicadas por `tratar_e_deduplicar_tabelas`, com suas chaves
+TABELAS_DEDUPLICADAS = {
+    'tbAtividade': ['CO_ATIVIDADE'], 'tbMunicipio': ['CO_MUNICIPIO'], 'tbEstado': ['CO_UF'],
+    'tbTipoUnidade': ['CO_TIPO_UNIDADE'], 'tbTipoEstabelecimento': ['CO_TIPO_ESTABELECIMENTO'],
+    'tbAtributo': ['CO_ATRIBUTO'], 'rlEstabComplementar': ['CO_UNIDADE', 'CO_LEITO', 'CO_TIPO_LEITO'],
+    'tbAtividadeProfissional': ['CO_CBO'],
+}
+
+
+def gravar_mes(tabela, mes, descricao='A'):
+    chaves = TABELAS_DEDUPLICADAS[tabela]
+    df = pl.DataFrame({**{c: ['1', '2'] for c in chaves}, 'DS': [descricao, 'B']})
+    df = adicionar_hash_linha(df).with_columns(pl.lit(f'2022-{mes:02d}-01').alias('data_competencia'))
+    df.write_parquet(caminho_particao(DIRS['PARQUET_CNES'], tabela.lower(), 2022, mes))
+
+
+def processar_tabelas_anuais(forcar=False):
+    concatenar_parquets_por_tabela(sem_copia=False, forcar=forcar)
+    tratar_e_deduplicar_tabelas(forcar=forcar)
+    gerar_historico_cnes(['tbEstado', 'tbMunicipio'], forcar=forcar)
+    return versoes(DIRS['CONCAT_CNES'], DIRS['HISTORICO_CNES'])
+
+
+def test_etapas_anuais_so_refazem_as_tabelas_alteradas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for tabela in TABELAS_DEDUPLICADAS:
+        for mes in (11, 12):
+            gravar_mes(tabela, mes)
+
+    antes = processar_tabelas_anuais()
+    assert len(antes) == len(TABELAS_DEDUPLICADAS) + 2
+    assert processar_tabelas_anuais() == antes
+
+    gravar_mes('tbEstado', 12, descricao='Alterada')
+    depois = processar_tabelas_anuais()
+    assert reescritos(antes, depois) == [
+        'cnes_concatenados/tbestado/ano=2022/dados.parquet',
+        'cnes_historico/tbestado/dados.parquet',
+    ]
+    estados = pl.read_parquet(caminho_particao(DIRS['CONCAT_CNES'], 'tbestado', 2022))
+    assert sorted(estados['DS'].to_list()) == ['A', 'Alterada', 'B']
+
+    assert reescritos(depois, processar_tabelas_anuais(forcar=True)) == reescritos({}, depois)
+
+
+def test_deduplicacao_refeita_quando_a_concatenacao_e_refeita(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for tabela in TABELAS_DEDUPLICADAS:
+        for mes in (11, 12):
+            gravar_mes(tabela, mes)
+    processar_tabelas_anuais()
+
+    # concatenação refeita sem mudança nas entradas: a partição volta a ter os dois meses
+    concatenar_parquets_por_tabela(sem_copia=False, forcar=True)
+    tratar_e_deduplicar_tabelas()
+
+    for tabela in TABELAS_DEDUPLICADAS:
+        assert pl.read_parquet(caminho_particao(DIRS['CONCAT_CNES'], tabela.lower(), 2022)).height == 2
+
+
+def test_decodificacao_do_sim_segue_o_dicionario():
+    dicionario = carregar_dicionario_sim()
+    valores = {
+        coluna: [*campo['codigos'], ' 1 ', 'código inexistente', None]
+        for coluna, campo in dicionario['colunas'].items()
+    }
+    tamanho = max(len(v) for v in valores.values())
+    df = pl.DataFrame({c: v + [None] * (tamanho - len(v)) for c, v in valores.items()})
+
+    decodificado = transformar_dados_mortalidade(df.lazy(), dicionario).collect()
+
+    for coluna, campo in dicionario['colunas'].items():
+        esperado = [
+            campo['codigos'].get(valor.strip(), campo['outros']) if valor is not None else campo['outros']
+            for valor in df[coluna]
+        ]
+        assert isinstance(decodificado.schema[coluna], pl.Enum)
+        assert decodificado[coluna].cast(pl.Utf8).to_list() == esperado
+
+
+def test_decodificacao_do_sim_com_codigos_numericos_e_textos():
+    dicionario = {
+        'colunas': {'SEXO': {'codigos': {'1': 'Masculino', '2': 'Feminino'}, 'outros': 'Ignorado'}},
+        'colunas_titulo': ['OCUP'],
+    }
+    df = pl.DataFrame({'SEXO': [1, 2, 9], 'OCUP': [' PEDREIRO ', 'médico', None], 'CODESTAB': [' 2077477', None, '']})
+
+    decodificado = transformar_dados_mortalidade(df, dicionario)
+
+    assert decodificado.schema['SEXO'] == pl.Enum(['Masculino', 'Feminino', 'Ignorado'])
+    assert decodificado['SEXO'].cast(pl.Utf8).to_list() == ['Masculino', 'Feminino', 'Ignorado']
+    assert decodificado['OCUP'].to_list() == ['Pedreiro', 'Médico', None]
+    assert decodificado['CODESTAB'].to_list() == ['2077477', None, '']
+
+
+def gerar_aihs(mes, n=400):
+    """AIHs reduzidas fictícias de um mês, com códigos de 6 e 7 dígitos e CNES com espaços."""
+    sorteio = random.Random(mes)
+    municipios = ['355030', '3550308', '330455', '3304557', '110020', None]
+    return pl.DataFrame({
+        'MUNIC_MOV': [sorteio.choice(municipios) for _ in range(n)],
+        'MUNIC_RES': [sorteio.choice(municipios) for _ in range(n)],
+        'CNES': [sorteio.choice(['2077477', ' 2077477', '2078015 ', '2786435', None]) for _ in range(n)],
+        'MORTE': [sorteio.choice(['0', '0', '0', '1']) for _ in range(n)],
+        'DIAS_PERM': [str(sorteio.randint(0, 30)) for _ in range(n)],
+        'QT_DIARIAS': [str(sorteio.randint(1, 30)) for _ in range(n)],
+        # múltiplos de 0,25 somam sem erro de arredondamento em qualquer ordem
+        'VAL_TOT': [str(sorteio.randint(0, 400_000) / 4) for _ in range(n)],
+    })
+
+
+def test_agregacao_das_internacoes_igual_a_uma_passada_unica(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(DIRS['BASE_INTERNACOES'])
+    meses = {mes: gerar_aihs(mes) for mes in (1, 2, 3)}
+    for mes, aihs in meses.items():
+        aihs.write_parquet(os.path.join(DIRS['BASE_INTERNACOES'], f'RDSP22{mes:02d}.parquet'))
+    # arquivo de outro ano fica de fora
+    gerar_aihs(12).write_parquet(os.path.join(DIRS['BASE_INTERNACOES'], 'RDSP2112.parquet'))
+
+    agregar_internacoes(2022, max_workers=2)
+
+    aihs = pl.concat(meses.values())
+    total = pl.len().cast(pl.Int64)
+    esperado = (
+        aihs.with_columns(
+            codigo_municipio_6('MUNIC_MOV').alias('cod_mun6'),
+            codigo_municipio_6('MUNIC_RES').alias('cod_mun6_residencia'),
+            pl.col('CNES').str.strip_chars(),
+            *[pl.col(c).cast(pl.Int64) for c in ('MORTE', 'DIAS_PERM', 'QT_DIARIAS')],
+            pl.col('VAL_TOT').cast(pl.Float64),
+        )
+        .filter(pl.col('cod_mun6').is_not_null())
+        .group_by('cod_mun6')
+        .agg(
+            total.alias('total_internacoes'),
+            (pl.col('MORTE').sum() / total).round(4).alias('obitos_por_internacao'),
+            pl.col('CNES').drop_nulls().n_unique().cast(pl.Int64).alias('total_hospitais'),
+            pl.col('DIAS_PERM').sum().alias('total_dias_permanencia'),
+            pl.col('QT_DIARIAS').sum().alias('total_diarias'),
+            pl.col('VAL_TOT').sum().round(2).alias('total_valor'),
+            (pl.col('VAL_TOT').sum() / pl.col('QT_DIARIAS').sum()).round(2).alias('valor_medio_diaria'),
+            pl.col('MORTE').sum().alias('total_obitos_em_internacao'),
+            pl.col('cod_mun6_residencia').drop_nulls().n_unique().cast(pl.Int64).alias('total_municipio_atendidos'),
+        )
+        .select(pl.col('cod_mun6').cast(pl.Utf8).str.zfill(6).alias('codigo_municipio'), pl.all())
+        .sort('cod_mun6')
+    )
+
+    agregado = pl.read_parquet(os.path.join(DIRS['FINAL_INTERNACOES'], SIH_AGREGADO))
+    assert agregado['codigo_municipio'].to_list() == ['110020', '330455', '355030']
+    assert_frame_equal(agregado, esperado)
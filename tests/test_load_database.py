@@ -0,0 +1,387 @@
+# tests/test_load_database.py
+
+import os
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from scripts import load_database
+from scripts.configs import DIRS
+from scripts.load_database import (
+    conectar_duckdb, carregar_tabelas, carregar_tabelas_incrementais, atualizar_etapas,
+    conferir_paridade_tabela_final, criar_visao_tipos_unidade, exportar_consulta,
+    consultas_cnes, consultas_cidades_ibge, consultas_mortalidade, consultas_ibge_adicionais
+)
+
+ANO = 2022
+COMPETENCIA = '2022-12-01'
+
+# São Paulo tem várias unidades ativas e uma desativada; o Rio, uma unidade sem leitos,
+# óbitos ou profissionais; Porto Velho está no CNES e no IBGE, mas sem nenhuma unidade
+MUNICIPIOS = [
+    (355030, 3550308, 'SP', 'São Paulo', 11_451_245.0),
+    (330455, 3304557, 'RJ', 'Rio de Janeiro', 6_211_423.0),
+    (110020, 1100205, 'RO', 'Porto Velho', 460_434.0),
+]
+
+# CO_UNIDADE, CO_CNES, cod_mun6, TP_UNIDADE, CO_MOTIVO_DESAB
+ESTABELECIMENTOS = [
+    ('3550302077477', 2077477, 355030, 5, ''),
+    ('3550302078015', 2078015, 355030, 5, ''),
+    ('3550302786435', 2786435, 355030, 2, ''),
+    ('3550303190102', 3190102, 355030, 1, ''),
+    ('3550309999999', 9999999, 355030, 2, '01'),
+    ('3304552270250', 2270250, 330455, 2, ''),
+]
+
+
+def escrever(caminho, linhas, esquema):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    pl.DataFrame(linhas, schema=esquema, orient='row').write_parquet(caminho)
+
+
+def escrever_cnes(tabela, linhas, esquema, ano=ANO):
+    escrever(os.path.join(DIRS['CONCAT_CNES'], tabela, f'ano={ano}', 'dados.parquet'), linhas, esquema)
+
+
+def escrever_estabelecimentos(estabelecimentos, ano=ANO):
+    escrever_cnes('tbestabelecimento', [
+        (unidade, cnes, f'Unidade {cnes}', f'UNIDADE {cnes}', tipo, 3, 1, mun6, motivo, 'M', 'N')
+        for unidade, cnes, mun6, tipo, motivo in estabelecimentos
+    ], {
+        'CO_UNIDADE': pl.Utf8, 'CO_CNES': pl.Int32, 'NO_RAZAO_SOCIAL': pl.Utf8, 'NO_FANTASIA': pl.Utf8,
+        'TP_UNIDADE': pl.Int16, 'CO_TIPO_ESTABELECIMENTO': pl.Int16, 'CO_ATIVIDADE_PRINCIPAL': pl.Int16,
+        'cod_mun6': pl.Int32, 'CO_MOTIVO_DESAB': pl.Utf8, 'TP_GESTAO': pl.Utf8, 'TP_ESTAB_SEMPRE_ABERTO': pl.Utf8,
+    }, ano)
+
+
+def escrever_cidades(municipios=MUNICIPIOS):
+    escrever(os.path.join(DIRS['FINAL_CIDADES'], 'cidades_ibge_2022.parquet'), [
+        (nome, str(mun7), 1_000.0 + i, populacao, populacao / 1_000, 97.0, 0.8 - i / 10, 10.0 + i,
+         1e9, 9e8, 50_000.0, uf, mun6, mun7)
+        for i, (mun6, mun7, uf, nome, populacao) in enumerate(municipios)
+    ], {
+        'nome': pl.Utf8, 'codigo_municipio': pl.Utf8, 'area_km2': pl.Float64, 'populacao_residente': pl.Float64,
+        'densidade_demografica': pl.Float64, 'escolarizacao_6_14': pl.Float64, 'idhm': pl.Float64,
+        'mortalidade_infantil': pl.Float64, 'total_receitas_brutas_realizadas': pl.Float64,
+        'total_despesas_brutas_empenhadas': pl.Float64, 'pib_per_capita': pl.Float64, 'uf': pl.Utf8,
+        'cod_mun6': pl.Int32, 'cod_mun7': pl.Int32,
+    })
+
+
+def escrever_mortalidade(dataset, linhas, esquema):
+    escrever(os.path.join(DIRS['FINAL_MORTALIDADE'], dataset, f'ano={ANO}', 'dados.parquet'), linhas, esquema)
+
+
+def criar_origens():
+    """Parquets de origem da tabela principal, com os caminhos e tipos do pipeline."""
+    escrever_estabelecimentos(ESTABELECIMENTOS)
+    escrever_cnes('tbmunicipio', [
+        (mun6, uf, nome.upper(), mun6, mun7) for mun6, mun7, uf, nome, _ in MUNICIPIOS
+    ], {
+        'CO_MUNICIPIO': pl.Int32, 'CO_SIGLA_ESTADO': pl.Utf8, 'NO_MUNICIPIO': pl.Utf8,
+        'cod_mun6': pl.Int32, 'cod_mun7': pl.Int32,
+    })
+    escrever_cnes('tbtipounidade', [
+        (1, 'POSTO DE SAUDE'), (2, 'CENTRO DE SAUDE/UNIDADE BASICA'), (5, 'HOSPITAL GERAL'),
+    ], {'CO_TIPO_UNIDADE': pl.Int16, 'DS_TIPO_UNIDADE': pl.Utf8})
+    escrever_cnes('tbtipoestabelecimento', [(3, 'UNIDADE DE SAUDE')], {
+        'CO_TIPO_ESTABELECIMENTO': pl.Int16, 'DS_TIPO_ESTABELECIMENTO': pl.Utf8,
+    })
+    escrever_cnes('tbatividade', [(1, 'ATENCAO BASICA', 'ATENCAO PRIMARIA')], {
+        'CO_ATIVIDADE': pl.Int16, 'DS_ATIVIDADE': pl.Utf8, 'DS_CONCEITO_ATIVIDADE': pl.Utf8,
+    })
+    # Dois tipos de leito na mesma unidade; a competência anterior não entra na tabela final
+    escrever_cnes('rlestabcomplementar', [
+        ('3550302077477', 10, 8, COMPETENCIA),
+        ('3550302077477', 5, 5, COMPETENCIA),
+        ('3550302078015', 20, 0, COMPETENCIA),
+        ('3550302078015', 99, 99, '2022-11-01'),
+        ('3550309999999', 7, 7, COMPETENCIA),
+    ], {'CO_UNIDADE': pl.Utf8, 'QT_EXIST': pl.Int32, 'QT_SUS': pl.Int32, 'data_competencia': pl.Utf8})
+    escrever_cnes('tbatividadeprofissional', [
+        ('225125', 'MEDICO CLINICO', 'M', 'S'),
+        ('223505', 'ENFERMEIRO', 'E', 'S'),
+        ('322205', 'TECNICO DE ENFERMAGEM', 'T', 'S'),
+    ], {
+        'CO_CBO': pl.Utf8, 'DS_ATIVIDADE_PROFISSIONAL': pl.Utf8,
+        'TP_CLASSIFICACAO_PROFISSIONAL': pl.Utf8, 'TP_CBO_SAUDE': pl.Utf8,
+    })
+    # O médico 'P1' atende em duas unidades e conta uma vez no município
+    escrever_cnes('tbcargahorariasus', [
+        ('3550302077477', '225125', 'P1', 'S'),
+        ('3550302078015', '225125', 'P1', 'S'),
+        ('3550302786435', '225125', 'P2', 'S'),
+        ('3550302786435', '223505', 'P3', 'N'),
+        ('3550303190102', '322205', 'P4', 'S'),
+    ], {'CO_UNIDADE': pl.Utf8, 'CO_CBO': pl.Utf8, 'CO_PROFISSIONAL_SUS': pl.Utf8, 'TP_SUS_NAO_SUS': pl.Utf8})
+
+    escrever_mortalidade('mortalidade', [(355030, 'Hospital')], {'CODMUNOCOR': pl.Int32, 'LOCOCOR': pl.Utf8})
+    escrever_mortalidade('obitos_estabelecimento', [
+        (2077477, 'Hospital', 12), (2077477, 'Domicílio', 3), (2786435, 'Hospital', 1),
+    ], {'CODESTAB': pl.Int32, 'LOCOCOR': pl.Utf8, 'qtd_obitos': pl.Int32})
+    for dataset, coluna in (('obitos_municipio_ocorrencia', 'CODMUNOCOR'), ('obitos_municipio_residencia', 'CODMUNRES')):
+        escrever_mortalidade(dataset, [
+            (355030, 'Hospital', 40, 355030), (355030, 'Domicílio', 9, 355030),
+            (330455, 'Hospital', 25, 330455), (110020, 'Hospital', 4, 110020),
+        ], {coluna: pl.Int32, 'LOCOCOR': pl.Utf8, 'qtd_obitos': pl.Int32, 'cod_mun6': pl.Int32})
+
+    escrever_cidades()
+
+    # Tabelas complementares do IBGE; o Rio fica fora da taxa de coleta de lixo
+    complementares = {
+        'taxa_de_alfabetizacao': ['total'],
+        'taxa_coleta_lixo': ['pct_coletado'],
+        'taxa_rede_esgoto': ['sim', 'nao'],
+        'anos_de_estudo': ['total', '11_14', '15_17', '18_24', '25_mais'],
+        'taxa_populacao_nivel_instrucao': [
+            'sem_instrucao_fundamental_incompleto', 'fundamental_completo_medio_incompleto',
+            'medio_completo_superior_incompleto', 'superior_completo',
+        ],
+        'pop_res_favela': ['total'],
+        'taxa_situacao_domicilio': ['urbana', 'rural'],
+        'taxa_frequencia_escolar': ['total'],
+        'taxa_distribuicao_etaria': ['pct_60_mais'],
+    }
+    for tabela, colunas in complementares.items():
+        escrever(os.path.join(DIRS['FINAL_IBGE'], f'{tabela}.parquet'), [
+            (str(mun7), nome, *(float(10 * j + i) for j in range(len(colunas))), mun6, mun7)
+            for i, (mun6, mun7, _, nome, _) in enumerate(MUNICIPIOS)
+            if not (tabela == 'taxa_coleta_lixo' and mun6 == 330455)
+        ], {
+            'codigo': pl.Utf8, 'nome': pl.Utf8, **{coluna: pl.Float64 for coluna in colunas},
+            'cod_mun6': pl.Int32, 'cod_mun7': pl.Int32,
+        })
+
+
+def consultas_origem():
+    return {
+        **consultas_cnes(),
+        **consultas_cidades_ibge(),
+        **consultas_mortalidade(),
+        **consultas_ibge_adicionais(),
+    }
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """Banco em memória com as origens da tabela principal como views sobre os Parquets."""
+    monkeypatch.chdir(tmp_path)
+    criar_origens()
+    conexao = conectar_duckdb(':memory:')
+    carregar_tabelas(consultas_origem(), conexao, modo='visao')
+    yield conexao
+    conexao.close()
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco em arquivo com as origens da tabela principal ainda não carregadas."""
+    monkeypatch.chdir(tmp_path)
+    criar_origens()
+    conexao = conectar_duckdb(str(tmp_path / 'banco.duckdb'))
+    yield conexao
+    conexao.close()
+
+
+def contagens(conexao):
+    """Linhas de cada tabela e view de `main`."""
+    nomes = conexao.execute(
+        "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main' ORDER BY table_name"
+    ).fetchall()
+    return {nome: conexao.execute(f'SELECT COUNT(*) FROM main.{nome}').fetchone()[0] for (nome,) in nomes}
+
+
+def test_tabela_final_identica_a_do_grao_de_estabelecimento(conn):
+    assert conferir_paridade_tabela_final(conn, ANO)
+
+
+def test_tabela_final_por_municipio(conn):
+    conferir_paridade_tabela_final(conn, ANO)
+    final = {linha['cod_mun6']: linha for linha in conn.execute("SELECT * FROM main.tabela_final").pl().to_dicts()}
+
+    # Porto Velho, sem unidades, não aparece; a unidade desativada não entra nas somas
+    assert set(final) == {355030, 330455}
+
+    sp, rj = final[355030], final[330455]
+    assert sp['codigo_municipio'] == '355030'
+    assert sp['qtd_unidades'] == 4
+    assert (sp['leitos_existentes'], sp['leitos_sus']) == (35, 13)
+    assert sp['quantidade_unidades_com_leito'] == 2
+    assert sp['obitos_em_estabelecimentos'] == 16
+    assert sp['total_obitos'] == 49
+    assert sp['medicos_por_k_habitante'] == pytest.approx(2 / 11_451_245.0 * 1000)
+
+    assert rj['qtd_unidades'] == 1
+    assert rj['leitos_existentes'] is None and rj['obitos_em_estabelecimentos'] is None
+    assert rj['medicos_por_k_habitante'] is None
+    assert rj['pct_coleta_lixo'] is None
+
+
+def test_paridade_detecta_divergencia(conn, monkeypatch):
+    referencia = load_database.CONSULTA_TABELA_FINAL_ESTABELECIMENTOS
+    monkeypatch.setattr(
+        load_database, 'CONSULTA_TABELA_FINAL_ESTABELECIMENTOS',
+        referencia.replace('CAST(SUM(leitos_existentes) AS BIGINT)', 'CAST(MAX(leitos_existentes) AS BIGINT)')
+    )
+    assert not conferir_paridade_tabela_final(conn, ANO)
+
+
+def test_exportar_varios_formatos_com_uma_execucao(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    conn = conectar_duckdb(':memory:')
+    # nextval avança a cada execução da consulta: uma só execução numera as linhas de 1 a 5
+    conn.execute("CREATE SEQUENCE execucoes")
+    consulta = "SELECT x, nextval('execucoes') AS n, SUM(x) OVER () AS total FROM range(5) t(x)"
+
+    caminhos = exportar_consulta(
+        conn, consulta, str(tmp_path / 'saida' / 'teste'),
+        formatos=['parquet', 'arrow', 'csv'], linhas_por_grupo=2, ordenacao=['x DESC']
+    )
+
+    assert conn.execute("SELECT currval('execucoes')").fetchone()[0] == 5
+    saidas = [
+        pl.read_parquet(caminhos['parquet']),
+        pl.from_arrow(pa.ipc.open_file(caminhos['arrow']).read_all()),
+        pl.read_csv(caminhos['csv'], schema_overrides={'total': pl.Float64}),
+    ]
+    for saida in saidas:
+        assert saida['x'].to_list() == [4, 3, 2, 1, 0]
+        assert saida.equals(saidas[0])
+    # SUM de inteiros (HUGEINT) sai como DOUBLE, como no COPY
+    assert saidas[0].schema['total'] == pl.Float64
+    assert pq.ParquetFile(caminhos['parquet']).metadata.num_row_groups == 3
+    assert sorted(os.listdir(tmp_path / 'saida')) == ['teste.arrow', 'teste.csv', 'teste.parquet']
+
+
+def test_carga_incremental_repetida_nao_altera_as_tabelas(banco):
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+    antes = contagens(banco)
+    assert antes['tbestabelecimento'] == len(ESTABELECIMENTOS)
+
+    resultados = carregar_tabelas_incrementais(consultas_origem(), banco)
+
+    assert contagens(banco) == antes
+    assert all(linhas in (0, None) for linhas, _ in resultados.values())
+
+
+def test_carga_incremental_atualiza_insere_e_remove_linhas(banco):
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+
+    # a unidade 2078015 muda de tipo, a 3190102 some da origem e a 1234567 é nova
+    alterados = [
+        (unidade, cnes, mun6, 2 if cnes == 2078015 else tipo, motivo)
+        for unidade, cnes, mun6, tipo, motivo in ESTABELECIMENTOS if cnes != 3190102
+    ] + [('3304551234567', 1234567, 330455, 1, '')]
+    escrever_estabelecimentos(alterados)
+
+    resultados = carregar_tabelas_incrementais(consultas_origem(), banco)
+
+    assert resultados['tbestabelecimento'][0] == len(alterados)
+    atual = dict(banco.execute("SELECT CO_CNES, TP_UNIDADE FROM tbestabelecimento WHERE ano = ?", (ANO,)).fetchall())
+    assert atual == {cnes: tipo for _, cnes, _, tipo, _ in alterados}
+    # as linhas atualizadas por upsert continuam com chave única
+    assert banco.execute("SELECT COUNT(*) = COUNT(DISTINCT CO_CNES) FROM tbestabelecimento").fetchone()[0]
+
+
+def test_carga_incremental_ignora_particoes_sem_alteracao(banco):
+    anterior = [(unidade, cnes, mun6, tipo, '01') for unidade, cnes, mun6, tipo, _ in ESTABELECIMENTOS]
+    escrever_estabelecimentos(anterior, ano=ANO - 1)
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+    controle = "SELECT particao, impressao, carregado_em FROM _controle_cargas WHERE tabela = 'tbestabelecimento' ORDER BY particao"
+    antes = banco.execute(controle).fetchall()
+
+    escrever_estabelecimentos(ESTABELECIMENTOS[:2])
+    resultados = carregar_tabelas_incrementais(consultas_origem(), banco)
+    depois = banco.execute(controle).fetchall()
+
+    # só a partição de 2022 foi relida; a de 2021 mantém impressão, data de carga e linhas
+    assert resultados['tbestabelecimento'][0] == 2
+    assert [p for p, _, _ in depois] == [str(ANO - 1), str(ANO)]
+    assert depois[0] == antes[0] and depois[1] != antes[1]
+    assert banco.execute(
+        "SELECT ano, COUNT(*) FROM tbestabelecimento GROUP BY ano ORDER BY ano"
+    ).fetchall() == [(ANO - 1, len(ESTABELECIMENTOS)), (ANO, 2)]
+
+
+def test_recarga_das_cidades_nao_multiplica_o_join_socio_economico(banco):
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+    atualizar_etapas(banco, ANO)
+    antes = banco.execute("SELECT cod_mun6, populacao FROM etapas.socio_economicos ORDER BY cod_mun6").fetchall()
+
+    # nova estimativa de população de São Paulo
+    escrever_cidades([(*m[:4], 12_000_000.0) if m[0] == 355030 else m for m in MUNICIPIOS])
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+    recalculadas = atualizar_etapas(banco, ANO)
+
+    assert 'socio_economicos' in recalculadas
+    assert banco.execute("SELECT COUNT(*) FROM tb_cidades_ibge_2022").fetchone()[0] == len(MUNICIPIOS)
+    depois = banco.execute("SELECT cod_mun6, populacao FROM etapas.socio_economicos ORDER BY cod_mun6").fetchall()
+    assert [m for m, _ in depois] == [m for m, _ in antes]
+    assert dict(depois)[355030] == 12_000_000.0
+    assert banco.execute("SELECT COUNT(*) FROM tabela_final").fetchone()[0] == 2
+
+
+def test_etapas_sem_alteracoes_nao_sao_recalculadas(banco):
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+
+    assert sorted(atualizar_etapas(banco, ANO)) == sorted(load_database.ETAPAS_PRINCIPAL)
+    assert atualizar_etapas(banco, ANO) == []
+    assert sorted(atualizar_etapas(banco, ANO, forcar=True)) == sorted(load_database.ETAPAS_PRINCIPAL)
+
+
+def test_novos_obitos_recalculam_so_as_etapas_de_obitos(banco):
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+    atualizar_etapas(banco, ANO)
+
+    # novo fechamento do SIM: mais óbitos em estabelecimentos e no município
+    escrever_mortalidade('obitos_estabelecimento', [
+        (2077477, 'Hospital', 15), (2077477, 'Domicílio', 3), (2786435, 'Hospital', 1),
+    ], {'CODESTAB': pl.Int32, 'LOCOCOR': pl.Utf8, 'qtd_obitos': pl.Int32})
+    escrever_mortalidade('obitos_municipio_ocorrencia', [
+        (355030, 'Hospital', 43, 355030), (355030, 'Domicílio', 9, 355030),
+        (330455, 'Hospital', 25, 330455), (110020, 'Hospital', 4, 110020),
+    ], {'CODMUNOCOR': pl.Int32, 'LOCOCOR': pl.Utf8, 'qtd_obitos': pl.Int32, 'cod_mun6': pl.Int32})
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+
+    assert atualizar_etapas(banco, ANO) == [
+        'obitos_por_estabelecimento', 'obitos_total', 'estabelecimentos_com_obitos',
+        'estabelecimentos_municipio', 'tabela_final',
+    ]
+    sp = banco.execute(
+        "SELECT obitos_em_estabelecimentos, total_obitos FROM tabela_final WHERE cod_mun6 = 355030"
+    ).fetchone()
+    assert sp == (19, 52)
+
+
+def test_origem_em_visao_sempre_recalcula_suas_etapas(banco, monkeypatch):
+    monkeypatch.setitem(load_database.DUCKDB_MODOS, 'tbcargahorariasus', 'visao')
+    carregar_tabelas_incrementais(consultas_origem(), banco)
+    atualizar_etapas(banco, ANO)
+
+    # sem impressão da view, profissionais e o que depende dela são refeitos a cada execução
+    assert sorted(atualizar_etapas(banco, ANO)) == ['enfermeiros', 'medicos', 'profissionais', 'tabela_final']
+
+
+def test_visao_tipos_unidade_tem_uma_coluna_por_tipo_do_catalogo(conn):
+    # tipo sem unidades e com aspas no nome também vira coluna
+    escrever_cnes('tbtipounidade', [
+        (1, 'POSTO DE SAUDE'), (2, 'CENTRO DE SAUDE/UNIDADE BASICA'), (5, 'HOSPITAL GERAL'),
+        (40, 'UNIDADE MOVEL "TERRESTRE"'),
+    ], {'CO_TIPO_UNIDADE': pl.Int16, 'DS_TIPO_UNIDADE': pl.Utf8})
+    atualizar_etapas(conn, ANO)
+
+    tipos = criar_visao_tipos_unidade(conn, ANO)
+
+    catalogo = [t for (t,) in conn.execute("SELECT DS_TIPO_UNIDADE FROM tbtipounidade ORDER BY CO_TIPO_UNIDADE").fetchall()]
+    assert tipos == catalogo
+    pivot = conn.execute(f"SELECT * FROM {load_database.VISAO_TIPOS_UNIDADE}").pl()
+    assert pivot.columns == ['cod_mun6', *catalogo]
+
+    longo = conn.execute("SELECT cod_mun6, DS_TIPO_UNIDADE, COUNT(*) FROM etapas.tabela_completa GROUP BY ALL").fetchall()
+    for cod_mun6, tipo, quantidade in longo:
+        assert pivot.filter(pl.col('cod_mun6') == cod_mun6)[tipo].item() == quantidade
+    assert pivot['UNIDADE MOVEL "TERRESTRE"'].null_count() == pivot.height
+    assert pivot.height == len({cod_mun6 for cod_mun6, _, _ in longo})
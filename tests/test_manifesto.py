@@ -0,0 +1,145 @@
+# tests/test_manifesto.py
+
+import json
+import os
+from ftplib import FTP
+
+import pytest
+
+from scripts.manifesto import (
+    carregar_manifesto, salvar_manifesto, listar_arquivos_remotos, arquivo_alterado,
+    registrar_arquivo, registrar_tabela, impressao_tabela, etapa_atualizada,
+    registrar_etapa, impressao_etapa
+)
+
+ZIP = 'BASE_DE_DADOS_CNES_202212.zip'
+REMOTO = {'tamanho': 100, 'modificado': '20230115120000'}
+
+
+@pytest.fixture
+def manifesto(tmp_path):
+    """Manifesto com um zip baixado e uma tabela extraída dele em `tmp_path`."""
+    manifesto = carregar_manifesto(str(tmp_path / 'manifesto.json'))
+    (tmp_path / ZIP).write_bytes(b'zip')
+    (tmp_path / 'tbEstado202212.csv').write_text('"CO_UF"\n"35"\n')
+
+    registrar_arquivo(manifesto, ZIP, REMOTO, str(tmp_path / ZIP))
+    registrar_tabela(manifesto, 'tbestado202212', str(tmp_path / 'tbEstado202212.csv'), ZIP)
+    return manifesto
+
+
+def conectar(servidor):
+    ftp = FTP()
+    ftp.connect(servidor.kwargs['host'], servidor.kwargs['porta'], timeout=10)
+    ftp.login()
+    return ftp
+
+
+def test_manifesto_inexistente_vem_vazio(tmp_path):
+    assert carregar_manifesto(str(tmp_path / 'nao_existe.json')) == {'arquivos': {}, 'tabelas': {}, 'etapas': {}}
+
+
+def test_arquivo_alterado(manifesto, tmp_path):
+    assert not arquivo_alterado(manifesto, ZIP, REMOTO)
+
+    assert arquivo_alterado(manifesto, 'BASE_DE_DADOS_CNES_202301.zip', REMOTO)
+    assert arquivo_alterado(manifesto, ZIP, {**REMOTO, 'tamanho': 101})
+    assert arquivo_alterado(manifesto, ZIP, {**REMOTO, 'modificado': '20230116120000'})
+
+    # tabela extraída apagada do disco: o zip precisa ser baixado de novo
+    os.remove(tmp_path / 'tbEstado202212.csv')
+    assert arquivo_alterado(manifesto, ZIP, REMOTO)
+
+
+def test_registrar_so_atualiza_alterado_em_quando_o_conteudo_muda(manifesto, tmp_path):
+    csv = str(tmp_path / 'tbEstado202212.csv')
+    manifesto['tabelas']['tbestado202212']['alterado_em'] = '2000-01-01T00:00:00'
+
+    assert not registrar_tabela(manifesto, 'tbestado202212', csv, ZIP)
+    assert manifesto['tabelas']['tbestado202212']['alterado_em'] == '2000-01-01T00:00:00'
+
+    (tmp_path / 'tbEstado202212.csv').write_text('"CO_UF"\n"33"\n')
+    assert registrar_tabela(manifesto, 'tbestado202212', csv, ZIP)
+    assert manifesto['tabelas']['tbestado202212']['alterado_em'] > '2000-01-01T00:00:00'
+
+    # o mesmo zip, republicado com outra data, mas com o mesmo conteúdo
+    assert not registrar_arquivo(manifesto, ZIP, {**REMOTO, 'modificado': '20230116120000'}, str(tmp_path / ZIP))
+    assert manifesto['arquivos'][ZIP]['modificado'] == '20230116120000'
+
+
+def test_salvar_manifesto_e_atomico(manifesto, tmp_path):
+    caminho = str(tmp_path / 'dados' / 'manifesto.json')
+    salvar_manifesto(manifesto, caminho)
+    assert carregar_manifesto(caminho) == manifesto
+    assert os.listdir(tmp_path / 'dados') == ['manifesto.json']
+
+    # uma falha na gravação não corrompe o manifesto anterior nem deixa o temporário
+    with pytest.raises(TypeError):
+        salvar_manifesto({**manifesto, 'invalido': object()}, caminho)
+    with open(caminho, encoding='utf-8') as f:
+        assert json.load(f) == manifesto
+    assert os.listdir(tmp_path / 'dados') == ['manifesto.json']
+
+
+def test_listar_arquivos_remotos_com_mlsd(servidor_ftp):
+    for nome, tamanho in ((ZIP, 10), ('BASE_DE_DADOS_CNES_202301.zip', 20), ('LEIAME.txt', 5)):
+        (servidor_ftp.pasta / nome).write_bytes(b'x' * tamanho)
+        os.utime(servidor_ftp.pasta / nome, (1673784000, 1673784000))
+    (servidor_ftp.pasta / 'BASE_DE_DADOS_CNES_209912.zip').mkdir()
+
+    ftp = conectar(servidor_ftp)
+    remotos = listar_arquivos_remotos(ftp, 'BASE_DE_DADOS_CNES_??????.zip')
+    ftp.quit()
+
+    assert remotos == {
+        ZIP: {'tamanho': 10, 'modificado': '20230115120000'},
+        'BASE_DE_DADOS_CNES_202301.zip': {'tamanho': 20, 'modificado': '20230115120000'},
+    }
+
+
+def test_listar_arquivos_remotos_sem_mlsd_usa_nlst_size_e_mdtm(servidor_ftp, monkeypatch):
+    for nome, tamanho in ((ZIP, 10), ('LEIAME.txt', 5)):
+        (servidor_ftp.pasta / nome).write_bytes(b'x' * tamanho)
+        os.utime(servidor_ftp.pasta / nome, (1673784000, 1673784000))
+
+    comandos = {k: v for k, v in servidor_ftp.handler.proto_cmds.items() if k != 'MLSD'}
+    monkeypatch.setattr(servidor_ftp.handler, 'proto_cmds', comandos)
+
+    ftp = conectar(servidor_ftp)
+    enviados = []
+    envio = ftp.putcmd
+    monkeypatch.setattr(ftp, 'putcmd', lambda linha: enviados.append(linha.split()[0]) or envio(linha))
+    remotos = listar_arquivos_remotos(ftp, 'BASE_DE_DADOS_CNES_??????.zip')
+    ftp.quit()
+
+    assert remotos == {ZIP: {'tamanho': 10, 'modificado': '20230115120000'}}
+    assert {'MLSD', 'NLST', 'SIZE', 'MDTM'} <= set(enviados)
+
+
+def test_etapa_atualizada(manifesto, tmp_path):
+    csv = str(tmp_path / 'tbEstado202212.csv')
+    saida = tmp_path / 'dados.parquet'
+    saida.write_bytes(b'parquet')
+    impressao = impressao_tabela(manifesto, csv)
+
+    # a impressão de uma tabela baixada é o hash registrado no download
+    assert impressao == manifesto['tabelas']['tbestado202212']['sha256']
+    assert not etapa_atualizada(manifesto, 'conversao', 'tbEstado202212.csv', impressao, [str(saida)])
+
+    registrar_etapa(manifesto, 'conversao', 'tbEstado202212.csv', impressao)
+    assert etapa_atualizada(manifesto, 'conversao', 'tbEstado202212.csv', impressao, [str(saida)])
+    assert not etapa_atualizada(manifesto, 'conversao', 'tbEstado202212.csv', 'outra', [str(saida)])
+    assert not etapa_atualizada(manifesto, 'conversao', 'tbEstado202212.csv', None)
+
+    os.remove(saida)
+    assert not etapa_atualizada(manifesto, 'conversao', 'tbEstado202212.csv', impressao, [str(saida)])
+
+
+def test_impressao_etapa_muda_a_cada_processamento(manifesto):
+    assert impressao_etapa(manifesto, 'concatenacao', 'tbestado/2022') is None
+
+    registrar_etapa(manifesto, 'concatenacao', 'tbestado/2022', 'abc')
+    primeira = impressao_etapa(manifesto, 'concatenacao', 'tbestado/2022')
+    registrar_etapa(manifesto, 'concatenacao', 'tbestado/2022', 'abc')
+
+    assert impressao_etapa(manifesto, 'concatenacao', 'tbestado/2022') != primeira
@@ -0,0 +1,167 @@
+# tests/test_utils.py
+
+import hashlib
+import io
+from datetime import date
+
+import polars as pl
+
+from scripts import utils
+from scripts.esquemas import esquema_tabela
+from scripts.utils import adicionar_hash_linha, montar_intervalos_validade, escanear_snapshot, escanear_csv_cnes
+
+LINHA = {
+    'CO_UNIDADE': ['123'],
+    'QT_EXIST': [1],
+    'TP_PACTO': ['S'],
+    'data_competencia': ['2022-12-01'],
+}
+
+
+def blake2b_64(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode(), digest_size=8).digest(), 'little')
+
+
+def test_hash_linha_fixo_para_uma_linha_conhecida():
+    df = adicionar_hash_linha(pl.DataFrame(LINHA))
+
+    assert df.schema['hash_linha'] == pl.UInt64
+    assert df['hash_linha'].to_list() == [8748385575796402823]
+    assert df['hash_linha'][0] == blake2b_64('CO_UNIDADE=3:123|QT_EXIST=1:1|TP_PACTO=1:S')
+
+
+def test_hash_linha_independe_da_ordem_e_da_codificacao_das_colunas():
+    base = adicionar_hash_linha(pl.DataFrame(LINHA))['hash_linha']
+
+    invertida = pl.DataFrame(LINHA).select(reversed(list(LINHA)))
+    categorica = pl.DataFrame(LINHA).with_columns(pl.col('TP_PACTO').cast(pl.Enum(['N', 'S'])))
+    municipio = pl.DataFrame(LINHA).with_columns(pl.lit(355030).alias('cod_mun6'))
+    outro_mes = pl.DataFrame(LINHA).with_columns(pl.lit('2023-01-01').alias('data_competencia'))
+
+    for df in (invertida, categorica, municipio, outro_mes):
+        assert adicionar_hash_linha(df)['hash_linha'].equals(base)
+
+
+def test_hash_linha_distingue_nulo_vazio_e_fronteiras_entre_colunas():
+    df = pl.DataFrame({
+        'A': ['a|B=1:b', 'a', 'a', 'a', None],
+        'B': [None, '|B=1:b', 'b', '', ''],
+    })
+    hashes = adicionar_hash_linha(df, ignorar=())['hash_linha']
+
+    assert hashes.n_unique() == len(df)
+    assert hashes[4] == blake2b_64('A=-|B=0:')
+
+
+def test_hash_linha_em_streaming(tmp_path):
+    caminho = tmp_path / 'dados.parquet'
+    adicionar_hash_linha(pl.LazyFrame(LINHA)).sink_parquet(caminho)
+
+    assert pl.read_parquet(caminho)['hash_linha'].to_list() == [8748385575796402823]
+
+
+# Retratos mensais: 'A' não muda; 'B' some em novembro e volta igual em dezembro;
+# 'C' muda em novembro e volta ao valor de outubro em dezembro; 'D' aparece duas
+# vezes em outubro e sai em novembro
+RETRATOS = [
+    ('2022-10-01', 'A', 'a'), ('2022-11-01', 'A', 'a'), ('2022-12-01', 'A', 'a'),
+    ('2022-10-01', 'B', 'b'), ('2022-12-01', 'B', 'b'),
+    ('2022-10-01', 'C', 'x'), ('2022-11-01', 'C', 'y'), ('2022-12-01', 'C', 'x'),
+    ('2022-10-01', 'D', 'd'), ('2022-10-01', 'D', 'd'),
+]
+
+
+def retratos_mensais():
+    df = pl.DataFrame(RETRATOS, schema=['data_competencia', 'CO_UNIDADE', 'NO_FANTASIA'], orient='row')
+    return adicionar_hash_linha(df)
+
+
+def intervalos(lf):
+    return (
+        montar_intervalos_validade(lf, ['CO_UNIDADE'])
+          .collect()
+          .select('CO_UNIDADE', 'NO_FANTASIA', pl.col('valid_from').cast(pl.Utf8), pl.col('valid_to').cast(pl.Utf8))
+          .sort('CO_UNIDADE', 'valid_from')
+          .rows()
+    )
+
+
+def test_intervalos_de_validade():
+    assert intervalos(retratos_mensais().lazy()) == [
+        ('A', 'a', '2022-10-01', None),
+        ('B', 'b', '2022-10-01', '2022-11-01'),
+        ('B', 'b', '2022-12-01', None),
+        ('C', 'x', '2022-10-01', '2022-11-01'),
+        ('C', 'y', '2022-11-01', '2022-12-01'),
+        ('C', 'x', '2022-12-01', None),
+        ('D', 'd', '2022-10-01', '2022-11-01'),
+    ]
+
+
+def test_intervalos_independem_da_ordem_das_linhas():
+    esperado = intervalos(retratos_mensais().lazy())
+
+    for semente in range(5):
+        embaralhado = retratos_mensais().sample(fraction=1.0, shuffle=True, seed=semente)
+        assert intervalos(embaralhado.lazy()) == esperado
+
+
+def test_snapshot_reconstroi_cada_competencia(tmp_path):
+    retratos = retratos_mensais()
+    caminho = tmp_path / 'tbestabelecimento' / 'dados.parquet'
+    caminho.parent.mkdir()
+    montar_intervalos_validade(retratos.lazy(), ['CO_UNIDADE']).sink_parquet(caminho)
+
+    for competencia in ('2022-10-01', '2022-11-01', '2022-12-01'):
+        esperado = retratos.filter(pl.col('data_competencia') == competencia).unique().sort('CO_UNIDADE')
+        for data in (competencia, competencia[:8] + '15', date.fromisoformat(competencia)):
+            snapshot = escanear_snapshot(tmp_path, 'tbEstabelecimento', data).collect()
+            assert snapshot.select(esperado.columns).sort('CO_UNIDADE').equals(esperado)
+
+    assert escanear_snapshot(tmp_path, 'tbestabelecimento', '2022-09-30').collect().is_empty()
+    # após a última competência valem os intervalos abertos
+    posterior = escanear_snapshot(tmp_path, 'tbestabelecimento', '2023-03-01').collect()
+    assert sorted(posterior['CO_UNIDADE'].to_list()) == ['A', 'B', 'C']
+
+
+CSV_ESTABELECIMENTOS = (
+    '"CO_UNIDADE";"CO_CNES";"NO_FANTASIA";"CO_MOTIVO_DESAB";"TP_ESTAB_SEMPRE_ABERTO";"CO_ESTADO_GESTOR"\n'
+    + ''.join(
+        f'"35503020{i:05d}";"{i:07d}";"UNIDADE SÃO JOSÉ {i}";"{"01" if i % 3 == 0 else ""}";"{"S" if i % 2 else "N"}";"{35 if i % 4 else ""}"\n'
+        for i in range(1, 301)
+    )
+).encode('latin1')
+
+
+def test_escanear_csv_cnes_em_blocos(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'TAMANHO_BLOCO_CSV', 1024)
+    caminho = tmp_path / 'tbEstabelecimento202212.csv'
+    caminho.write_bytes(CSV_ESTABELECIMENTOS)
+
+    df = escanear_csv_cnes(str(caminho), 'tbestabelecimento').collect()
+
+    assert df.height == 300
+    assert df.schema['CO_CNES'] == pl.Int32
+    assert df.schema['CO_ESTADO_GESTOR'] == pl.Int8
+    assert df.schema['TP_ESTAB_SEMPRE_ABERTO'] == esquema_tabela('tbestabelecimento')['TP_ESTAB_SEMPRE_ABERTO']
+    assert df['CO_UNIDADE'][0] == '3550302000001'
+    assert df['NO_FANTASIA'][0] == 'UNIDADE SÃO JOSÉ 1'
+    # o vazio de CO_MOTIVO_DESAB identifica os ativos; nos códigos numéricos vira nulo
+    assert df['CO_MOTIVO_DESAB'].cast(pl.Utf8).value_counts().sort('CO_MOTIVO_DESAB').rows() == [('', 200), ('01', 100)]
+    assert df['CO_ESTADO_GESTOR'].null_count() == 75
+
+
+def test_escanear_csv_cnes_de_stream_com_projecao_filtro_e_limite():
+    lf = escanear_csv_cnes(io.BytesIO(CSV_ESTABELECIMENTOS), 'tbestabelecimento')
+
+    df = lf.filter(pl.col('TP_ESTAB_SEMPRE_ABERTO') == 'S').select('CO_CNES').head(5).collect()
+
+    assert df.columns == ['CO_CNES']
+    assert df['CO_CNES'].to_list() == [1, 3, 5, 7, 9]
+
+
+def test_escanear_csv_cnes_sem_tabela_le_tudo_como_texto():
+    df = escanear_csv_cnes(io.BytesIO(CSV_ESTABELECIMENTOS)).collect()
+
+    assert set(df.schema.values()) == {pl.Utf8}
+    assert df['CO_CNES'][0] == '0000001'